@@ -1,6 +1,11 @@
 import argparse
+import os
+import sys
 import requests
 import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "lastest_project"))
+import api_client
 from typing import Dict, Optional
 
 def load_prompt_template() -> str:
@@ -15,11 +20,6 @@ def load_prompt_template() -> str:
 
 def call_deepseek_api(prompt: str, api_key: str) -> Optional[Dict]:
     """调用 DeepSeek API"""
-    url = "https://ark.cn-beijing.volces.com/api/v3/chat/completions"  # 替换为火山引擎提供的API地址
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
     data = {
         "model": "deepseek-r1-250120",  # 根据实际模型名称调整
         "messages": [{"role": "user", "content": prompt}],
@@ -28,9 +28,8 @@ def call_deepseek_api(prompt: str, api_key: str) -> Optional[Dict]:
     }
 
     try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()  # 检查HTTP错误
-        return response.json()
+        # 复用分析程序的连接池会话（长连接、超时、重试）
+        return api_client.post_chat_completion(data, api_key)
     except requests.exceptions.RequestException as e:
         print(f"API请求失败: {e}")
         print(f"\n=== 调试：API请求失败 ===")  # 调试信息
@@ -0,0 +1,206 @@
+"""
+导出不同输入尺寸和量化方式的 ONNX 模型，并在验证集上比较准确率、模型大小与推理延迟。
+
+每个尺寸导出三个版本：
+  fp32         原始浮点模型
+  int8_dynamic 动态量化（只量化权重，激活在推理时量化，无需校准数据）
+  int8_static  静态量化（用 HDF5 训练集中的图像校准激活范围，QDQ 格式，按通道量化权重）
+
+模型以全局平均池化结尾，卷积权重与输入尺寸无关，224/256 版本直接复用 384 训练得到的权重
+（未在小尺寸上微调，准确率下降会体现在报告中）。
+验证集与 tensor_flow_demo_1.py 使用相同的划分（seed=42），预处理与 food_classifier.py 一致。
+
+选定版本后用 FOOD_CLASSIFIER_MODEL 指向该文件即可，分类器从模型读取输入尺寸。
+
+用法: python export_variants.py [--sizes 224 256 384] [--skip-export]
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic,
+                                      quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from h5_dataset import H5ImageReader, split_indices
+
+VARIANTS = ("fp32", "int8_dynamic", "int8_static")
+
+
+def preprocess_batch(images, size):
+    """uint8 RGB 图像 → (N, size, size, 3) float32，与 food_classifier.py 相同（0-255 原始像素，不归一化）"""
+    resized = [cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA) for image in images]
+    return np.stack(resized).astype(np.float32)
+
+
+def iterate_batches(reader, indices, batch_size):
+    for start in range(0, len(indices), batch_size):
+        yield reader.read_batch(indices[start:start + batch_size])
+
+
+class H5CalibrationReader(CalibrationDataReader):
+    """静态量化的校准数据：从训练集按批读取图像，统计各层激活的取值范围"""
+
+    def __init__(self, reader, indices, size, input_name, batch_size=8):
+        self._batches = iterate_batches(reader, indices, batch_size)
+        self.size = size
+        self.input_name = input_name
+
+    def get_next(self):
+        batch = next(self._batches, None)
+        if batch is None:
+            return None
+        return {self.input_name: preprocess_batch(batch[0], self.size)}
+
+
+def variant_path(out_dir, size, variant):
+    return os.path.join(out_dir, f"food101_{size}_{variant}.onnx")
+
+
+def export_fp32(keras_model, size, path):
+    """以新的输入尺寸重建模型（共享训练好的权重）并转换为 ONNX"""
+    import tensorflow as tf
+    import tf2onnx
+
+    inputs = tf.keras.layers.Input(shape=(size, size, 3))
+    x = inputs
+    for layer in keras_model.layers:
+        x = layer(x)
+    model = tf.keras.Model(inputs, x)
+    spec = (tf.TensorSpec((None, size, size, 3), tf.float32, name="input"),)
+    onnx_model, _ = tf2onnx.convert.from_keras(model, input_signature=spec, opset=13)
+    with open(path, "wb") as f:
+        f.write(onnx_model.SerializeToString())
+
+
+def export_variants(args, reader, calib_idx):
+    import tensorflow as tf
+
+    keras_model = tf.keras.models.load_model(args.model)
+    for size in args.sizes:
+        fp32_path = variant_path(args.out, size, "fp32")
+        print(f"🔁 导出 {size}x{size} 浮点模型...")
+        export_fp32(keras_model, size, fp32_path)
+
+        print(f"🔁 {size}x{size} 动态量化...")
+        # ConvInteger 在 CPU 上只支持 uint8 权重
+        quantize_dynamic(fp32_path, variant_path(args.out, size, "int8_dynamic"), weight_type=QuantType.QUInt8)
+
+        print(f"🔁 {size}x{size} 静态量化（校准 {len(calib_idx)} 张）...")
+        prepared_path = fp32_path.replace(".onnx", ".prep.onnx")
+        quant_pre_process(fp32_path, prepared_path)
+        calibration = H5CalibrationReader(reader, calib_idx, size, "input")
+        quantize_static(prepared_path, variant_path(args.out, size, "int8_static"), calibration,
+                        quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8, per_channel=True)
+        os.remove(prepared_path)
+
+
+def create_session(path, threads):
+    """与 food_classifier.py 相同的会话配置"""
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def evaluate(path, size, reader, val_idx, args):
+    session = create_session(path, args.threads)
+    input_name = session.get_inputs()[0].name
+
+    top1 = top5 = 0
+    sample = None
+    for images, truth in iterate_batches(reader, val_idx, args.batch_size):
+        tensor = preprocess_batch(images, size)
+        probs = session.run(None, {input_name: tensor})[0]
+        top = np.argsort(probs, axis=1)[:, ::-1][:, :5]
+        top1 += int((top[:, 0] == truth).sum())
+        top5 += int((top == truth[:, None]).any(axis=1).sum())
+        if sample is None:
+            sample = tensor[:1]
+
+    # 延迟按实际部署方式测量：单张图像、单次前向
+    for _ in range(args.warmup):
+        session.run(None, {input_name: sample})
+    latencies = []
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        session.run(None, {input_name: sample})
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    return {
+        "size": size,
+        "path": path,
+        "size_kb": round(os.path.getsize(path) / 1024, 1),
+        "top1": round(top1 / len(val_idx), 4),
+        "top5": round(top5 / len(val_idx), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2)
+    }
+
+
+def print_report(results):
+    print("==========================================================================")
+    print(f"{'模型':<34}{'大小(KB)':>10}{'top-1':>8}{'top-5':>8}{'p50(ms)':>10}{'p99(ms)':>10}")
+    for r in results:
+        print(f"{os.path.basename(r['path']):<34}{r['size_kb']:>10.1f}{r['top1']:>8.3f}{r['top5']:>8.3f}"
+              f"{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}")
+    print("==========================================================================")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="导出量化/低分辨率 ONNX 模型并生成对比报告")
+    parser.add_argument("--h5", default="food_c101_n1000_r384x384x3.h5", help="HDF5 数据文件")
+    parser.add_argument("--model", default="food101_model.h5", help="训练好的 Keras 模型")
+    parser.add_argument("--out", default="variants", help="输出目录")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[224, 256, 384], help="输入尺寸")
+    parser.add_argument("--calib-samples", type=int, default=200, help="静态量化使用的校准图像数")
+    parser.add_argument("--eval-samples", type=int, default=0, help="评估图像数，0 为整个验证集")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=2, help="推理线程数（与开发板上分析进程一致）")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=200, help="测量延迟的推理次数")
+    parser.add_argument("--skip-export", action="store_true", help="只评估已导出的模型")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.makedirs(args.out, exist_ok=True)
+    reader = H5ImageReader(args.h5)
+    train_idx, val_idx = split_indices(len(reader), val_fraction=0.2, seed=42)
+    calib_idx = np.sort(np.random.RandomState(0).permutation(train_idx)[:args.calib_samples])
+    if args.eval_samples:
+        val_idx = val_idx[:args.eval_samples]
+
+    if not args.skip_export:
+        export_variants(args, reader, calib_idx)
+
+    print(f"📊 评估 {len(val_idx)} 张验证图像，延迟测量 {args.runs} 次（{args.threads} 线程）...")
+    results = []
+    for size in args.sizes:
+        for variant in VARIANTS:
+            path = variant_path(args.out, size, variant)
+            if not os.path.exists(path):
+                print(f"⚠️ 缺少 {path}，跳过")
+                continue
+            result = evaluate(path, size, reader, val_idx, args)
+            result["variant"] = variant
+            results.append(result)
+    reader.close()
+
+    print_report(results)
+    report_path = os.path.join(args.out, "report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"✅ 报告已保存: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
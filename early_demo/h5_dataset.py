@@ -0,0 +1,83 @@
+import h5py
+import numpy as np
+import tensorflow as tf
+
+# HDF5 块缓存大小，同一批中落在同一数据块的图像只解压一次
+CHUNK_CACHE_BYTES = 64 * 1024 * 1024
+# 读取 one-hot 标签时每次处理的行数
+LABEL_READ_ROWS = 10000
+
+
+class H5ImageReader:
+    """
+    按索引从 HDF5 文件批量读取图像和类别下标。
+
+    文件只打开一次，图像始终留在磁盘上按批读取；
+    one-hot 标签在打开时分块转换为 int32 类别下标常驻内存（完整 Food-101 约 0.4 MB，
+    float32 one-hot 则约 40 MB），one-hot 编码在输入管道中按批生成。
+    """
+
+    def __init__(self, path, image_key='images', label_key='category'):
+        self.path = path
+        self._file = h5py.File(path, 'r', rdcc_nbytes=CHUNK_CACHE_BYTES)
+        self.images = self._file[image_key]
+        one_hot = self._file[label_key]
+        self.num_classes = one_hot.shape[1]
+        self.labels = np.concatenate([np.argmax(one_hot[start:start + LABEL_READ_ROWS], axis=1)
+                                      for start in range(0, len(one_hot), LABEL_READ_ROWS)]).astype(np.int32)
+        if len(self.labels) != len(self.images):
+            raise ValueError(f"图像数 {len(self.images)} 与标签数 {len(self.labels)} 不一致")
+
+    def __len__(self):
+        return len(self.images)
+
+    @property
+    def image_shape(self):
+        return tuple(self.images.shape[1:])
+
+    def read_batch(self, indices):
+        """读取一批图像（原始数据类型）及对应的类别下标"""
+        # h5py 的索引读取要求下标递增；标签用同一顺序，批内顺序变化不影响训练
+        order = np.sort(indices)
+        return self.images[order], self.labels[order]
+
+    def close(self):
+        self._file.close()
+
+
+def split_indices(count, val_fraction=0.2, seed=42):
+    """按下标随机划分训练集/验证集，只生成下标数组，不复制任何图像"""
+    order = np.random.RandomState(seed).permutation(count)
+    val_count = int(round(count * val_fraction))
+    return np.sort(order[val_count:]), np.sort(order[:val_count])
+
+
+def make_dataset(reader, indices, batch_size=16, shuffle=False, seed=None):
+    """
+    构建按批读取 HDF5 的 tf.data 输入管道。
+
+    只有下标经过 shuffle（每轮重新打乱），图像按批从文件读取，
+    读取与类型转换用并行 map，prefetch 让下一批的读取与当前批的训练重叠。
+    """
+    dataset = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+    if shuffle:
+        dataset = dataset.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+
+    image_dtype = tf.as_dtype(reader.images.dtype)
+
+    def load(batch_indices):
+        images, labels = tf.numpy_function(reader.read_batch, [batch_indices], [image_dtype, tf.int32])
+        images.set_shape((None,) + reader.image_shape)
+        labels.set_shape((None,))
+        return images, labels
+
+    def to_float(images, labels):
+        # 逐批转换为 float32，内存中只存在正在使用的几批；
+        # 与已发布的模型一致使用 0-255 原始像素，不做归一化（food_classifier.py 的推理预处理依赖这一点）；
+        # 标签按批展开为 one-hot，与 categorical_crossentropy 对应
+        return tf.cast(images, tf.float32), tf.one_hot(labels, reader.num_classes)
+
+    dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.map(to_float, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
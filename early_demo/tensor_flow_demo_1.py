@@ -1,34 +1,27 @@
-import h5py
-import numpy as np
 import tensorflow as tf
 from tensorflow.keras import layers, models
 import tf2onnx
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
-from tensorflow.keras.utils import to_categorical
 
-# === 1. 读取 .h5 数据文件 ===
-print("📂 加载 HDF5 文件...")
-h5_file = 'food_c101_n1000_r384x384x3.h5'
-with h5py.File(h5_file, 'r') as f:
-    X = np.array(f['images'])     # shape: (1000, 384, 384, 3)
-    y = np.array(f['category_names'])  # shape: (1000,)
-
-print(f"✅ 加载成功: 图像 {X.shape}, 标签 {y.shape}, 类别数: {len(np.unique(y))}")
+from h5_dataset import H5ImageReader, make_dataset, split_indices
 
-# === 2. 标签编码与划分数据集 ===
-X = X.astype("float32") / 255.0  # 归一化
+# === 1. 打开 .h5 数据文件（图像按批从磁盘读取，不整体载入内存） ===
+print("📂 打开 HDF5 文件...")
+h5_file = 'food_c101_n1000_r384x384x3.h5'
+batch_size = 16
+reader = H5ImageReader(h5_file)   # images: (N, 384, 384, 3), category: (N, 101) one-hot
 
-with h5py.File(h5_file, 'r') as f:
-    X = np.array(f['images'])     # (1000, 384, 384, 3)
-    y = np.array(f['category'])   # (1000, 101) 直接是 one-hot 格式
+print(f"✅ 打开成功: 图像 {len(reader)} 张 {reader.image_shape}, 类别数: {reader.num_classes}")
 
-X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+# === 2. 按下标划分数据集，构建输入管道 ===
+train_idx, val_idx = split_indices(len(reader), val_fraction=0.2, seed=42)
+train_ds = make_dataset(reader, train_idx, batch_size=batch_size, shuffle=True, seed=42)
+val_ds = make_dataset(reader, val_idx, batch_size=batch_size)
+print(f"✅ 训练集 {len(train_idx)} 张, 验证集 {len(val_idx)} 张")
 
 # === 3. 构建模型 ===
 print("🧠 构建模型中...")
 model = models.Sequential([
-    layers.Input(shape=(384, 384, 3)),
+    layers.Input(shape=reader.image_shape),
     layers.Conv2D(32, (3, 3), activation='relu'),
     layers.MaxPooling2D((2, 2)),
     layers.Conv2D(64, (3, 3), activation='relu'),
@@ -37,7 +30,7 @@ model = models.Sequential([
     layers.GlobalAveragePooling2D(),
     layers.Dense(256, activation='relu'),
     layers.Dropout(0.5),
-    layers.Dense(101, activation='softmax')  # 101 类
+    layers.Dense(reader.num_classes, activation='softmax')  # 101 类
 ])
 
 model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
@@ -45,7 +38,8 @@ model.summary()
 
 # === 4. 模型训练 ===
 print("🚀 模型训练中...")
-model.fit(X_train, y_train, epochs=10, batch_size=16, validation_data=(X_val, y_val))
+model.fit(train_ds, epochs=10, validation_data=val_ds)
+reader.close()
 
 # === 5. 保存模型 (.h5) ===
 h5_path = "food101_model.h5"
@@ -0,0 +1,257 @@
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import api_client
+import camera_capture
+import food_nutrition_analyzer as analyzer
+import launcher
+from metrics import Trace, registry
+from history_store import HistoryStore
+from result_cache import ResultCache
+from scale_client import ScaleClient, start_daemon
+from stations import Acquisition
+from telemetry import sampler
+
+# 称重程序可执行文件
+WEIGHT_SENSOR_BINARY = launcher.WEIGHT_SENSOR_BINARY
+# 是否使用常驻称重程序（持续滤波、稳定检测）；设置 FOOD_SCALE_DAEMON=0 恢复每次启动称重程序
+SCALE_DAEMON_ENABLED = os.environ.get("FOOD_SCALE_DAEMON", "1") != "0"
+
+
+class AnalysisError(RuntimeError):
+    """分析流程中某个阶段失败"""
+
+
+class AnalysisWorker:
+    """
+    常驻分析工作器。
+
+    由 Flask 进程持有，保持摄像头、提示词模板和HTTP会话常驻，
+    以函数调用的方式依次执行 拍照 → 称重 → 分析 三个阶段，
+    避免每次分析都重新启动 bash、gcc 和 Python 解释器。
+    """
+
+    def __init__(self, data_dir: str = "data", weight_timeout: float = 30,
+                 camera: Optional[camera_capture.CameraService] = None,
+                 weight_command: Optional[List[str]] = None, local_devices: bool = True):
+        """
+        :param camera: 常驻摄像头服务，默认打开 V4L2 设备
+        :param weight_command: 称重命令，需把重量写入 weight_data.txt；默认为编译出的称重程序
+        :param local_devices: 为False时不打开本机摄像头和秤，图像和重量由工位进程采集后传入 run()
+        """
+        self.data_dir = data_dir
+        self.weight_timeout = weight_timeout
+        self.template: Optional[str] = None
+        self.camera = camera or camera_capture.CameraService()
+        self.weight_command = weight_command
+        self.local_devices = local_devices
+        self.scale: Optional[ScaleClient] = None
+        self._scale_process = None
+        self._start_lock = threading.Lock()
+        self._capture_lock = threading.Lock()
+        self._weigh_lock = threading.Lock()
+        self.cache: Optional[ResultCache] = None
+        self.history: Optional[HistoryStore] = None
+        self.classifier = None
+        self._stage_pool = ThreadPoolExecutor(max_workers=2)
+
+    def start(self):
+        """预热：加载模板、编译称重程序、打开摄像头、建立HTTP会话"""
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.template = analyzer.load_prompt_template()
+        if self.history is None:
+            self.history = HistoryStore(os.path.join(self.data_dir, "history.sqlite3"))
+        if analyzer.RESULT_CACHE_ENABLED and self.cache is None:
+            self.cache = ResultCache(os.path.join(self.data_dir, "result_cache.sqlite3"))
+        if analyzer.CLASSIFIER_ENABLED and analyzer.get_food_classifier and self.classifier is None:
+            self.classifier = analyzer.get_food_classifier()
+        if self.local_devices:
+            if self.weight_command is None:
+                self.build_weight_sensor()
+                if SCALE_DAEMON_ENABLED and self.scale is None:
+                    self.scale = self._start_scale()
+            if not self.camera.start():
+                print("警告：常驻摄像头启动失败，将在每次拍摄时临时打开")
+        api_client.prewarm()
+
+    def close(self):
+        """释放摄像头、称重程序和线程池"""
+        self.camera.stop()
+        if self.scale is not None:
+            self.scale.close()
+        if self._scale_process is not None:
+            self._scale_process.terminate()
+            self._scale_process.wait()
+        self._stage_pool.shutdown(wait=False)
+
+    def build_weight_sensor(self):
+        """仅在称重程序源码哈希变化或可执行文件缺失时编译"""
+        try:
+            launcher.build_weight_sensor()
+        except launcher.BuildError as e:
+            raise AnalysisError(str(e))
+
+    def _start_scale(self) -> Optional[ScaleClient]:
+        """连接常驻称重程序，未运行时启动它；不可用时返回None，退回单次称重"""
+        client = ScaleClient()
+        if not client.start():
+            self._scale_process = start_daemon([WEIGHT_SENSOR_BINARY])
+            if self._scale_process is None or not client.start():
+                print("警告：常驻称重程序不可用，将在每次分析时单独称重")
+                return None
+        print(f"已连接常驻称重程序: {client.path}")
+        return client
+
+    def capture(self) -> Tuple[bytes, float]:
+        """拍照阶段：从常驻摄像头的环形缓冲区取帧，返回 (JPEG数据, 拍摄时间戳)"""
+        if self.camera.start():
+            # 进程内直接使用帧数据，不经共享内存，多个任务并发拍摄也不会互相覆盖
+            try:
+                frame = self.camera.best_frame()
+            except camera_capture.FrameQualityError as e:
+                registry.increment("captures", "rejected")
+                raise AnalysisError(str(e))
+            registry.increment("captures", "accepted")
+            if frame is None:
+                raise AnalysisError("未能获取图像数据")
+            return frame.jpeg, frame.timestamp
+
+        # 常驻摄像头不可用时退回一次性拍摄；设备只有一个，串行执行
+        with self._capture_lock:
+            capture_status = camera_capture.capture_photo()
+            image = analyzer.load_captured_image(capture_status) if capture_status else None
+        if image is None:
+            raise AnalysisError("未能获取图像数据")
+        return image, capture_status["timestamp"]
+
+    def weigh(self) -> float:
+        """称重阶段：优先取常驻称重程序的稳定读数，否则运行称重程序（只有一台秤，串行执行）"""
+        if self.scale is not None and self.scale.connected:
+            reading = self.scale.wait_for_settled(self.weight_timeout)
+            if reading is None:
+                raise AnalysisError("秤上没有物体或读数一直不稳定")
+            return round(reading.weight, 2)
+        with self._weigh_lock:
+            return self._weigh_once()
+
+    def _weigh_once(self) -> float:
+        if os.path.exists(analyzer.WEIGHT_DATA_FILE):
+            os.remove(analyzer.WEIGHT_DATA_FILE)
+        process = subprocess.Popen(
+            self.weight_command or [WEIGHT_SENSOR_BINARY],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        sampler.register_process("weight_sensor", process.pid)
+        try:
+            _, stderr = process.communicate(timeout=self.weight_timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise AnalysisError("称重程序超时")
+        finally:
+            sampler.unregister("weight_sensor")
+        if process.returncode != 0:
+            raise AnalysisError(f"称重程序执行失败: {stderr}")
+        weight_grams = analyzer.read_weight_data()
+        if weight_grams is None:
+            raise AnalysisError("未能获取重量数据")
+        return weight_grams
+
+    def run(self, job_id: Optional[str] = None,
+            progress: Optional[Callable[[str, Dict], None]] = None,
+            acquisition: Optional[Acquisition] = None) -> Dict:
+        """
+        执行一次完整分析，返回结果并写入 data/nutrition_result.json。
+
+        可由多个任务线程并发调用：拍照和称重按设备串行，API分析阶段并行。
+        :param job_id: 任务ID，提供时结果另存为 data/results/<job_id>.json
+        :param progress: 阶段进度回调 progress(阶段名, 附加数据)，用于向前端推送进度
+        :param acquisition: 工位进程已采集的图像和重量，提供时跳过拍照和称重
+        """
+        def report(stage: str, **detail):
+            if progress is not None:
+                try:
+                    progress(stage, detail)
+                except Exception as e:
+                    print(f"进度回调异常: {e}")
+
+        with self._start_lock:
+            if self.template is None:
+                self.start()
+
+        trace = Trace(job_id)
+        try:
+            output, timestamp = self._run_stages(trace, report, acquisition)
+        except Exception:
+            registry.increment("runs", "error")
+            self._save_trace(trace, job_id)
+            raise
+        registry.increment("runs", "completed")
+        registry.observe("total", trace.to_dict()["elapsed"])
+
+        if job_id:
+            output["job_id"] = job_id
+            analyzer.save_nutrition_output(output, self._result_path(job_id))
+        analyzer.save_nutrition_output(output, os.path.join(self.data_dir, "nutrition_result.json"))
+        self.history.add(output, ts=timestamp)
+        trace_path = self._save_trace(trace, job_id)
+        elapsed = trace.to_dict()["elapsed"]
+        report("done", elapsed=round(elapsed, 3))
+        print(f"分析完成，耗时 {elapsed:.2f} 秒，阶段耗时见 {trace_path}")
+        return output
+
+    def _run_stages(self, trace: Trace, report,
+                    acquisition: Optional[Acquisition] = None) -> Tuple[Dict, float]:
+        if acquisition is not None:
+            # 工位进程中的拍照和称重耗时（单调时钟在进程间通用）计入本次记录
+            for name, start, end in acquisition.spans:
+                trace.record(name, start, end)
+            image, timestamp, weight_grams = acquisition.jpeg, acquisition.timestamp, acquisition.weight
+        elif self.scale is not None and self.scale.connected:
+            # 常驻称重：等读数稳定（物体已放好时立即返回），在稳定的时刻拍照，画面中不会有手
+            report("settle")
+            weight_grams = self._timed(trace, "weigh", self.weigh)
+            report("snapshot", weight=weight_grams)
+            image, timestamp = self._timed(trace, "capture", self.capture)
+        else:
+            report("capture")
+            # 拍照与称重互不依赖，并行执行；各自在线程池中计时
+            capture_future = self._stage_pool.submit(self._timed, trace, "capture", self.capture)
+            weigh_future = self._stage_pool.submit(self._timed, trace, "weigh", self.weigh)
+            image, timestamp = capture_future.result()
+            report("weigh", image_bytes=len(image))
+            weight_grams = weigh_future.result()
+        report("analyze", weight=weight_grams)
+
+        output = analyzer.analyze_food(image, weight_grams, self.template,
+                                       food_name=f"food_{int(timestamp)}",
+                                       cache=self.cache, classifier=self.classifier, trace=trace,
+                                       on_partial=lambda fields: report("partial", fields=fields))
+        if not output:
+            raise AnalysisError("API分析失败")
+        output["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+        if acquisition is not None:
+            output["station"] = acquisition.station
+        return output, timestamp
+
+    @staticmethod
+    def _timed(trace: Trace, name: str, func):
+        with trace.span(name):
+            return func()
+
+    def _result_path(self, job_id: str) -> str:
+        results_dir = os.path.join(self.data_dir, "results")
+        os.makedirs(results_dir, exist_ok=True)
+        return os.path.join(results_dir, f"{job_id}.json")
+
+    def _save_trace(self, trace: Trace, job_id: Optional[str]) -> str:
+        """阶段耗时保存在结果文件旁边：data/results/<job_id>.trace.json"""
+        if job_id:
+            return analyzer.save_trace(trace, self._result_path(job_id))
+        return analyzer.save_trace(trace, os.path.join(self.data_dir, "nutrition_result.json"))
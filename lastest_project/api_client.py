@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+from typing import Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 火山引擎 Ark 接口地址（可通过环境变量指向本地替身服务）
+API_BASE_URL = os.environ.get("FOOD_API_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3")
+CHAT_COMPLETIONS_URL = f"{API_BASE_URL}/chat/completions"
+
+# 连接超时与读取超时（秒）：视觉模型生成较慢，读取超时需留足余量
+CONNECT_TIMEOUT = float(os.environ.get("FOOD_API_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("FOOD_API_READ_TIMEOUT", "90"))
+
+# 对 429/5xx 和连接失败做有限次数的指数退避重试
+MAX_RETRIES = int(os.environ.get("FOOD_API_MAX_RETRIES", "3"))
+BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+POOL_SIZE = 4
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def create_session() -> requests.Session:
+    """创建带连接池、长连接和重试策略的会话"""
+    retry = Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        # 读取超时不重试：请求可能已被服务端处理，重发会重复计费并加倍等待
+        read=0,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset({"GET", "HEAD", "POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+def get_session() -> requests.Session:
+    """获取进程内共享的会话（分析程序、常驻工作器和演示脚本共用）"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def prewarm(url: str = API_BASE_URL) -> bool:
+    """
+    预热连接：提前完成 TCP 和 TLS 握手并放入连接池。
+
+    返回的状态码无关紧要，只要连接建立成功即可。
+    """
+    try:
+        get_session().head(url, timeout=(CONNECT_TIMEOUT, CONNECT_TIMEOUT))
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"API连接预热失败: {e}")
+        return False
+
+
+def post_chat_completion(payload: Dict, api_key: str, url: str = CHAT_COMPLETIONS_URL,
+                         timeout: Optional[tuple] = None) -> Dict:
+    """
+    调用 chat/completions 接口并返回解析后的JSON。
+
+    网络错误和重试耗尽后的 HTTP 错误以 requests 异常抛出，由调用方处理。
+    """
+    response = get_session().post(
+        url,
+        headers=_headers(api_key),
+        json=payload,
+        timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def stream_chat_completion(payload: Dict, api_key: str, url: str = CHAT_COMPLETIONS_URL,
+                           timeout: Optional[tuple] = None) -> Iterator[str]:
+    """
+    以 stream 模式调用 chat/completions，逐段返回模型生成的文本。
+
+    服务端以 SSE 格式推送 chunk，每个 chunk 的 choices[0].delta.content 是新生成的一段；
+    读取超时作用于相邻两个 chunk 之间，而不是整个回复。
+    服务端不支持流式、直接返回完整JSON时，一次性返回全部内容。
+    """
+    response = get_session().post(
+        url,
+        headers=_headers(api_key),
+        json={**payload, "stream": True},
+        timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT),
+        stream=True
+    )
+    with response:
+        response.raise_for_status()
+        if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+            yield response.json()["choices"][0]["message"]["content"]
+            return
+        for line in response.iter_lines():
+            if not line.startswith(b"data:"):
+                continue  # 空行、注释和 event 行
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                # 不提前退出：读完响应体，连接才能放回连接池复用
+                continue
+            chunk = json.loads(data)
+            for choice in chunk.get("choices", []):
+                content = (choice.get("delta") or {}).get("content")
+                if content:
+                    yield content
+
+
+def _headers(api_key: str) -> Dict[str, str]:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
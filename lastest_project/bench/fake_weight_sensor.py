@@ -0,0 +1,40 @@
+"""
+模拟称重程序：替代 weight_sensor，在设定的采样耗时后把重量原子写入 weight_data.txt。
+
+用法: python fake_weight_sensor.py [--delay 秒] [--grams 克] [--jitter 克] [--fail-rate 比例]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+WEIGHT_DATA_FILE = "weight_data.txt"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟HX711称重程序")
+    parser.add_argument("--delay", type=float, default=1.0, help="模拟采样耗时（秒），真实程序约为10次采样")
+    parser.add_argument("--grams", type=float, default=180.0, help="重量均值（克）")
+    parser.add_argument("--jitter", type=float, default=2.0, help="重量的随机波动（克）")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="模拟称重失败的比例")
+    args = parser.parse_args()
+
+    time.sleep(args.delay)
+    if random.random() < args.fail_rate:
+        print("模拟称重失败", file=sys.stderr)
+        sys.exit(1)
+
+    weight = args.grams + random.uniform(-args.jitter, args.jitter)
+    # 与 hx711_weight.c 相同：先写临时文件再 rename
+    tmp_path = WEIGHT_DATA_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(f"{weight:.2f}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, WEIGHT_DATA_FILE)
+    print(f"重量: {weight:.2f} 克")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+基准测试用的模拟硬件：不需要 V4L2 摄像头和 HX711 即可跑完整条分析流水线。
+"""
+import time
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+
+def synthetic_jpegs(count: int = 8, width: int = 1280, height: int = 720, quality: int = 90,
+                    seed: int = 0) -> List[bytes]:
+    """
+    生成若干张与摄像头输出尺寸相同的 JPEG 图像。
+
+    画面为带噪声的盘子和食物色块，压缩后的大小接近真实照片，
+    上传前的缩放压缩和清晰度评分都有真实的计算量。
+    """
+    rng = np.random.default_rng(seed)
+    # 同一场景的连续帧：盘子和食物位置固定，每帧只有传感器噪声和几个像素的抖动，与静止的秤上画面一致
+    scene = rng.integers(90, 160, (height, width, 3), dtype=np.uint8)
+    center = (width // 2 + int(rng.integers(-40, 40)), height // 2 + int(rng.integers(-30, 30)))
+    cv2.circle(scene, center, height // 3, (235, 235, 235), -1)
+    for _ in range(12):
+        color = tuple(int(c) for c in rng.integers(20, 230, 3))
+        point = (center[0] + int(rng.integers(-150, 150)), center[1] + int(rng.integers(-100, 100)))
+        cv2.ellipse(scene, point, (int(rng.integers(20, 70)), int(rng.integers(15, 50))),
+                    float(rng.integers(0, 180)), 0, 360, color, -1)
+    frames = []
+    for i in range(count):
+        shift = (int(rng.integers(-2, 3)), int(rng.integers(-2, 3)))
+        image = np.roll(scene, shift, axis=(0, 1))
+        noise = rng.normal(0, 6, image.shape)
+        image = np.clip(image + noise, 0, 255).astype(np.uint8)
+        if i % 3 == 2:
+            # 每三帧有一帧运动模糊，供最清晰帧选择
+            image = cv2.blur(image, (9, 1))
+        ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ok:
+            frames.append(buf.tobytes())
+    return frames
+
+
+class FakeCamera:
+    """
+    模拟 MJPEG 直通模式下的 cv2.VideoCapture。
+
+    read() 按设定帧率节拍返回一维压缩数据（与 CONVERT_RGB=0 时相同），
+    可直接传给 capture_photo(cap=...) 或作为 CameraService 的摄像头。
+    """
+
+    def __init__(self, fps: float = 30.0, frames: Optional[List[bytes]] = None,
+                 open_delay: float = 0.0):
+        self.fps = fps
+        self.frames = frames or synthetic_jpegs()
+        self._index = 0
+        self._next_time = time.monotonic()
+        self._opened = True
+        if open_delay:
+            # 模拟打开设备和等待自动曝光的耗时
+            time.sleep(open_delay)
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def set(self, prop, value) -> bool:
+        return True
+
+    def get(self, prop) -> float:
+        return 0.0
+
+    def grab(self) -> bool:
+        return self.read()[0]
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        # 按帧率等待下一帧到达
+        delay = self._next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_time = max(self._next_time, time.monotonic()) + 1.0 / self.fps
+        data = self.frames[self._index % len(self.frames)]
+        self._index += 1
+        return True, np.frombuffer(data, np.uint8)
+
+    def release(self):
+        self._opened = False
+
+
+def fake_camera_opener(fps: float = 30.0, open_delay: float = 0.0):
+    """返回供 CameraService(opener=...) 使用的函数，所有打开的模拟摄像头共用同一组帧"""
+    frames = synthetic_jpegs()
+
+    def opener():
+        return FakeCamera(fps=fps, frames=frames, open_delay=open_delay)
+
+    return opener
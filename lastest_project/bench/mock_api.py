@@ -0,0 +1,189 @@
+"""
+本地 chat/completions 替身服务，模拟视觉模型接口的延迟和失败。
+
+单独运行: python mock_api.py --port 8090 --latency 1.5 --failure-rate 0.05
+然后设置 FOOD_API_BASE_URL=http://127.0.0.1:8090/api/v3 再启动服务器或分析程序。
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+# 替身服务返回的营养数据（固定值，与请求内容无关）
+SAMPLE_NUTRITION = {
+    "food": "番茄炒蛋",
+    "calories": "180 千卡",
+    "carbohydrates": "8 克",
+    "protein": "11 克",
+    "fat": "12 克",
+    "advice": "蛋白质含量适中，搭配主食和绿叶蔬菜更均衡。"
+}
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持长连接，与真实接口一致
+
+    def log_message(self, format, *args):
+        pass  # 基准测试时不打印访问日志
+
+    def do_HEAD(self):
+        # 连接预热使用 HEAD 请求
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        config = self.server.config
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.bytes_received += len(body)
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        try:
+            stream = bool(json.loads(body).get("stream"))
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json"}})
+            return
+
+        latency = max(0.0, random.gauss(config.latency, config.jitter))
+        # 流式模式下延迟分为首个 token 之前的等待和逐段生成两部分
+        first_token = latency * config.first_token_ratio if stream else latency
+        time.sleep(first_token)
+
+        if random.random() < config.failure_rate:
+            with self.server.lock:
+                self.server.failures += 1
+            self._send_json(config.failure_status, {"error": {"message": "mock failure"}})
+            return
+
+        content = json.dumps(SAMPLE_NUTRITION, ensure_ascii=False)
+        if stream:
+            self._send_stream(content, latency - first_token)
+            return
+        self._send_json(200, {
+            "id": f"mock-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(body) // 4, "completion_tokens": len(content)}
+        })
+
+    def _send_stream(self, content: str, duration: float):
+        """以 SSE 分段推送回复，duration 秒内均匀生成完毕"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        size = self.server.config.chunk_chars
+        pieces = [content[i:i + size] for i in range(0, len(content), size)]
+        for piece in pieces:
+            chunk = {"object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            time.sleep(duration / len(pieces))
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, data):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class MockApiConfig:
+    """可在运行中修改的替身服务参数"""
+
+    def __init__(self, latency: float = 1.5, jitter: float = 0.2, failure_rate: float = 0.0,
+                 failure_status: int = 503, first_token_ratio: float = 0.3, chunk_chars: int = 4):
+        """
+        :param latency: 完整回复的平均耗时（秒）
+        :param first_token_ratio: 流式模式下首个 token 出现前的等待占 latency 的比例
+        :param chunk_chars: 流式模式下每个 chunk 的字符数
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.first_token_ratio = first_token_ratio
+        self.chunk_chars = chunk_chars
+
+
+class MockApiServer:
+    """在后台线程中运行的替身服务"""
+
+    def __init__(self, config: Optional[MockApiConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), MockApiHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = config or MockApiConfig()
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = 0
+        self.httpd.failures = 0
+        self.httpd.bytes_received = 0
+        self._thread = None
+
+    @property
+    def config(self) -> MockApiConfig:
+        return self.httpd.config
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v3"
+
+    def stats(self):
+        with self.httpd.lock:
+            return {"requests": self.httpd.requests, "failures": self.httpd.failures,
+                    "bytes_received": self.httpd.bytes_received}
+
+    def start(self) -> "MockApiServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="chat/completions 替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=1.5, help="平均响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟的标准差（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="返回错误状态码的比例")
+    parser.add_argument("--failure-status", type=int, default=503)
+    parser.add_argument("--first-token-ratio", type=float, default=0.3,
+                        help="流式模式下首个 token 之前的等待占总延迟的比例")
+    args = parser.parse_args()
+
+    config = MockApiConfig(args.latency, args.jitter, args.failure_rate, args.failure_status,
+                           args.first_token_ratio)
+    server = MockApiServer(config, args.host, args.port)
+    print(f"替身服务已启动: FOOD_API_BASE_URL={server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+分析流水线端到端基准测试。
+
+使用模拟摄像头、模拟称重程序和本地替身API运行真实的 AnalysisWorker 与 JobQueue，
+统计各阶段耗时的 p50/p95/p99 和吞吐量，便于在 x86 CI 和飞腾派上对比改动前后的表现。
+
+场景:
+    single     逐个执行，测量无竞争时各阶段的耗时
+    burst      同时提交一批任务，测量排队和并发下的总耗时
+    sustained  按固定速率持续提交任务，测量稳定负载下的吞吐和背压
+
+用法（在 lastest_project 目录下）:
+    python bench/run_bench.py --scenario all
+    python bench/run_bench.py --scenario sustained --rate 0.5 --duration 60 --json bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fakes import fake_camera_opener
+from mock_api import MockApiConfig, MockApiServer
+
+SCENARIOS = ("single", "burst", "sustained")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="食物营养分析流水线基准测试")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--runs", type=int, default=5, help="single 场景的执行次数")
+    parser.add_argument("--burst", type=int, default=8, help="burst 场景一次提交的任务数")
+    parser.add_argument("--rate", type=float, default=0.5, help="sustained 场景每秒提交的任务数")
+    parser.add_argument("--duration", type=float, default=30, help="sustained 场景的持续时间（秒）")
+    parser.add_argument("--workers", type=int, default=2, help="任务队列的工作线程数")
+    parser.add_argument("--queue-size", type=int, default=8, help="任务队列的排队上限")
+    parser.add_argument("--api-latency", type=float, default=1.5, help="替身API的平均延迟（秒）")
+    parser.add_argument("--api-jitter", type=float, default=0.2, help="替身API延迟的标准差（秒）")
+    parser.add_argument("--api-failure-rate", type=float, default=0.0, help="替身API返回503的比例")
+    parser.add_argument("--weigh-delay", type=float, default=1.0, help="模拟称重耗时（秒）")
+    parser.add_argument("--camera-fps", type=float, default=30.0, help="模拟摄像头帧率")
+    parser.add_argument("--classifier", action="store_true", help="启用本地分类器")
+    parser.add_argument("--cache", action="store_true", help="启用结果缓存（默认关闭，保证每次都调用API）")
+    parser.add_argument("--json", help="把结果另存为JSON文件，便于比较")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录")
+    return parser.parse_args()
+
+
+def print_report(name: str, report: dict):
+    print(f"\n=== 场景: {name} ===")
+    print(f"{'阶段':<16}{'次数':>6}{'失败':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for stage, stats in report["stages"].items():
+        values = [stats[key] for key in ("p50", "p95", "p99")]
+        cells = "".join(f"{value * 1000:>10.1f}" if stats["count"] else f"{'-':>10}" for value in values)
+        print(f"{stage:<16}{stats['count']:>6}{stats['errors']:>6}{cells}")
+    print(f"完成 {report['completed']}，失败 {report['errors']}，拒绝 {report['rejected']}，"
+          f"耗时 {report['wall']:.2f} 秒，吞吐 {report['throughput']:.3f} 次/秒")
+    api = report["api"]
+    print(f"替身API: 请求 {api['requests']} 次，失败 {api['failures']} 次，"
+          f"平均请求体 {api['bytes_received'] // max(api['requests'], 1)} 字节")
+
+
+class Bench:
+    """在临时工作目录中搭建完整流水线并执行各场景"""
+
+    def __init__(self, args):
+        self.args = args
+        self.api = MockApiServer(MockApiConfig(args.api_latency, args.api_jitter,
+                                               args.api_failure_rate)).start()
+        # 模块常量在导入时读取环境变量，必须先设置再导入流水线模块
+        os.environ["FOOD_API_BASE_URL"] = self.api.base_url
+        os.environ["FOOD_RESULT_CACHE"] = "1" if args.cache else "0"
+        os.environ["FOOD_CLASSIFIER"] = "1" if args.classifier else "0"
+
+        self.workdir = tempfile.mkdtemp(prefix="food_bench_")
+        shutil.copy(os.path.join(PROJECT_DIR, "prompt_template.txt"), self.workdir)
+        os.chdir(self.workdir)
+
+        import camera_capture
+        from analysis_worker import AnalysisWorker
+        from job_queue import JobQueue, QueueFullError
+        from metrics import registry
+
+        self.JobQueue = JobQueue
+        self.QueueFullError = QueueFullError
+        self.registry = registry
+        camera = camera_capture.CameraService(opener=fake_camera_opener(args.camera_fps))
+        weight_command = [sys.executable, os.path.join(BENCH_DIR, "fake_weight_sensor.py"),
+                          "--delay", str(args.weigh_delay)]
+        self.worker = AnalysisWorker(os.path.join(self.workdir, "data"), camera=camera,
+                                     weight_command=weight_command)
+        print(f"工作目录: {self.workdir}")
+        print(f"替身API: {self.api.base_url}")
+        self.worker.start()
+
+    def close(self):
+        self.worker.close()
+        self.api.stop()
+        os.chdir(PROJECT_DIR)
+        if not self.args.keep:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _report(self, completed: int, errors: int, rejected: int, wall: float, api_before: dict) -> dict:
+        api_after = self.api.stats()
+        return {
+            "completed": completed,
+            "errors": errors,
+            "rejected": rejected,
+            "wall": wall,
+            "throughput": completed / wall if wall > 0 else 0.0,
+            "stages": self.registry.snapshot(),
+            "api": {key: api_after[key] - api_before[key] for key in api_after}
+        }
+
+    def run_single(self) -> dict:
+        self.registry.reset()
+        api_before = self.api.stats()
+        completed = errors = 0
+        start = time.monotonic()
+        for i in range(self.args.runs):
+            try:
+                self.worker.run(f"single-{i}")
+                completed += 1
+            except Exception as e:
+                print(f"第 {i + 1} 次分析失败: {e}")
+                errors += 1
+        return self._report(completed, errors, 0, time.monotonic() - start, api_before)
+
+    def run_queued(self, arrivals) -> dict:
+        """按给定的提交时刻（相对开始的秒数）经任务队列提交任务，等待全部结束"""
+        self.registry.reset()
+        api_before = self.api.stats()
+        cond = threading.Condition()
+        finished = {"completed": 0, "error": 0}
+
+        def on_update(job):
+            if job.status not in finished:
+                return
+            # 端到端耗时含排队等待，与 total（流水线本身）对照
+            self.registry.observe("queue_wait", job.started - job.created)
+            self.registry.observe("end_to_end", job.finished - job.created)
+            with cond:
+                finished[job.status] += 1
+                cond.notify()
+
+        job_queue = self.JobQueue(lambda job: self.worker.run(job.id), workers=self.args.workers,
+                                  max_pending=self.args.queue_size, on_update=on_update)
+        submitted = rejected = 0
+        start = time.monotonic()
+        for offset in arrivals:
+            delay = start + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                job_queue.submit()
+                submitted += 1
+            except self.QueueFullError:
+                rejected += 1
+        with cond:
+            cond.wait_for(lambda: sum(finished.values()) >= submitted)
+        wall = time.monotonic() - start
+        return self._report(finished["completed"], finished["error"], rejected, wall, api_before)
+
+    def run(self, name: str) -> dict:
+        if name == "single":
+            return self.run_single()
+        if name == "burst":
+            return self.run_queued([0.0] * self.args.burst)
+        count = int(self.args.duration * self.args.rate)
+        return self.run_queued([i / self.args.rate for i in range(count)])
+
+
+def main():
+    args = parse_args()
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    if args.json:
+        # 基准测试期间会切换到临时工作目录
+        args.json = os.path.abspath(args.json)
+    bench = Bench(args)
+    results = {}
+    try:
+        for name in scenarios:
+            print(f"\n运行场景 {name}...")
+            results[name] = bench.run(name)
+    finally:
+        bench.close()
+
+    for name, report in results.items():
+        print_report(name, report)
+
+    if args.json:
+        output = {
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+            "results": results
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,363 @@
 import cv2
-import base64
+import numpy as np
 import os
 import time
-import json
+import threading
+from collections import deque
 from multiprocessing import Process
 
-def capture_photo():
-    cap = cv2.VideoCapture(0, cv2.CAP_V4L2)
+from data_handoff import atomic_write_json
+from frame_quality import (BURST_ATTEMPTS, BURST_SIZE, QUALITY_GATE_ENABLED, FrameQuality,
+                           FrameQualityError, QualityThresholds, assess_burst, choose_best)
+from telemetry import sampler
+from frame_transport import FrameWriter
+from jpeg_utils import ensure_huffman_tables, is_jpeg, jpeg_dimensions
+
+# MJPEG 直通：直接取 V4L2 缓冲区中的压缩数据，不做 解码→BGR→重新编码
+PASSTHROUGH = os.environ.get("CAMERA_PASSTHROUGH", "1") != "0"
+
+class CapturedFrame:
+    """
+    一帧摄像头图像，以 JPEG 压缩数据保存。
+
+    上传路径直接使用压缩数据；只有本地需要像素（清晰度评分、分类器等）时才解码。
+    """
+    __slots__ = ("timestamp", "jpeg", "_image")
+
+    def __init__(self, jpeg: bytes, timestamp: float = None, image=None):
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.jpeg = jpeg
+        self._image = image
+
+    @classmethod
+    def from_capture(cls, raw):
+        """由 cap.read() 的结果构造：直通模式下是一维压缩数据，否则是已解码的BGR图像"""
+        if raw.ndim == 3:
+            # 后端忽略了 CONVERT_RGB=0（或未启用直通），只能重新编码
+            ok, buf = cv2.imencode(".jpg", raw)
+            if not ok:
+                return None
+            return cls(buf.tobytes(), image=raw)
+        data = raw.tobytes()
+        if not is_jpeg(data):
+            return None
+        return cls(ensure_huffman_tables(data))
+
+    @property
+    def image(self):
+        """完整分辨率的BGR图像（首次访问时解码）"""
+        if self._image is None:
+            self._image = cv2.imdecode(np.frombuffer(self.jpeg, np.uint8), cv2.IMREAD_COLOR)
+        return self._image
+
+    def gray_preview(self):
+        """1/8 分辨率灰度图：利用 JPEG 的 DCT 缩放解码，开销远小于完整解码"""
+        if self._image is not None:
+            gray = cv2.cvtColor(self._image, cv2.COLOR_BGR2GRAY)
+            return cv2.resize(gray, (gray.shape[1] // 8, gray.shape[0] // 8), interpolation=cv2.INTER_AREA)
+        return cv2.imdecode(np.frombuffer(self.jpeg, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+
+    def dimensions(self):
+        """(宽, 高)，从 JPEG 头读取，无需解码"""
+        if self._image is not None:
+            return self._image.shape[1], self._image.shape[0]
+        return jpeg_dimensions(self.jpeg)
+
+def read_frame(cap):
+    """从摄像头读取一帧，返回 CapturedFrame 或None"""
+    ret, raw = cap.read()
+    if not ret or raw is None:
+        return None
+    return CapturedFrame.from_capture(raw)
+
+def open_camera(passthrough: bool = PASSTHROUGH, device=0):
+    """
+    打开并配置摄像头，失败时返回None
+
+    :param device: 摄像头序号或设备路径（如 /dev/video2），多工位时每个工位一个
+    """
+    cap = cv2.VideoCapture(device, cv2.CAP_V4L2)
     
     if not cap.isOpened():
-        print("错误：无法通过 V4L2 打开摄像头！")
-        return
+        print(f"错误：无法通过 V4L2 打开摄像头 {device}！")
+        return None
     
     cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M','J','P','G'))
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+    # 只保留一个驱动缓冲区，常驻模式下减少取到旧帧的可能
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    if passthrough:
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
     
-    print("摄像头已就绪，拍摄照片...")
-    
+    # 首次打开时丢弃若干帧，等待自动曝光稳定（grab 不解码）
     for i in range(5):
-        ret, frame = cap.read()
+        cap.grab()
         time.sleep(0.1)
-    
-    ret, frame = cap.read()
-    if not ret:
-        print("错误：无法获取视频帧！")
-        return False
-    
-    timestamp = int(time.time())
-    image_path = f"food_{timestamp}.jpg"
-    cv2.imwrite(image_path, frame)
-    print(f"照片已保存为 {image_path}")
+    return cap
+
+def select_best_frame(frames, thresholds=None):
+    """
+    在一组连续帧中选出合格且最清晰的一帧。
+
+    评分只用 1/8 分辨率灰度图（DCT 缩放解码），每帧只需几毫秒。
+    :param thresholds: 质量门限，默认读取环境变量；关闭门限时只按清晰度选择
+    :return: (CapturedFrame, FrameQuality)；没有合格帧时返回 (None, 问题列表)
+    """
+    if thresholds is None and QUALITY_GATE_ENABLED:
+        thresholds = QualityThresholds.from_env()
+    qualities = assess_burst([frame.gray_preview() for frame in frames])
+    index, problems = choose_best(qualities, thresholds)
+    if index is None:
+        return None, problems
+    return frames[index], qualities[index]
+
+def read_burst(cap, count: int = BURST_SIZE):
+    """从已打开的摄像头连续读取 count 帧，跳过读取失败的帧"""
+    frames = []
+    for i in range(count):
+        frame = read_frame(cap)
+        if frame is not None:
+            frames.append(frame)
+    return frames
+
+def log_quality(quality: FrameQuality, count: int):
+    print(f"从 {count} 帧中选出最佳帧：清晰度 {quality.sharpness:.1f}，"
+          f"亮度 {quality.brightness:.0f}，帧间差 {quality.motion:.1f}")
+
+class CameraService:
+    """
+    常驻摄像头服务。
+
+    保持设备常开，后台线程持续读取帧并放入固定长度的环形缓冲区，
+    拍照请求直接从缓冲区取“最新帧”或“最近最清晰帧”，无需重新打开和预热摄像头。
+    内存占用上限为 buffer_size 帧。
+    """
+
+    def __init__(self, buffer_size: int = BURST_SIZE + 1, reopen_delay: float = 1.0, opener=None):
+        """
+        :param opener: 打开摄像头的函数，返回与 cv2.VideoCapture 接口相同的对象或None；
+                       默认为 open_camera，基准测试中替换为模拟摄像头
+        """
+        self.reopen_delay = reopen_delay
+        self.opener = opener or open_camera
+        self._frames = deque(maxlen=buffer_size)  # CapturedFrame，保存压缩数据
+        self._cond = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        self.cap = None
+
+    def start(self) -> bool:
+        """打开摄像头并启动后台取帧线程"""
+        with self._start_lock:
+            if self._running:
+                return True
+            self.cap = self.opener()
+            if self.cap is None:
+                return False
+            self._running = True
+            self._thread = threading.Thread(target=self._drain_loop, name="camera-service", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """停止取帧并释放摄像头"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        with self._cond:
+            self._frames.clear()
+
+    def _drain_loop(self):
+        sampler.register_thread("camera")
+        while self._running:
+            frame = read_frame(self.cap)
+            if frame is None:
+                # 设备断开：释放后稍等再重新打开
+                print("警告：摄像头读取失败，尝试重新打开...")
+                self.cap.release()
+                time.sleep(self.reopen_delay)
+                self.cap = self.opener()
+                if self.cap is None:
+                    self.cap = cv2.VideoCapture()
+                continue
+            with self._cond:
+                self._frames.append(frame)
+                self._cond.notify_all()
+        sampler.unregister("camera")
+
+    def latest_frame(self, timeout: float = 2.0, newer_than: float = 0.0):
+        """
+        获取最新一帧。
+
+        :param timeout: 缓冲区暂无符合条件的帧时的最长等待秒数
+        :param newer_than: 只接受该时间戳之后拍摄的帧
+        :return: CapturedFrame，超时返回None
+        """
+        with self._cond:
+            ok = self._cond.wait_for(
+                lambda: self._frames and self._frames[-1].timestamp > newer_than, timeout)
+            return self._frames[-1] if ok else None
+
+    def burst(self, count: int = BURST_SIZE, newer_than: float = 0.0, timeout: float = 2.0):
+        """
+        取 count 帧连续的帧（时间戳晚于 newer_than）。
+
+        缓冲区中已有的帧直接使用，不足时等待后续帧；超时返回已收集到的帧。
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            frames = [frame for frame in self._frames if frame.timestamp > newer_than]
+            while len(frames) < count:
+                last = frames[-1].timestamp if frames else newer_than
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait_for(
+                        lambda: self._frames and self._frames[-1].timestamp > last, remaining):
+                    break
+                frames.extend(frame for frame in self._frames if frame.timestamp > last)
+        return frames[-count:]
+
+    def best_frame(self, window: float = 0.5, timeout: float = 2.0,
+                   count: int = BURST_SIZE, attempts: int = BURST_ATTEMPTS):
+        """
+        连拍取最佳帧：从最近 window 秒内的连续帧中选出合格且最清晰的一帧。
+
+        整组不合格（模糊、过暗过曝、画面在运动）时用之后的新帧重试，
+        仍不合格则抛出 FrameQualityError，避免把无用的图像上传给API。
+        :return: CapturedFrame，没有任何帧时返回None
+        """
+        newer_than = time.time() - window
+        problems = []
+        for attempt in range(max(1, attempts)):
+            frames = self.burst(count, newer_than, timeout)
+            if not frames:
+                return None
+            # 在锁外评分，避免阻塞取帧线程
+            frame, quality = select_best_frame(frames)
+            if frame is not None:
+                log_quality(quality, len(frames))
+                return frame
+            problems = quality
+            print(f"第 {attempt + 1} 组连拍不合格: {'，'.join(problems)}")
+            newer_than = frames[-1].timestamp
+        raise FrameQualityError(f"图像质量不合格: {'，'.join(problems)}")
+
+# 设置后才把照片归档到磁盘；默认只经共享内存交给分析程序
+ARCHIVE_DIR = os.environ.get("FOOD_ARCHIVE_DIR")
+
+_frame_writer = None
+
+def get_frame_writer() -> FrameWriter:
+    """获取进程内共享的共享内存帧写入端"""
+    global _frame_writer
+    if _frame_writer is None:
+        _frame_writer = FrameWriter()
+    return _frame_writer
+
+def publish_captured_frame(frame: CapturedFrame, archive_dir=ARCHIVE_DIR) -> dict:
+    """
+    将帧的 JPEG 数据通过共享内存交给分析程序，写入 capture_status.json。
+
+    :param frame: 拍摄到的帧
+    :param archive_dir: 归档目录，为None时不写磁盘
+    :return: 拍摄状态字典
+    """
+    timestamp = int(frame.timestamp)
+    data = frame.jpeg
+
+    width, height = frame.dimensions() or (None, None)
+    meta = {"timestamp": timestamp, "width": width, "height": height, "format": "jpeg"}
+    writer = get_frame_writer()
+    seq = writer.publish(data, meta)
+    print(f"照片已写入共享内存 {writer.path}（{len(data)} 字节）")
     
     status = {
         "image_ready": True,
-        "image_path": image_path,
+        "image_path": None,
+        "shm_path": writer.path,
+        "shm_seq": seq,
         "timestamp": timestamp
     }
+
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        image_path = os.path.join(archive_dir, f"food_{timestamp}.jpg")
+        with open(image_path, "wb") as f:
+            f.write(data)
+        status["image_path"] = image_path
+        print(f"照片已归档为 {image_path}")
+    
+    # 原子写入：分析程序通过 inotify 在状态文件完整落盘的瞬间被唤醒
+    atomic_write_json("capture_status.json", status)
+    return status
+
+def capture_photo(cap=None, service=None):
+    """
+    拍摄一张照片，经共享内存交给分析程序并写入 capture_status.json。
+
+    :param cap: 已打开的摄像头，为None时临时打开并在拍摄后释放
+    :param service: 常驻摄像头服务，提供时直接取缓冲区中最近合格且最清晰的帧
+    :return: 成功时返回拍摄状态字典，失败（包括图像质量不合格）返回False
+    """
+    if service is not None:
+        try:
+            frame = service.best_frame()
+        except FrameQualityError as e:
+            print(f"错误：{e}")
+            return False
+        if frame is None:
+            print("错误：常驻摄像头没有可用的帧！")
+            return False
+        return publish_captured_frame(frame)
+
+    own_camera = cap is None
+    if own_camera:
+        cap = open_camera()
+        if cap is None:
+            return False
+    else:
+        # 已打开的摄像头：丢弃缓冲区中的旧帧（grab 不解码，开销很小）
+        for i in range(2):
+            cap.grab()
+    
+    print("摄像头已就绪，连拍选取最佳帧...")
+    
+    # 连拍评分，取合格且最清晰的一帧；整组不合格时再拍一组
+    frame = None
+    for attempt in range(max(1, BURST_ATTEMPTS)):
+        frames = read_burst(cap)
+        if not frames:
+            break
+        frame, quality = select_best_frame(frames)
+        if frame is not None:
+            log_quality(quality, len(frames))
+            break
+        print(f"第 {attempt + 1} 组连拍不合格: {'，'.join(quality)}")
+    if frame is None:
+        print("错误：无法获取合格的视频帧！")
+        if own_camera:
+            cap.release()
+        return False
     
-    with open("capture_status.json", "w") as f:
-        json.dump(status, f)
+    status = publish_captured_frame(frame)
     
-    cap.release()
-    cv2.destroyAllWindows()
+    if own_camera:
+        cap.release()
+        cv2.destroyAllWindows()
     print("摄像头程序已完成")
-    return True
+    return status
 
 if __name__ == "__main__":
     camera_process = Process(target=capture_photo)
     
-    os.system(f"taskset -cp 1 {os.getpid()}")
+    # 由启动器启动时已在 exec 前绑定核心；单独运行时在这里绑定到从核1
+    if 1 in os.sched_getaffinity(0):
+        os.sched_setaffinity(0, {1})
     
     # 启动进程
     camera_process.start()
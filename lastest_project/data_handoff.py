@@ -0,0 +1,104 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import threading
+import time
+from typing import Optional, Set
+
+# inotify 常量（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# inotify 不可用时（非 Linux）的后备轮询间隔
+FALLBACK_POLL_INTERVAL = 0.05
+
+
+def atomic_write_text(path: str, content: str):
+    """原子写入文本：先写临时文件再 rename，读取方不会读到半个文件"""
+    # 临时文件名带进程和线程号，多个写入方同时写同一目标也不会互相踩踏
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def atomic_write_json(path: str, data):
+    """原子写入JSON文件"""
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False))
+
+
+class DirectoryWatcher:
+    """
+    基于 inotify 的目录监视器。
+
+    只关注“写完关闭”和“rename 进入目录”两类事件，
+    配合 atomic_write_* 使用时，每个事件都对应一个完整的文件。
+    inotify 不可用时退化为短间隔轮询。
+    """
+
+    def __init__(self, directory: str = "."):
+        self.directory = directory
+        self.fd: Optional[int] = None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch 失败")
+            self.fd = fd
+        except (OSError, AttributeError) as e:
+            print(f"inotify 不可用，改为轮询: {e}")
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        """
+        等待目录中有文件写入完成。
+
+        :param timeout: 最长等待秒数
+        :return: 发生变化的文件名集合；轮询模式下返回None表示“可能有变化”
+        """
+        if self.fd is None:
+            time.sleep(min(timeout, FALLBACK_POLL_INTERVAL))
+            return None
+
+        readable, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not readable:
+            return set()
+
+        names = set()
+        while True:
+            try:
+                buf = os.read(self.fd, 4096)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buf):
+                _, _, _, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                name = buf[offset:offset + name_len].rstrip(b"\0")
+                offset += name_len
+                if name:
+                    names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# 同一订阅者两次推送之间的最小间隔（秒），期间的事件合并为一帧
+DEFAULT_INTERVAL = 0.25
+# 没有事件时发送注释行保活，同时让服务器及时发现已断开的连接
+KEEPALIVE_INTERVAL = 15.0
+# 新订阅者连接时补发的事件（其余事件只推送给当时在线的订阅者）
+REPLAY_KEYS = ("status", "cpu", "scale")
+
+
+def format_sse(event: str, data) -> str:
+    """编码为一条 text/event-stream 消息"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class EventSubscription:
+    """
+    一个 SSE 连接的待发送事件。
+
+    以合并键（如 'cpu'、'progress:<任务ID>'）保存每类事件的最新一条，
+    连接跟不上时旧值被新值覆盖，而不是在内存中堆积。
+    """
+
+    def __init__(self, interval: float, keepalive: float, max_pending: int = 64):
+        self.interval = interval
+        self.keepalive = keepalive
+        self.max_pending = max_pending
+        self._pending: "OrderedDict[str, Tuple[str, Dict]]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def push(self, key: str, event: str, data):
+        with self._cond:
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                self._pending.popitem(last=False)
+            self._pending[key] = (event, data)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def _take(self, timeout: float) -> Optional[List[Tuple[str, Dict]]]:
+        with self._cond:
+            if not self._pending and not self._closed:
+                self._cond.wait(timeout)
+            events = list(self._pending.values())
+            self._pending.clear()
+            return events
+
+    def stream(self):
+        """生成 SSE 文本，每个间隔最多输出一帧（一帧内可含多条不同类型的事件）"""
+        # 告诉浏览器断线后的重连间隔（毫秒）
+        yield "retry: 3000\n\n"
+        last_flush = 0.0
+        while not self._closed:
+            wait = self.interval - (time.monotonic() - last_flush)
+            if wait > 0:
+                # 节流：先等满间隔，期间到达的事件在下一帧中合并
+                time.sleep(wait)
+            events = self._take(self.keepalive)
+            if self._closed:
+                break
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            last_flush = time.monotonic()
+            yield "".join(format_sse(event, data) for event, data in events)
+
+
+class EventBus:
+    """
+    进程内事件总线，向所有 SSE 连接广播状态变化、阶段进度、CPU采样和分析结果。
+
+    发布方只把事件放进各订阅者的合并表中，不会被慢连接阻塞。
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, keepalive: float = KEEPALIVE_INTERVAL,
+                 max_subscribers: int = 32):
+        self.interval = interval
+        self.keepalive = keepalive
+        self.max_subscribers = max_subscribers
+        self._subscribers: List[EventSubscription] = []
+        self._latest: Dict[str, Tuple[str, Dict]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, event: str, data, key: Optional[str] = None):
+        """
+        发布事件。
+
+        :param event: 事件类型，对应前端 addEventListener 的名称
+        :param key: 合并键，同一键在一个间隔内只保留最新一条，默认与事件类型相同
+        """
+        key = key or event
+        with self._lock:
+            if key in REPLAY_KEYS:
+                self._latest[key] = (event, data)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push(key, event, data)
+
+    def subscribe(self) -> Optional[EventSubscription]:
+        """新建订阅并补发最近的状态；连接数已满时返回None"""
+        subscription = EventSubscription(self.interval, self.keepalive)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.append(subscription)
+            latest = dict(self._latest)
+        for key, (event, data) in latest.items():
+            subscription.push(key, event, data)
+        return subscription
+
+    def unsubscribe(self, subscription: EventSubscription):
+        subscription.close()
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+
+# 进程内共享的事件总线
+event_bus = EventBus()
@@ -0,0 +1,117 @@
+import os
+import pickle
+import threading
+import time
+from typing import List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+from nutrition_table import get_nutrition_table
+
+_EARLY_DEMO_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "early_demo")
+MODEL_PATH = os.environ.get("FOOD_CLASSIFIER_MODEL", os.path.join(_EARLY_DEMO_DIR, "food101_model.onnx"))
+LABEL_ENCODER_PATH = os.environ.get("FOOD_CLASSIFIER_LABELS", os.path.join(_EARLY_DEMO_DIR, "label_encoder.pkl"))
+
+# 推理线程数：飞腾派上分析进程占用的核心数，默认2
+NUM_THREADS = int(os.environ.get("FOOD_CLASSIFIER_THREADS", "2"))
+
+
+def load_labels(path: str = LABEL_ENCODER_PATH) -> List[str]:
+    """
+    读取 label_encoder.pkl 中的类别名。
+
+    开发板上未安装 scikit-learn 时无法反序列化，此时使用本地营养表中的类别，
+    两者都是 Food-101 类别按字母排序，顺序一致。
+    """
+    try:
+        with open(path, "rb") as f:
+            return [str(label) for label in pickle.load(f).classes_]
+    except (ImportError, ModuleNotFoundError, FileNotFoundError) as e:
+        print(f"无法读取标签编码器（{e}），使用营养表中的类别")
+        return list(get_nutrition_table().labels)
+
+
+class FoodClassifier:
+    """
+    常驻的 ONNX 食物分类器。
+
+    进程内只创建一次 InferenceSession 并在构造时完成预热，
+    之后每次分类只有预处理和一次前向推理的开销。
+    """
+
+    def __init__(self, model_path: str = MODEL_PATH, label_path: str = LABEL_ENCODER_PATH,
+                 num_threads: int = NUM_THREADS):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        # 单输入的串行网络，算子间并行没有收益，只会多占一个核
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options,
+                                            providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # 输入为 NHWC，尺寸取自模型（训练时为 384x384）
+        size = model_input.shape[1]
+        self.input_size = size if isinstance(size, int) else 384
+        self.labels = load_labels(label_path)
+        self._lock = threading.Lock()
+        self.last_inference_ms = 0.0
+
+        # 预热：首次推理会分配内存并选择内核实现
+        self.session.run(None, {self.input_name: np.zeros((1, self.input_size, self.input_size, 3), np.float32)})
+
+    def preprocess(self, image: Union[bytes, np.ndarray]) -> np.ndarray:
+        """
+        BGR 图像或 JPEG 数据 → (1, H, W, 3) float32。
+
+        训练（early_demo/tensor_flow_demo_1.py）直接使用 0-255 的原始像素，这里同样不做归一化。
+        """
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            buf = np.frombuffer(image, np.uint8)
+            # 1280x720 的帧按 1/2 解码后仍大于模型输入，省去一半解码开销
+            image = cv2.imdecode(buf, cv2.IMREAD_REDUCED_COLOR_2)
+            if image is None:
+                raise ValueError("无法解码图像")
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        rgb = cv2.resize(rgb, (self.input_size, self.input_size), interpolation=cv2.INTER_AREA)
+        return np.expand_dims(rgb.astype(np.float32), axis=0)
+
+    def classify(self, image: Union[bytes, np.ndarray], k: int = 3) -> List[Tuple[str, float]]:
+        """
+        返回置信度最高的 k 个类别。
+
+        :param image: BGR 图像或 JPEG 数据
+        :return: [(类别名, 置信度), ...]，按置信度降序
+        """
+        tensor = self.preprocess(image)
+        t0 = time.perf_counter()
+        with self._lock:
+            probs = self.session.run(None, {self.input_name: tensor})[0].squeeze()
+        self.last_inference_ms = (time.perf_counter() - t0) * 1000
+        k = min(k, probs.shape[0])
+        top = np.argpartition(probs, -k)[-k:]
+        top = top[np.argsort(probs[top])[::-1]]
+        return [(self.labels[i], float(probs[i])) for i in top]
+
+
+_classifier: Optional[FoodClassifier] = None
+_classifier_lock = threading.Lock()
+
+
+def get_food_classifier() -> Optional[FoodClassifier]:
+    """获取进程内共享的分类器；模型缺失或加载失败时返回None"""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            if not os.path.exists(MODEL_PATH):
+                print(f"未找到分类模型: {MODEL_PATH}")
+                return None
+            try:
+                _classifier = FoodClassifier()
+            except Exception as e:
+                print(f"分类模型加载失败: {e}")
+                return None
+        return _classifier
@@ -4,13 +4,46 @@ import json
 import os
 import time
 import sys
-from typing import Dict, Optional, Tuple
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 import base64
 
+import api_client
+from data_handoff import DirectoryWatcher, atomic_write_json, atomic_write_text
+from frame_transport import FrameReader, FrameTransportError
+from history_store import HistoryStore
+from metrics import Trace, registry, stage
+from result_cache import ResultCache, image_hash
+from nutrition_parser import NUTRITION_JSON_SCHEMA, IncrementalNutritionParser, extract_nutrition
+from nutrition_table import build_local_advice, get_nutrition_table
+
+try:
+    from food_classifier import get_food_classifier
+except ImportError:  # 未安装 onnxruntime 时没有本地分类
+    get_food_classifier = None
+from upload_preprocess import UploadConfig, prepare_upload_image
+
 # 硬编码API密钥
 DEEPSEEK_API_KEY = "************" #加密API 
 
+# 相似图像结果缓存（FOOD_RESULT_CACHE=0 关闭）
+RESULT_CACHE_ENABLED = os.environ.get("FOOD_RESULT_CACHE", "1") != "0"
+
+# 本地分类器（FOOD_CLASSIFIER=0 关闭）；首选类别置信度达到阈值时直接使用本地营养表
+CLASSIFIER_ENABLED = os.environ.get("FOOD_CLASSIFIER", "1") != "0"
+CLASSIFIER_LOCAL_THRESHOLD = float(os.environ.get("FOOD_CLASSIFIER_LOCAL_THRESHOLD", "0.8"))
+# 首选类别置信度达到该值时才把候选类别写入提示词，低于该值时分类结果接近随机，只会误导大模型
+CLASSIFIER_HINT_THRESHOLD = float(os.environ.get("FOOD_CLASSIFIER_HINT_THRESHOLD", "0.3"))
+
+# 流式调用（FOOD_API_STREAM=0 关闭）：边生成边解析，食物名称和各营养字段生成后立即可用
+API_STREAM_ENABLED = os.environ.get("FOOD_API_STREAM", "1") != "0"
+
+# 结构化输出：json_schema（按 schema 约束）、json_object（JSON 模式，默认）或 none（不要求）
+API_RESPONSE_FORMAT = os.environ.get("FOOD_API_RESPONSE_FORMAT", "json_object")
+# 回复无法解析出营养数据时的重新请求次数（网络错误的重试由 api_client 处理）
+MALFORMED_RETRIES = int(os.environ.get("FOOD_API_MALFORMED_RETRIES", "1"))
+
 def load_prompt_template() -> str:
     """加载提示词模板（增加文件检查）"""
     try:
@@ -28,8 +61,8 @@ def load_prompt_template() -> str:
 5. 脂肪（克）
 6. 基于上述营养成分的饮食建议
 
-请以JSON格式回复，格式如下：
-{{"food": "食物名称", "calories": "热量", "carbohydrates": "碳水化合物", "protein": "蛋白质", "fat": "脂肪", "advice": "饮食建议"}}"""
+请只回复一个JSON对象，数值字段只填数字（热量单位为千卡，其余为克），格式如下：
+{{"food": "食物名称", "calories": 0, "carbohydrates": 0, "protein": 0, "fat": 0, "advice": "饮食建议"}}"""
         
         with open("prompt_template.txt", "w", encoding="utf-8") as f:
             f.write(default_template)
@@ -37,29 +70,38 @@ def load_prompt_template() -> str:
         print("已创建默认提示词模板文件")
         return default_template
 
-def encode_image_to_base64(image_path: str) -> Optional[str]:
+def format_prompt(template: str, food_name: str, weight_grams: float) -> str:
+    """
+    填充提示词模板中的 {food} 和 {weight}。
+
+    analyze_food.sh 生成的模板中 JSON 示例的花括号没有转义，str.format 会抛出 KeyError，
+    此时只替换这两个占位符。
+    """
+    weight = f"{weight_grams}克"
+    try:
+        return template.format(food=food_name, weight=weight)
+    except (KeyError, IndexError, ValueError):
+        return template.replace("{food}", food_name).replace("{weight}", weight)
+
+def encode_image_to_base64(image: Union[str, bytes]) -> Optional[str]:
     """
-    将本地图片编码为Base64字符串。
+    将图片编码为Base64字符串。
 
-    :param image_path: 本地图片路径
+    :param image: 本地图片路径，或已编码的图片数据（如来自共享内存）
     :return: Base64编码的图片字符串或None
     """
     try:
-        with open(image_path, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
+        if isinstance(image, str):
+            with open(image, "rb") as image_file:
+                image = image_file.read()
+        encoded_string = base64.b64encode(image).decode('utf-8')
         return encoded_string
     except Exception as e:
         print(f"图片编码失败: {e}")
         return None
 
-def call_deepseek_api(prompt_content: str, image_base64: str) -> Optional[Dict]:
-    """调用doubao Vision API"""
-    url = "https://ark.cn-beijing.volces.com/api/v3/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-    }
-
+def build_chat_payload(prompt_content: str, image_base64: str, mime: str = "image/jpeg") -> Dict:
+    """构建 chat/completions 请求体"""
     # 构建消息内容
     messages = [
         {
@@ -67,7 +109,7 @@ def call_deepseek_api(prompt_content: str, image_base64: str) -> Optional[Dict]:
                 {"text": prompt_content, "type": "text"},
                 {
                     "image_url": {
-                        "url": f"data:image/png;base64,{image_base64}"
+                        "url": f"data:{mime};base64,{image_base64}"
                     },
                     "type": "image_url"
                 }
@@ -81,15 +123,20 @@ def call_deepseek_api(prompt_content: str, image_base64: str) -> Optional[Dict]:
         "model": "ep-20250515232926-cfjtd",
         "messages": messages
     }
+    if API_RESPONSE_FORMAT == "json_schema":
+        payload["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "nutrition", "schema": NUTRITION_JSON_SCHEMA, "strict": True}
+        }
+    elif API_RESPONSE_FORMAT == "json_object":
+        payload["response_format"] = {"type": "json_object"}
+    return payload
 
+def call_deepseek_api(prompt_content: str, image_base64: str, mime: str = "image/jpeg") -> Optional[Dict]:
+    """调用doubao Vision API（经共享的连接池会话，带超时和重试）"""
+    payload = build_chat_payload(prompt_content, image_base64, mime)
     try:
-        response = requests.post(
-            url,
-            headers=headers,
-            json=payload
-        )
-        response.raise_for_status()
-        return response.json()
+        return api_client.post_chat_completion(payload, DEEPSEEK_API_KEY)
     except requests.exceptions.RequestException as e:
         print(f"API请求失败: {e}")
         return None
@@ -97,140 +144,170 @@ def call_deepseek_api(prompt_content: str, image_base64: str) -> Optional[Dict]:
         print(f"请求处理异常: {e}")
         return None
 
+def call_deepseek_api_stream(prompt_content: str, image_base64: str, mime: str = "image/jpeg",
+                             on_partial: Optional[Callable[[Dict], None]] = None,
+                             trace: Optional[Trace] = None) -> Optional[Dict]:
+    """
+    流式调用 Vision API，每解析出一个新字段就回调 on_partial(已解析的全部字段)。
+
+    :param trace: 提供时记录从发出请求到第一个字段出现的耗时（api_first_field）
+    :return: 与非流式调用结构相同的响应（choices[0].message.content 为完整回复），失败时返回None
+    """
+    payload = build_chat_payload(prompt_content, image_base64, mime)
+    parser = IncrementalNutritionParser()
+    start = time.monotonic()
+    first_field = None
+    try:
+        for chunk in api_client.stream_chat_completion(payload, DEEPSEEK_API_KEY):
+            if not parser.feed(chunk):
+                continue
+            if first_field is None:
+                first_field = time.monotonic()
+                if trace is not None:
+                    trace.record("api_first_field", start, first_field)
+            if on_partial is not None:
+                try:
+                    on_partial(dict(parser.fields))
+                except Exception as e:
+                    print(f"部分结果回调异常: {e}")
+    except requests.exceptions.RequestException as e:
+        print(f"API请求失败: {e}")
+        return None
+    except Exception as e:
+        print(f"请求处理异常: {e}")
+        return None
+
+    if first_field is not None:
+        print(f"流式回复: 首个字段 {first_field - start:.2f} 秒，完整回复 {time.monotonic() - start:.2f} 秒")
+    return {"choices": [{"message": {"role": "assistant", "content": parser.text}}]}
+
 def parse_nutrition_response(api_response: Dict) -> Optional[Dict]:
-    """解析API返回的营养数据"""
+    """
+    解析API返回的营养数据。
+
+    容忍代码块、前后说明文字和 “105 千卡” 这类带单位的数值，营养数值统一为数字；
+    回复中取不到完整的营养数据时返回None。
+    """
     if not api_response:
         print("\n=== 调试：API响应为空 ===")
         return None
 
     try:
-        # 假设API返回的内容在choices[0].message.content中，并且是JSON字符串
         content = api_response["choices"][0]["message"]["content"]
-        
-        # 尝试直接解析内容为JSON（如果API返回的是JSON字符串）
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            # 如果不是JSON字符串，则需要从文本中提取
-            print("API返回的内容不是有效的JSON字符串，尝试解析文本...")
-            # 返回原始内容
-            return {"raw_response": content}
-    except (KeyError, json.JSONDecodeError) as e:
+    except (KeyError, IndexError, TypeError) as e:
         print(f"解析API响应失败: {e}")
         print(f"原始响应: {api_response}")
         return None
 
-def wait_for_data(max_wait_time=60):
-    """等待摄像头和重量数据准备好"""
-    start_time = time.time()
-    image_path = None
+    record = extract_nutrition(content)
+    if record is None:
+        print(f"API回复中没有完整的营养数据: {content[:200]}")
+        return None
+    return record.to_dict()
+
+CAPTURE_STATUS_FILE = "capture_status.json"
+WEIGHT_DATA_FILE = "weight_data.txt"
+
+def read_capture_status() -> Optional[Dict]:
+    """读取摄像头状态文件，图像就绪时返回状态字典"""
+    try:
+        with open(CAPTURE_STATUS_FILE, "r") as f:
+            status = json.load(f)
+    except (IOError, json.JSONDecodeError):
+        return None
+    if status.get("image_ready", False):
+        return status
+    return None
+
+def load_captured_image(status: Dict) -> Optional[bytes]:
+    """
+    按拍摄状态取回图像数据。
+
+    优先从共享内存读取，不经过SD卡；仅当共享内存不可用时才读取归档的图片文件。
+    """
+    if status.get("shm_path"):
+        try:
+            reader = FrameReader(status["shm_path"])
+            try:
+                data, _ = reader.read(status.get("shm_seq"))
+                return data
+            finally:
+                reader.close()
+        except FrameTransportError as e:
+            print(f"共享内存读取失败: {e}")
+    if status.get("image_path"):
+        try:
+            with open(status["image_path"], "rb") as f:
+                return f.read()
+        except IOError as e:
+            print(f"读取图片文件失败: {e}")
+    return None
+
+def read_weight_data() -> Optional[float]:
+    """读取重量数据文件，返回重量（克）"""
+    try:
+        with open(WEIGHT_DATA_FILE, "r") as f:
+            return float(f.read().strip())
+    except (ValueError, IOError):
+        return None
+
+def wait_for_data(max_wait_time=60, need_image=True):
+    """
+    等待摄像头和重量数据准备好。
+
+    need_image 为False时（本地营养表已知食物）只等待重量数据。
+
+    通过 inotify 监听当前目录，两个输入文件写入完成的瞬间即被唤醒，
+    不再按秒轮询。写入方使用原子 rename，不会读到写了一半的文件。
+    """
+    deadline = time.time() + max_wait_time
+    capture_status = None
     weight_grams = None
     
     print("等待数据准备...")
     
-    while time.time() - start_time < max_wait_time:
-        # 检查摄像头数据
-        if os.path.exists("capture_status.json"):
-            try:
-                with open("capture_status.json", "r") as f:
-                    status = json.load(f)
-                    if status.get("image_ready", False):
-                        image_path = status.get("image_path")
-                        print(f"发现图像文件: {image_path}")
-            except json.JSONDecodeError:
-                pass
-        
-        # 检查重量数据
-        if os.path.exists("weight_data.txt"):
-            try:
-                with open("weight_data.txt", "r") as f:
-                    weight_str = f.read().strip()
-                    weight_grams = float(weight_str)
+    with DirectoryWatcher(".") as watcher:
+        # 先建立监听再检查现有文件，避免错过监听建立前已写入的数据
+        changed = None
+        while True:
+            if capture_status is None and (changed is None or CAPTURE_STATUS_FILE in changed):
+                capture_status = read_capture_status()
+                if capture_status:
+                    print(f"发现图像数据: 帧 {capture_status.get('shm_seq')}")
+            
+            if weight_grams is None and (changed is None or WEIGHT_DATA_FILE in changed):
+                weight_grams = read_weight_data()
+                if weight_grams is not None:
                     print(f"发现重量数据: {weight_grams} 克")
-            except (ValueError, IOError):
-                pass
-        
-        # 如果两个数据都准备好了，就可以继续
-        if image_path and weight_grams is not None:
-            return image_path, weight_grams
-        
-        time.sleep(1)
+            
+            # 如果两个数据都准备好了，就可以继续
+            if (capture_status or not need_image) and weight_grams is not None:
+                break
+            
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            changed = watcher.wait(remaining)
     
-    return image_path, weight_grams
+    return capture_status, weight_grams
 
 def set_cpu_affinity(cpu_id):
-    """设置CPU亲和性"""
+    """设置CPU亲和性（直接调用 sched_setaffinity，不再启动 taskset 进程）"""
     try:
-        os.system(f"taskset -cp {cpu_id} {os.getpid()}")
+        if cpu_id not in os.sched_getaffinity(0):
+            print(f"CPU {cpu_id} 不可用，不绑定核心")
+            return False
+        os.sched_setaffinity(0, {cpu_id})
         print(f"已将进程绑定到CPU {cpu_id}")
         return True
-    except Exception as e:
+    except OSError as e:
         print(f"设置CPU亲和性失败: {e}")
         return False
 
-def main():
-    # 设置CPU亲和性，绑定到CPU 0（主核）
-    set_cpu_affinity(0)
-    
-    image_path, weight_grams = wait_for_data()
-    
-    if not image_path:
-        print("错误：未能获取图像数据")
-        return
-    
-
-        
-
-    
-    template = load_prompt_template()
-    
-    food_name = os.path.splitext(os.path.basename(image_path))[0]  # 获取文件名（不含扩展名）
-    
-    prompt = template.format(food=food_name, weight=f"{weight_grams}克")
-
-    # 将图片编码为Base64
-    image_base64 = encode_image_to_base64(image_path)
-    if not image_base64:
-        print("\n=== 错误：无法将图片编码为Base64 ===")
-        return
-
-    # 调用 API
-    print("\n正在调用API分析食物营养成分...")
-    api_response = call_deepseek_api(prompt, image_base64)
-
-    if not api_response:
-        print("API请求失败，请检查网络或API密钥。")
-        return
-
-    # 解析并打印结果
-    nutrition_data = parse_nutrition_response(api_response)
+def build_nutrition_output(nutrition_data: Optional[Dict], weight_grams: float) -> Dict:
+    """将解析后的营养数据整理为统一的输出格式"""
     if isinstance(nutrition_data, dict):
-        if "calories" in nutrition_data and "carbohydrates" in nutrition_data and \
-           "protein" in nutrition_data and "fat" in nutrition_data and "advice" in nutrition_data:
-            result = nutrition_data
-        else:
-            raw_response = nutrition_data.get("raw_response", "{}")
-            try:
-                extracted_data = json.loads(raw_response)
-                # 根据实际返回的数据结构进行调整
-                result = {
-                    "calories": extracted_data.get("calories", "N/A"),
-                    "carbohydrates": extracted_data.get("carbohydrates", "N/A"),
-                    "protein": extracted_data.get("protein", "N/A"),
-                    "fat": extracted_data.get("fat", "N/A"),
-                    "advice": extracted_data.get("advice", "N/A"),
-                    "food": extracted_data.get("food", "N/A")
-                }
-            except json.JSONDecodeError:
-                # 如果无法解析，则返回默认值
-                result = {
-                    "calories": "N/A",
-                    "carbohydrates": "N/A",
-                    "protein": "N/A",
-                    "fat": "N/A",
-                    "advice": "无法解析营养数据",
-                    "food": "无法识别"
-                }
+        result = nutrition_data
     else:
         result = {
             "calories": "N/A",
@@ -250,8 +327,177 @@ def main():
         "fat": result.get("fat", "N/A"),
         "advice": result.get("advice", "N/A")
     }
+    # Food-101 类别名（本地营养表或分类器给出），历史记录按它统计，不受中文名称写法影响
+    if result.get("label"):
+        output["label"] = result["label"]
+    return output
 
-    # 打印JSON格式的输出
+def analyze_food_locally(food_label: str, weight_grams: float) -> Optional[Dict]:
+    """
+    离线快速路径：用本地营养成分表换算，不访问网络。
+
+    :param food_label: Food-101 类别名或中文名
+    :return: 营养分析结果字典，食物不在表中时返回None
+    """
+    nutrients = get_nutrition_table().lookup(food_label, weight_grams)
+    if nutrients is None:
+        return None
+    nutrients["advice"] = build_local_advice(nutrients)
+    output = build_nutrition_output(nutrients, weight_grams)
+    output["source"] = "local"
+    return output
+
+class ApiRequestError(RuntimeError):
+    """API请求失败（网络错误、HTTP错误或没有回复内容）"""
+
+def describe_candidates(candidates: List[Tuple[str, float]]) -> str:
+    """将分类结果转为提示词中的食物描述，如 “炒饭（置信度62%），也可能是：寿司（20%）”"""
+    table = get_nutrition_table()
+
+    def name(label):
+        index = table.find(label)
+        return table.names_zh[index] if index is not None else label
+
+    first_label, first_conf = candidates[0]
+    text = f"{name(first_label)}（本地模型置信度{first_conf * 100:.0f}%）"
+    others = [f"{name(label)}（{conf * 100:.0f}%）" for label, conf in candidates[1:]]
+    if others:
+        text += "，也可能是：" + "、".join(others)
+    return text
+
+def analyze_food(image: Union[str, bytes], weight_grams: float, template: Optional[str] = None,
+                 food_name: Optional[str] = None, upload_config: Optional[UploadConfig] = None,
+                 cache: Optional[ResultCache] = None, food_label: Optional[str] = None,
+                 classifier=None, trace: Optional[Trace] = None,
+                 on_partial: Optional[Callable[[Dict], None]] = None) -> Optional[Dict]:
+    """
+    对一张已拍摄的图片和重量执行完整的营养分析。
+
+    :param image: 图片路径或已编码的图片数据
+    :param weight_grams: 重量（克）
+    :param template: 已加载的提示词模板，为None时从文件加载
+    :param food_name: 提示词中的食物名称，为None时取图片文件名
+    :param upload_config: 上传前的缩放/压缩参数，为None时使用环境变量中的默认值
+    :param cache: 结果缓存，命中相似图像时跳过API调用
+    :param food_label: 已知的食物类别，在本地营养表中时直接离线换算
+    :param classifier: 常驻的本地分类器，其结果用于本地查表和提示词
+    :param trace: 阶段耗时记录，提供时记录分类、上传准备、编码、API和解析各阶段
+    :param on_partial: 流式调用时的部分结果回调，食物名称和各营养字段生成后立即调用
+    :return: 营养分析结果字典，失败时返回None
+    """
+    if food_label:
+        output = analyze_food_locally(food_label, weight_grams)
+        if output:
+            print(f"本地营养表命中: {food_label}，跳过API调用")
+            return output
+
+    if template is None:
+        template = load_prompt_template()
+
+    if food_name is None:
+        if isinstance(image, str):
+            food_name = os.path.splitext(os.path.basename(image))[0]  # 获取文件名（不含扩展名）
+        else:
+            food_name = "未知食物"
+
+    prompt = format_prompt(template, food_name, weight_grams)
+
+    if isinstance(image, str):
+        try:
+            with open(image, "rb") as image_file:
+                image = image_file.read()
+        except IOError as e:
+            print(f"读取图片失败: {e}")
+            return None
+
+    candidates = None
+    if classifier is not None and not food_label:
+        try:
+            with stage(trace, "classify"):
+                candidates = classifier.classify(image)
+        except ValueError as e:
+            print(f"本地分类失败: {e}")
+    if candidates:
+        print("本地分类结果: " + ", ".join(f"{label} {conf:.2f}" for label, conf in candidates)
+              + f"（{classifier.last_inference_ms:.1f} ms）")
+        top_label, top_conf = candidates[0]
+        if top_conf >= CLASSIFIER_LOCAL_THRESHOLD:
+            output = analyze_food_locally(top_label, weight_grams)
+            if output:
+                print(f"本地分类置信度 {top_conf:.2f} 达到阈值，使用本地营养表")
+                output["classification"] = [{"label": l, "confidence": round(c, 4)} for l, c in candidates]
+                return output
+        if top_conf >= CLASSIFIER_HINT_THRESHOLD:
+            food_name = describe_candidates(candidates)
+        else:
+            print(f"本地分类置信度 {top_conf:.2f} 过低，不作为提示")
+
+    phash = None
+    if cache is not None:
+        with stage(trace, "cache_lookup"):
+            phash = image_hash(image)
+            cached = cache.lookup(phash, weight_grams) if phash is not None else None
+        if cached:
+            print("命中结果缓存，跳过API调用")
+            output = build_nutrition_output(cached, weight_grams)
+            output["cached"] = True
+            return output
+
+    # 上传前缩放压缩，请求体大小决定了开发板上行链路的往返时间
+    with stage(trace, "prepare_upload"):
+        prepared = prepare_upload_image(image, upload_config)
+    print(f"上传图像: {prepared.original_bytes} → {len(prepared.data)} 字节"
+          f"（节省 {prepared.saved_bytes} 字节，{prepared.width}x{prepared.height}，{prepared.mime}）")
+
+    # 将图片编码为Base64
+    with stage(trace, "encode"):
+        image_base64 = encode_image_to_base64(prepared.data)
+    if not image_base64:
+        print("\n=== 错误：无法将图片编码为Base64 ===")
+        return None
+
+    # 调用 API
+    print("\n正在调用API分析食物营养成分...")
+    for attempt in range(MALFORMED_RETRIES + 1):
+        try:
+            with stage(trace, "api"):
+                if API_STREAM_ENABLED:
+                    api_response = call_deepseek_api_stream(prompt, image_base64, prepared.mime,
+                                                            on_partial=on_partial, trace=trace)
+                else:
+                    api_response = call_deepseek_api(prompt, image_base64, prepared.mime)
+                if not api_response:
+                    # 在阶段内抛出，api 阶段记为一次错误而不是一次成功的耗时
+                    raise ApiRequestError("API请求失败")
+        except ApiRequestError:
+            if trace is None:
+                registry.observe_error("api")
+            print("API请求失败，请检查网络或API密钥。")
+            return None
+
+        # 解析结果；只有回复本身无法解析时才重新请求
+        with stage(trace, "parse"):
+            nutrition_data = parse_nutrition_response(api_response)
+        registry.increment("replies", "ok" if nutrition_data else "malformed")
+        if nutrition_data:
+            break
+        if attempt < MALFORMED_RETRIES:
+            print("API回复格式错误，重新请求...")
+    else:
+        return None
+
+    output = build_nutrition_output(nutrition_data, weight_grams)
+    output["upload"] = prepared.report()
+    if candidates:
+        output["classification"] = [{"label": l, "confidence": round(c, 4)} for l, c in candidates]
+        if candidates[0][1] >= CLASSIFIER_HINT_THRESHOLD:
+            output["label"] = candidates[0][0]
+    if phash is not None:
+        cache.store(phash, weight_grams, output)
+    return output
+
+def print_nutrition_output(output: Dict):
+    """打印营养分析结果"""
     print("\n=== 食物营养分析结果 ===")
     print(f"食物: {output['food']}")
     print(f"重量: {output['weight']}")
@@ -260,11 +506,77 @@ def main():
     print(f"蛋白质: {output['protein']} 克")
     print(f"脂肪: {output['fat']} 克")
     print(f"饮食建议: {output['advice']}\n")
+
+def save_nutrition_output(output: Dict, result_path: str = "nutrition_result.json"):
+    """保存营养分析结果（原子写入，读取方不会读到写了一半的文件）"""
+    atomic_write_text(result_path, json.dumps(output, ensure_ascii=False, indent=2))
+    print(f"分析结果已保存到 {result_path}")
+
+def save_trace(trace: Trace, result_path: str = "nutrition_result.json") -> str:
+    """将阶段耗时记录保存在结果文件旁边，如 nutrition_result.trace.json"""
+    trace_path = os.path.splitext(result_path)[0] + ".trace.json"
+    atomic_write_json(trace_path, trace.to_dict())
+    return trace_path
+
+def main() -> int:
+    """返回进程退出码：0 为分析成功，1 为任一环节失败（启动器和服务器据此判断结果）"""
+    parser = argparse.ArgumentParser(description="食物营养分析程序")
+    parser.add_argument("--food", type=str, default=None,
+                        help="已知的食物类别（Food-101 类别名或中文名），在本地营养表中时无需联网")
+    parser.add_argument("--offline", action="store_true",
+                        help="只使用本地营养表，不调用API")
+    args = parser.parse_args()
+
+    # 设置CPU亲和性，绑定到CPU 0（主核）
+    set_cpu_affinity(0)
+
+    local_known = args.food is not None and get_nutrition_table().find(args.food) is not None
+    if args.offline and not local_known:
+        print(f"错误：离线模式下本地营养表中没有该食物: {args.food}")
+        return 1
+
+    if not local_known:
+        # 等待采集数据期间预热API连接，握手时间与采集重叠
+        threading.Thread(target=api_client.prewarm, daemon=True).start()
     
-    with open("nutrition_result.json", "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
-    print("分析结果已保存到 nutrition_result.json")
+    trace = Trace()
+    with trace.span("wait_for_data"):
+        capture_status, weight_grams = wait_for_data(need_image=not local_known)
+
+    if weight_grams is None:
+        print("错误：未能获取重量数据")
+        return 1
+
+    if local_known:
+        output = analyze_food_locally(args.food, weight_grams)
+        print_nutrition_output(output)
+        save_nutrition_output(output)
+        HistoryStore().add(output)
+        return 0
+    
+    if not capture_status:
+        print("错误：未能获取图像数据")
+        return 1
+
+    image = load_captured_image(capture_status)
+    if image is None:
+        print("错误：未能读取图像数据")
+        return 1
+
+    cache = ResultCache() if RESULT_CACHE_ENABLED else None
+    classifier = get_food_classifier() if CLASSIFIER_ENABLED and get_food_classifier else None
+    output = analyze_food(image, weight_grams, food_name=f"food_{capture_status.get('timestamp')}",
+                          cache=cache, classifier=classifier, trace=trace)
+    if not output:
+        return 1
+
+    # 打印JSON格式的输出
+    print_nutrition_output(output)
+    save_nutrition_output(output)
+    save_trace(trace)
+    HistoryStore().add(output, ts=capture_status.get("timestamp"))
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 
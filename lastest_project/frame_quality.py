@@ -0,0 +1,103 @@
+import os
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+# 一次连拍评分的帧数
+BURST_SIZE = int(os.environ.get("FOOD_BURST_SIZE", "5"))
+# 整组都不合格时重新连拍的次数
+BURST_ATTEMPTS = int(os.environ.get("FOOD_BURST_ATTEMPTS", "2"))
+# 质量门限（FOOD_FRAME_QUALITY=0 关闭，只按清晰度选帧、不拒绝）
+QUALITY_GATE_ENABLED = os.environ.get("FOOD_FRAME_QUALITY", "1") != "0"
+
+
+class QualityThresholds(NamedTuple):
+    """
+    质量门限，均在 1/8 分辨率灰度图上计算。
+
+    清晰度为拉普拉斯方差，亮度为平均灰度（0-255），运动为与相邻帧的平均绝对差。
+    """
+    min_sharpness: float = 15.0
+    min_brightness: float = 40.0
+    max_brightness: float = 225.0
+    max_motion: float = 8.0
+
+    @classmethod
+    def from_env(cls) -> "QualityThresholds":
+        defaults = cls()
+        return cls(
+            min_sharpness=float(os.environ.get("FOOD_MIN_SHARPNESS", defaults.min_sharpness)),
+            min_brightness=float(os.environ.get("FOOD_MIN_BRIGHTNESS", defaults.min_brightness)),
+            max_brightness=float(os.environ.get("FOOD_MAX_BRIGHTNESS", defaults.max_brightness)),
+            max_motion=float(os.environ.get("FOOD_MAX_MOTION", defaults.max_motion))
+        )
+
+
+class FrameQuality(NamedTuple):
+    """一帧的质量评分"""
+    sharpness: float
+    brightness: float
+    motion: float
+
+    def problems(self, thresholds: QualityThresholds) -> List[str]:
+        """不满足的门限，全部满足时返回空列表"""
+        problems = []
+        if self.sharpness < thresholds.min_sharpness:
+            problems.append(f"图像模糊（清晰度 {self.sharpness:.1f} < {thresholds.min_sharpness:g}）")
+        if self.brightness < thresholds.min_brightness:
+            problems.append(f"画面过暗（亮度 {self.brightness:.0f} < {thresholds.min_brightness:g}）")
+        elif self.brightness > thresholds.max_brightness:
+            problems.append(f"画面过曝（亮度 {self.brightness:.0f} > {thresholds.max_brightness:g}）")
+        if self.motion > thresholds.max_motion:
+            problems.append(f"画面在运动（帧间差 {self.motion:.1f} > {thresholds.max_motion:g}）")
+        return problems
+
+
+class FrameQualityError(RuntimeError):
+    """连拍的所有帧都不满足质量门限，不应上传"""
+
+
+def assess_burst(previews: Sequence[Optional[np.ndarray]]) -> List[Optional[FrameQuality]]:
+    """
+    为一组连续帧的灰度缩略图评分（无法解码的帧为None）。
+
+    运动量取与前一帧的平均绝对差，第一帧与后一帧比较；只有一帧时运动量为0。
+    """
+    qualities: List[Optional[FrameQuality]] = []
+    for i, gray in enumerate(previews):
+        if gray is None:
+            qualities.append(None)
+            continue
+        neighbour = None
+        for j in (i - 1, i + 1):
+            if 0 <= j < len(previews) and previews[j] is not None and previews[j].shape == gray.shape:
+                neighbour = previews[j]
+                break
+        motion = float(cv2.absdiff(gray, neighbour).mean()) if neighbour is not None else 0.0
+        qualities.append(FrameQuality(
+            sharpness=float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+            brightness=float(gray.mean()),
+            motion=motion
+        ))
+    return qualities
+
+
+def choose_best(qualities: Sequence[Optional[FrameQuality]],
+                thresholds: Optional[QualityThresholds] = None) -> Tuple[Optional[int], List[str]]:
+    """
+    选出满足门限的帧中最清晰的一帧。
+
+    :param thresholds: 为None时不做门限检查，只按清晰度选择
+    :return: (帧序号, [])；没有合格帧时返回 (None, 最清晰一帧的问题列表)
+    """
+    scored = [(quality.sharpness, i) for i, quality in enumerate(qualities) if quality is not None]
+    if not scored:
+        return None, ["没有可解码的帧"]
+    scored.sort(reverse=True)
+    if thresholds is None:
+        return scored[0][1], []
+    for _, i in scored:
+        if not qualities[i].problems(thresholds):
+            return i, []
+    return None, qualities[scored[0][1]].problems(thresholds)
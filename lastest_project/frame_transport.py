@@ -0,0 +1,108 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Dict, Optional, Tuple
+
+# 共享内存帧文件：位于 tmpfs（/dev/shm），不经过SD卡
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+DEFAULT_SHM_PATH = os.path.join(SHM_DIR, "food_frame")
+DEFAULT_CAPACITY = 4 * 1024 * 1024  # 足够容纳一张 1280x720 JPEG 及元数据
+
+# 头部：魔数、序号、时间戳、数据长度、元数据长度
+_MAGIC = b"FFRM"
+_HEADER = struct.Struct("<4sQdII")
+
+
+class FrameTransportError(RuntimeError):
+    """共享内存帧读写失败"""
+
+
+class FrameWriter:
+    """
+    共享内存帧写入端（摄像头进程）。
+
+    采用序号锁（seqlock）：写入期间序号为奇数，写完后变为偶数，
+    读取端据此判断是否读到了一致的帧，无需跨进程加锁。
+    """
+
+    def __init__(self, path: str = DEFAULT_SHM_PATH, capacity: int = DEFAULT_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < capacity:
+                os.ftruncate(fd, capacity)
+            self._mm = mmap.mmap(fd, capacity)
+        finally:
+            os.close(fd)
+        magic, seq, _, _, _ = _HEADER.unpack_from(self._mm, 0)
+        # 沿用已有序号，读取端不会把新帧误认为旧帧
+        self._seq = seq + (seq & 1) if magic == _MAGIC else 0
+
+    def publish(self, data: bytes, meta: Optional[Dict] = None) -> int:
+        """写入一帧编码后的图像及其元数据，返回该帧的序号"""
+        meta_bytes = json.dumps(meta or {}, ensure_ascii=False).encode("utf-8")
+        needed = _HEADER.size + len(meta_bytes) + len(data)
+        if needed > self.capacity:
+            raise FrameTransportError(f"帧大小 {needed} 字节超过共享内存容量 {self.capacity}")
+
+        mm = self._mm
+        self._seq += 1  # 奇数：写入中
+        _HEADER.pack_into(mm, 0, _MAGIC, self._seq, 0.0, 0, 0)
+        offset = _HEADER.size
+        mm[offset:offset + len(meta_bytes)] = meta_bytes
+        offset += len(meta_bytes)
+        mm[offset:offset + len(data)] = data
+        self._seq += 1  # 偶数：写入完成
+        _HEADER.pack_into(mm, 0, _MAGIC, self._seq, time.time(), len(data), len(meta_bytes))
+        return self._seq
+
+    def close(self):
+        self._mm.close()
+
+
+class FrameReader:
+    """共享内存帧读取端（分析进程）"""
+
+    def __init__(self, path: str = DEFAULT_SHM_PATH):
+        self.path = path
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            raise FrameTransportError(f"共享内存帧不存在: {path}")
+        try:
+            self._mm = mmap.mmap(fd, 0, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+
+    def read(self, expected_seq: Optional[int] = None, retries: int = 100) -> Tuple[bytes, Dict]:
+        """
+        读取当前帧。
+
+        :param expected_seq: 期望的帧序号，帧已被覆盖时抛出异常
+        :param retries: 与写入端冲突时的重试次数
+        :return: (编码后的图像数据, 元数据)
+        """
+        mm = self._mm
+        for _ in range(retries):
+            magic, seq, _, data_len, meta_len = _HEADER.unpack_from(mm, 0)
+            if magic != _MAGIC:
+                raise FrameTransportError("共享内存中没有有效的帧")
+            if seq & 1:
+                time.sleep(0.001)
+                continue
+            offset = _HEADER.size
+            meta_bytes = mm[offset:offset + meta_len]
+            data = mm[offset + meta_len:offset + meta_len + data_len]
+            if _HEADER.unpack_from(mm, 0)[1] != seq:
+                continue  # 读取期间被改写，重试
+            if expected_seq is not None and seq != expected_seq:
+                raise FrameTransportError(f"帧 {expected_seq} 已被新帧 {seq} 覆盖")
+            return data, json.loads(meta_bytes.decode("utf-8"))
+        raise FrameTransportError("读取共享内存帧失败：写入端持续占用")
+
+    def close(self):
+        self._mm.close()
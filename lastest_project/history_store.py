@@ -0,0 +1,192 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from nutrition_parser import MACRO_FIELDS, parse_quantity
+
+DEFAULT_HISTORY_PATH = os.path.join("data", "history.sqlite3")
+
+# 导出时每次从数据库读取的行数
+EXPORT_BATCH_SIZE = 500
+
+_COLUMNS = ("id", "ts", "job_id", "food", "label", "weight") + MACRO_FIELDS + ("advice", "source")
+
+
+def _row_to_dict(row) -> Dict:
+    record = dict(zip(_COLUMNS, row))
+    record["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["ts"]))
+    return record
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    """分页游标 "<时间戳>:<id>"，格式不对时视为从头开始"""
+    if not cursor:
+        return None
+    try:
+        ts, row_id = cursor.split(":", 1)
+        return float(ts), int(row_id)
+    except ValueError:
+        return None
+
+
+class HistoryStore:
+    """
+    分析历史记录。
+
+    每次分析一行，营养数值存为数值列，按时间和食物建索引；
+    分页使用 (时间, id) 游标而不是 OFFSET，记录积累到几年的量翻页也不会变慢。
+    数据库使用 WAL 模式，服务器读取和分析线程写入互不阻塞。
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = self._connect()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                job_id TEXT,
+                food TEXT NOT NULL,
+                label TEXT,
+                weight REAL,
+                calories REAL,
+                carbohydrates REAL,
+                protein REAL,
+                fat REAL,
+                advice TEXT,
+                source TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_history_ts ON history (ts, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_history_food ON history (food, ts)")
+        self._conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 NORMAL 只在检查点时 fsync，断电最多丢失最近的几次提交
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def add(self, output: Dict, ts: Optional[float] = None) -> int:
+        """写入一次分析结果，返回记录id"""
+        values = [parse_quantity(output.get(field)) for field in MACRO_FIELDS]
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO history (ts, job_id, food, label, weight, calories, carbohydrates, protein, fat, "
+                "advice, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (ts if ts is not None else time.time(), output.get("job_id"), output.get("food") or "未知食物",
+                 output.get("label"), parse_quantity(output.get("weight")), *values, output.get("advice"),
+                 output.get("source") or ("cache" if output.get("cached") else "api"))
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    @staticmethod
+    def _filters(food: Optional[str], query: Optional[str], since: Optional[float],
+                 until: Optional[float]) -> Tuple[str, List]:
+        clauses, params = [], []
+        if food:
+            clauses.append("food = ?")
+            params.append(food)
+        if query:
+            clauses.append("food LIKE ? ESCAPE '\\'")
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        return (" AND ".join(clauses) or "1"), params
+
+    def page(self, limit: int = 50, cursor: Optional[str] = None, food: Optional[str] = None,
+             query: Optional[str] = None, since: Optional[float] = None,
+             until: Optional[float] = None) -> Dict:
+        """
+        按时间倒序分页。
+
+        :param cursor: 上一页返回的 next，为None时从最新记录开始
+        :param food: 精确匹配食物名称（走索引）
+        :param query: 食物名称包含的文字
+        :return: {"items": [...], "next": 下一页游标或None}
+        """
+        limit = max(1, min(limit, 500))
+        where, params = self._filters(food, query, since, until)
+        position = parse_cursor(cursor)
+        if position is not None:
+            where += " AND (ts < ? OR (ts = ? AND id < ?))"
+            params += [position[0], position[0], position[1]]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM history WHERE {where} ORDER BY ts DESC, id DESC LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+        items = [_row_to_dict(row) for row in rows[:limit]]
+        next_cursor = f"{items[-1]['ts']}:{items[-1]['id']}" if len(rows) > limit else None
+        return {"items": items, "next": next_cursor}
+
+    def aggregate(self, group: str = "day", since: Optional[float] = None,
+                  until: Optional[float] = None, limit: int = 100) -> List[Dict]:
+        """
+        汇总摄入量。
+
+        :param group: day 按本地日期汇总，food 按食物汇总
+        """
+        if group == "food":
+            key = "food"
+            order = "calories DESC"
+        else:
+            key = "date(ts, 'unixepoch', 'localtime')"
+            order = "key DESC"
+        where, params = self._filters(None, None, since, until)
+        sums = ", ".join(f"ROUND(SUM({field}), 1) AS {field}" for field in MACRO_FIELDS)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {key} AS key, COUNT(*), ROUND(SUM(weight), 1), {sums} FROM history "
+                f"WHERE {where} GROUP BY key ORDER BY {order} LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [dict(zip(("key", "count", "weight") + MACRO_FIELDS, row)) for row in rows]
+
+    def export_ndjson(self, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[str]:
+        """
+        按时间顺序逐行生成 NDJSON。
+
+        使用单独的只读连接分批读取，导出期间不占用写入锁，内存占用与记录总数无关。
+        """
+        where, params = self._filters(None, None, since, until)
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM history WHERE {where} ORDER BY ts, id", params)
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                yield "".join(json.dumps(_row_to_dict(row), ensure_ascii=False) + "\n" for row in rows)
+        finally:
+            conn.close()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def clear(self) -> int:
+        """删除全部记录，返回删除的条数"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM history")
+            self._conn.commit()
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
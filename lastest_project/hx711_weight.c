@@ -1,56 +1,99 @@
+#define _GNU_SOURCE
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdint.h>
 #include <unistd.h>
 #include <gpiod.h>
 #include <time.h>
 #include <sched.h>
 #include <string.h>
+#include <errno.h>
+#include <getopt.h>
+#include <poll.h>
+#include <signal.h>
+#include <sys/socket.h>
+#include <sys/un.h>
 
-#define SCK_PIN  17  
-#define DOUT_PIN 18  
+#define DEFAULT_SCK_PIN  17
+#define DEFAULT_DOUT_PIN 18
+#define DEFAULT_SCALE    106.5f
+
+// 滤波与稳定判定参数（HX711 在 RATE 接低时为 10 次/秒）
+#define MEDIAN_WINDOW    7       // 滑动中值窗口（样本数）
+#define STABLE_WINDOW    8       // 稳定判定窗口（约0.8秒）
+#define STABLE_BAND      1.0f    // 窗口内最大最小差小于该值（克）视为稳定
+#define MIN_LOAD         5.0f    // 小于该重量视为秤上无物
+#define LOAD_DELTA       5.0f    // 与上次稳定读数相差超过该值才算新的放置
+#define ZERO_BAND        2.0f    // 空秤零点跟踪范围（克）
+#define ZERO_TRACK_RATE  0.05f   // 零点跟踪的平滑系数
+#define TARE_SAVE_SECS   60      // 零点变化后最短保存间隔
+#define READY_TIMEOUT_MS 1000    // 等待数据就绪的超时
+#define MAX_CLIENTS      8
 
 // 全局变量
-struct gpiod_chip *chip;  
-struct gpiod_line *sck, *dout; 
-const char *chipname = "gpiochip0"; 
+struct gpiod_chip *chip;
+struct gpiod_line *sck, *dout;
+const char *chipname = "gpiochip0";
+static volatile sig_atomic_t running = 1;
 
-int init_hx711() {
+int init_hx711(int sck_pin, int dout_pin) {
     chip = gpiod_chip_open_by_name(chipname);
     if (!chip) {
         perror("Error opening GPIO chip");
         return -1;
     }
-    
+
     // 获取 SCK 和 DOUT 引脚
-    sck = gpiod_chip_get_line(chip, SCK_PIN);
-    dout = gpiod_chip_get_line(chip, DOUT_PIN);
+    sck = gpiod_chip_get_line(chip, sck_pin);
+    dout = gpiod_chip_get_line(chip, dout_pin);
     if (!sck || !dout) {
         perror("Error getting GPIO lines");
         return -1;
     }
-    
+
     if (gpiod_line_request_output(sck, "hx711", 0) < 0) {
         perror("Error setting SCK as output");
         return -1;
     }
-    if (gpiod_line_request_input(dout, "hx711") < 0) {
-        perror("Error setting DOUT as input");
+    // DOUT 按下降沿事件申请：转换完成时 DOUT 拉低，由内核唤醒，不再轮询
+    if (gpiod_line_request_falling_edge_events(dout, "hx711") < 0) {
+        perror("Error requesting DOUT edge events");
         return -1;
     }
-    
+
     // 初始状态：SCK 低电平
     gpiod_line_set_value(sck, 0);
     return 0;
 }
 
-// 读取 HX711 数据（24位 ADC 值）
-int32_t hx711_read() {
-    int32_t count = 0;
-    
-    while (gpiod_line_get_value(dout) == 1) {
-        usleep(10); // 防止忙等待
+// 丢弃已排队的边沿事件（读数时 DOUT 逐位输出会产生大量边沿）
+static void drain_events() {
+    struct timespec zero = {0, 0};
+    struct gpiod_line_event event;
+    while (gpiod_line_event_wait(dout, &zero) == 1) {
+        gpiod_line_event_read(dout, &event);
+    }
+}
+
+// 等待数据就绪（DOUT 为低），返回 1 就绪、0 超时、-1 出错
+int hx711_wait_ready(int timeout_ms) {
+    drain_events();
+    if (gpiod_line_get_value(dout) == 0) {
+        return 1;
+    }
+    struct timespec timeout = {timeout_ms / 1000, (timeout_ms % 1000) * 1000000L};
+    int ret = gpiod_line_event_wait(dout, &timeout);
+    if (ret == 1) {
+        struct gpiod_line_event event;
+        gpiod_line_event_read(dout, &event);
     }
-    
+    return ret;
+}
+
+// 移出 24 位数据（调用前 DOUT 必须已为低）
+int32_t hx711_read_bits() {
+    int32_t count = 0;
+
     for (int i = 0; i < 24; i++) {
         gpiod_line_set_value(sck, 1); // 上升沿触发
         usleep(1);                    // 保持高电平
@@ -61,7 +104,7 @@ int32_t hx711_read() {
             count |= 1; // 设置当前位为 1
         }
     }
-    
+
     gpiod_line_set_value(sck, 1);
     count ^= 0x800000; // 补码转原码
     usleep(1);
@@ -69,6 +112,15 @@ int32_t hx711_read() {
     return count;
 }
 
+// 读取 HX711 数据（24位 ADC 值），超时返回 -1
+int hx711_read(int32_t *value) {
+    if (hx711_wait_ready(READY_TIMEOUT_MS) != 1) {
+        return -1;
+    }
+    *value = hx711_read_bits();
+    return 0;
+}
+
 void cleanup() {
     if (sck) gpiod_line_release(sck);
     if (dout) gpiod_line_release(dout);
@@ -79,7 +131,7 @@ int set_cpu_affinity(int cpu_id) {
     cpu_set_t mask;
     CPU_ZERO(&mask);
     CPU_SET(cpu_id, &mask);
-    
+
     if (sched_setaffinity(0, sizeof(mask), &mask) < 0) {
         perror("sched_setaffinity");
         return -1;
@@ -87,44 +139,397 @@ int set_cpu_affinity(int cpu_id) {
     return 0;
 }
 
-int main() {
-    if (set_cpu_affinity(2) < 0) {
-        fprintf(stderr, "Failed to set CPU affinity\n");
-        return 1;
+// 先写临时文件再 rename，读取方（inotify）只会看到完整的数据
+int atomic_write(const char *path, const char *content) {
+    char tmp_path[512];
+    snprintf(tmp_path, sizeof(tmp_path), "%s.tmp", path);
+    FILE *fp = fopen(tmp_path, "w");
+    if (!fp) {
+        perror("Failed to open temp file");
+        return -1;
     }
-    
-    // 初始化
-    if (init_hx711() < 0) {
-        fprintf(stderr, "HX711 initialization failed\n");
+    fputs(content, fp);
+    fflush(fp);
+    fsync(fileno(fp));
+    fclose(fp);
+    if (rename(tmp_path, path) != 0) {
+        perror("Failed to rename temp file");
+        return -1;
+    }
+    return 0;
+}
+
+int write_weight(float weight) {
+    char buf[32];
+    snprintf(buf, sizeof(buf), "%.2f", weight);
+    return atomic_write("weight_data.txt", buf);
+}
+
+// 零点文件：保存空秤时的原始读数，重启后沿用，不必在启动瞬间去皮
+int load_tare(const char *path, float *tare) {
+    FILE *fp = fopen(path, "r");
+    if (!fp) {
+        return -1;
+    }
+    int ok = fscanf(fp, "%f", tare) == 1;
+    fclose(fp);
+    return ok ? 0 : -1;
+}
+
+int save_tare(const char *path, float tare) {
+    char buf[32];
+    snprintf(buf, sizeof(buf), "%.1f\n", tare);
+    return atomic_write(path, buf);
+}
+
+static int compare_int32(const void *a, const void *b) {
+    int32_t x = *(const int32_t *)a, y = *(const int32_t *)b;
+    return (x > y) - (x < y);
+}
+
+// 取最近若干个原始读数的中值，滤除偶发的尖峰
+float median_of(const int32_t *values, int n) {
+    int32_t sorted[MEDIAN_WINDOW];
+    memcpy(sorted, values, n * sizeof(int32_t));
+    qsort(sorted, n, sizeof(int32_t), compare_int32);
+    return n % 2 ? sorted[n / 2] : (sorted[n / 2 - 1] + sorted[n / 2]) / 2.0f;
+}
+
+// 取若干个样本的中值作为零点
+int measure_tare(int samples, float *tare) {
+    int32_t raw[MEDIAN_WINDOW];
+    if (samples > MEDIAN_WINDOW) samples = MEDIAN_WINDOW;
+    for (int i = 0; i < samples; i++) {
+        if (hx711_read(&raw[i]) < 0) {
+            return -1;
+        }
+    }
+    *tare = median_of(raw, samples);
+    return 0;
+}
+
+double now_seconds() {
+    struct timespec ts;
+    clock_gettime(CLOCK_REALTIME, &ts);
+    return ts.tv_sec + ts.tv_nsec / 1e9;
+}
+
+void handle_signal(int sig) {
+    (void)sig;
+    running = 0;
+}
+
+// 向所有连接的客户端发送一行，发送失败（断开或积压）的客户端直接关闭
+void broadcast(int *clients, const char *line) {
+    size_t len = strlen(line);
+    for (int i = 0; i < MAX_CLIENTS; i++) {
+        if (clients[i] < 0) continue;
+        if (send(clients[i], line, len, MSG_NOSIGNAL | MSG_DONTWAIT) != (ssize_t)len) {
+            close(clients[i]);
+            clients[i] = -1;
+        }
+    }
+}
+
+int open_socket(const char *path) {
+    int fd = socket(AF_UNIX, SOCK_STREAM, 0);
+    if (fd < 0) {
+        perror("socket");
+        return -1;
+    }
+    struct sockaddr_un addr;
+    memset(&addr, 0, sizeof(addr));
+    addr.sun_family = AF_UNIX;
+    strncpy(addr.sun_path, path, sizeof(addr.sun_path) - 1);
+    unlink(path);
+    if (bind(fd, (struct sockaddr *)&addr, sizeof(addr)) < 0 || listen(fd, MAX_CLIENTS) < 0) {
+        perror("bind/listen");
+        close(fd);
+        return -1;
+    }
+    return fd;
+}
+
+/*
+ * 常驻称重：持续读取并滤波，每个读数以一行 JSON 广播给 Unix socket 上的所有客户端：
+ *   {"ts":..., "weight":..., "raw":..., "stable":true, "event":"reading|settled|removed"}
+ * 新放上的物体稳定时发出 settled 事件并写入 weight_data.txt；
+ * 客户端发送 "tare" 以当前读数重新去皮。
+ */
+int run_daemon(const char *socket_path, const char *tare_path, float scale) {
+    float tare;
+    if (load_tare(tare_path, &tare) == 0) {
+        printf("Loaded tare from %s: %.1f\n", tare_path, tare);
+    } else {
+        if (measure_tare(MEDIAN_WINDOW, &tare) < 0) {
+            fprintf(stderr, "HX711 not responding\n");
+            return 1;
+        }
+        save_tare(tare_path, tare);
+        printf("Tare value (zero offset): %.1f\n", tare);
+    }
+
+    int listen_fd = open_socket(socket_path);
+    if (listen_fd < 0) {
         return 1;
     }
-    
-    int32_t tare_value = hx711_read();
-    printf("Tare value (zero offset): %d\n", tare_value);
-    
+    int clients[MAX_CLIENTS];
+    for (int i = 0; i < MAX_CLIENTS; i++) clients[i] = -1;
+
+    int32_t raw_window[MEDIAN_WINDOW];
+    float stable_window[STABLE_WINDOW];
+    int raw_count = 0, stable_count = 0;
+    int was_stable = 0, loaded = 0;
+    float settled_weight = 0, saved_tare = tare;
+    time_t last_tare_save = time(NULL);
+    time_t last_sample = time(NULL);
+
+    printf("Scale daemon listening on %s\n", socket_path);
+    fflush(stdout);
+
+    while (running) {
+        struct pollfd fds[2 + MAX_CLIENTS];
+        int nfds = 0;
+        fds[nfds].fd = gpiod_line_event_get_fd(dout);
+        fds[nfds++].events = POLLIN;
+        fds[nfds].fd = listen_fd;
+        fds[nfds++].events = POLLIN;
+        for (int i = 0; i < MAX_CLIENTS; i++) {
+            if (clients[i] >= 0) {
+                fds[nfds].fd = clients[i];
+                fds[nfds++].events = POLLIN;
+            }
+        }
+
+        if (poll(fds, nfds, READY_TIMEOUT_MS) < 0) {
+            if (errno == EINTR) continue;
+            perror("poll");
+            break;
+        }
+
+        // 新客户端
+        if (fds[1].revents & POLLIN) {
+            int client = accept(listen_fd, NULL, NULL);
+            int slot = -1;
+            for (int i = 0; i < MAX_CLIENTS && client >= 0; i++) {
+                if (clients[i] < 0) { slot = i; break; }
+            }
+            if (slot >= 0) clients[slot] = client;
+            else if (client >= 0) close(client);
+        }
+
+        // 客户端命令
+        for (int k = 2; k < nfds; k++) {
+            if (!(fds[k].revents & (POLLIN | POLLHUP))) continue;
+            char cmd[64];
+            ssize_t n = recv(fds[k].fd, cmd, sizeof(cmd) - 1, MSG_DONTWAIT);
+            if (n <= 0) {
+                for (int i = 0; i < MAX_CLIENTS; i++) {
+                    if (clients[i] == fds[k].fd) { close(clients[i]); clients[i] = -1; }
+                }
+                continue;
+            }
+            cmd[n] = '\0';
+            if (strncmp(cmd, "tare", 4) == 0 && raw_count > 0) {
+                tare = median_of(raw_window, raw_count < MEDIAN_WINDOW ? raw_count : MEDIAN_WINDOW);
+                save_tare(tare_path, tare);
+                saved_tare = tare;
+                loaded = 0;
+                settled_weight = 0;
+                printf("Re-tared: %.1f\n", tare);
+            }
+        }
+
+        // 数据就绪
+        if (!(fds[0].revents & POLLIN)) {
+            if (time(NULL) - last_sample > 2) {
+                fprintf(stderr, "HX711 not responding\n");
+                last_sample = time(NULL);
+            }
+            continue;
+        }
+        drain_events();
+        if (gpiod_line_get_value(dout) != 0) {
+            continue;  // 读数移位产生的边沿，不是新数据
+        }
+        int32_t raw = hx711_read_bits();
+        last_sample = time(NULL);
+
+        raw_window[raw_count % MEDIAN_WINDOW] = raw;
+        raw_count++;
+        int n = raw_count < MEDIAN_WINDOW ? raw_count : MEDIAN_WINDOW;
+        float filtered = median_of(raw_window, n);
+        float weight = (filtered - tare) / scale;
+
+        stable_window[stable_count % STABLE_WINDOW] = weight;
+        stable_count++;
+        int stable = 0;
+        if (stable_count >= STABLE_WINDOW) {
+            float lo = stable_window[0], hi = stable_window[0];
+            for (int i = 1; i < STABLE_WINDOW; i++) {
+                if (stable_window[i] < lo) lo = stable_window[i];
+                if (stable_window[i] > hi) hi = stable_window[i];
+            }
+            stable = hi - lo < STABLE_BAND;
+        }
+
+        const char *event = "reading";
+        if (stable && !was_stable) {
+            if (weight >= MIN_LOAD && (!loaded || weight - settled_weight > LOAD_DELTA
+                                       || settled_weight - weight > LOAD_DELTA)) {
+                event = "settled";
+                loaded = 1;
+                settled_weight = weight;
+                write_weight(weight);
+            } else if (weight < MIN_LOAD && loaded) {
+                event = "removed";
+                loaded = 0;
+                settled_weight = 0;
+            }
+        }
+
+        // 空秤且稳定时缓慢跟踪零点，补偿温漂
+        if (stable && weight > -ZERO_BAND && weight < ZERO_BAND) {
+            tare += (filtered - tare) * ZERO_TRACK_RATE;
+            if ((tare - saved_tare) * (tare - saved_tare) > (scale / 2) * (scale / 2)
+                && time(NULL) - last_tare_save >= TARE_SAVE_SECS) {
+                save_tare(tare_path, tare);
+                saved_tare = tare;
+                last_tare_save = time(NULL);
+            }
+        }
+        was_stable = stable;
+
+        char line[192];
+        snprintf(line, sizeof(line),
+                 "{\"ts\":%.3f,\"weight\":%.2f,\"raw\":%d,\"stable\":%s,\"event\":\"%s\"}\n",
+                 now_seconds(), weight, raw, stable ? "true" : "false", event);
+        broadcast(clients, line);
+        if (strcmp(event, "reading") != 0) {
+            printf("%s", line);
+            fflush(stdout);
+        }
+    }
+
+    for (int i = 0; i < MAX_CLIENTS; i++) {
+        if (clients[i] >= 0) close(clients[i]);
+    }
+    close(listen_fd);
+    unlink(socket_path);
+    return 0;
+}
+
+// 单次称重：10 个样本取平均，写入 weight_data.txt 后退出
+int run_once(const char *tare_path, float scale) {
+    float tare;
+    // 有保存的零点（常驻模式或 --tare 写入）时沿用，避免在食物已放上时去皮
+    if (load_tare(tare_path, &tare) != 0) {
+        int32_t raw;
+        if (hx711_read(&raw) < 0) {
+            fprintf(stderr, "HX711 not responding\n");
+            return 1;
+        }
+        tare = raw;
+    }
+    printf("Tare value (zero offset): %.1f\n", tare);
+
     float weight_sum = 0;
     int samples = 10;
-    
+
+    // 每次读数都等待 HX711 转换完成，采样间隔由芯片输出速率决定
     for(int i = 0; i < samples; i++) {
-        int32_t raw = hx711_read();
-        float weight = (raw - tare_value) / 106.5f; 
-        weight_sum += weight;
-        usleep(100000); // 100ms
+        int32_t raw;
+        if (hx711_read(&raw) < 0) {
+            fprintf(stderr, "HX711 not responding\n");
+            return 1;
+        }
+        weight_sum += (raw - tare) / scale;
     }
-    
+
     float average_weight = weight_sum / samples;
     printf("Average weight: %.2f grams\n", average_weight);
-    
-    FILE *fp = fopen("weight_data.txt", "w");
-    if (fp) {
-        fprintf(fp, "%.2f", average_weight);
-        fclose(fp);
-        printf("Weight data saved to weight_data.txt\n");
-    } else {
-        perror("Failed to save weight data");
+
+    if (write_weight(average_weight) != 0) {
+        return 1;
     }
-    
-    cleanup();
+    printf("Weight data saved to weight_data.txt\n");
     return 0;
 }
 
+void usage(const char *prog) {
+    fprintf(stderr,
+            "Usage: %s [--daemon] [--tare] [--socket PATH] [--tare-file PATH]\n"
+            "          [--scale F] [--sck PIN] [--dout PIN] [--cpu N]\n"
+            "  (default)  weigh once and write weight_data.txt\n"
+            "  --daemon   weigh continuously and stream readings over a Unix socket\n"
+            "  --tare     measure the empty scale, save it to the tare file and exit\n",
+            prog);
+}
+
+int main(int argc, char **argv) {
+    int daemon_mode = 0, tare_only = 0, cpu = 2;
+    int sck_pin = DEFAULT_SCK_PIN, dout_pin = DEFAULT_DOUT_PIN;
+    float scale = DEFAULT_SCALE;
+    const char *socket_path = "/tmp/food_scale.sock";
+    const char *tare_path = "scale_tare.txt";
+
+    static struct option options[] = {
+        {"daemon", no_argument, 0, 'd'},
+        {"tare", no_argument, 0, 't'},
+        {"socket", required_argument, 0, 's'},
+        {"tare-file", required_argument, 0, 'f'},
+        {"scale", required_argument, 0, 'k'},
+        {"sck", required_argument, 0, 'c'},
+        {"dout", required_argument, 0, 'o'},
+        {"cpu", required_argument, 0, 'p'},
+        {"help", no_argument, 0, 'h'},
+        {0, 0, 0, 0}
+    };
+    int opt;
+    while ((opt = getopt_long(argc, argv, "dts:f:k:c:o:p:h", options, NULL)) != -1) {
+        switch (opt) {
+            case 'd': daemon_mode = 1; break;
+            case 't': tare_only = 1; break;
+            case 's': socket_path = optarg; break;
+            case 'f': tare_path = optarg; break;
+            case 'k': scale = strtof(optarg, NULL); break;
+            case 'c': sck_pin = atoi(optarg); break;
+            case 'o': dout_pin = atoi(optarg); break;
+            case 'p': cpu = atoi(optarg); break;
+            default: usage(argv[0]); return opt == 'h' ? 0 : 1;
+        }
+    }
+    if (scale == 0) {
+        fprintf(stderr, "Invalid scale factor\n");
+        return 1;
+    }
+
+    if (cpu >= 0 && set_cpu_affinity(cpu) < 0) {
+        fprintf(stderr, "Failed to set CPU affinity\n");
+        return 1;
+    }
+
+    // 初始化
+    if (init_hx711(sck_pin, dout_pin) < 0) {
+        fprintf(stderr, "HX711 initialization failed\n");
+        cleanup();
+        return 1;
+    }
+
+    signal(SIGINT, handle_signal);
+    signal(SIGTERM, handle_signal);
+
+    int ret;
+    if (tare_only) {
+        float tare;
+        ret = measure_tare(MEDIAN_WINDOW, &tare) == 0 && save_tare(tare_path, tare) == 0 ? 0 : 1;
+        if (ret == 0) printf("Tare saved to %s: %.1f\n", tare_path, tare);
+    } else if (daemon_mode) {
+        ret = run_daemon(socket_path, tare_path, scale);
+    } else {
+        ret = run_once(tare_path, scale);
+    }
+
+    cleanup();
+    return ret;
+}
@@ -0,0 +1,197 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, Optional
+
+
+class QueueFullError(RuntimeError):
+    """待处理任务已达上限"""
+
+
+class Job:
+    """一次分析任务"""
+
+    def __init__(self, station: Optional[str] = None, auto: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.station = station
+        # 由服务器自动提交（秤上读数稳定）而非某个页面请求的任务，所有页面都可以跟踪
+        self.auto = auto
+        self.status = "queued"  # queued, running, completed, error
+        self.message = "排队中"
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Optional[Dict] = None
+        # 进入分析队列前准备好的数据（多工位模式下为工位进程采集的图像和重量）
+        self.payload = None
+
+    def to_dict(self, include_result: bool = True) -> Dict:
+        data = {
+            "job_id": self.id,
+            "station": self.station,
+            "auto": self.auto,
+            "status": self.status,
+            "message": self.message,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class JobQueue:
+    """
+    有界分析任务队列。
+
+    固定数量的工作线程从队列中取任务执行；待处理任务达到 max_pending 时
+    拒绝新任务（背压），而不是无限堆积。已结束的任务保留最近 max_history 个供查询。
+    任务按工位分别排队，工作线程轮流从各工位取任务，一个工位连续提交不会让其他工位长时间等待。
+    """
+
+    def __init__(self, runner: Callable[[Job], Dict], workers: int = 2, max_pending: int = 8,
+                 max_history: int = 100, on_update: Optional[Callable[[Job], None]] = None):
+        self.runner = runner
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self.on_update = on_update
+        self._pending: "OrderedDict[Optional[str], Deque[Job]]" = OrderedDict()
+        self._held = 0  # 已提交、等待采集完成后才进入队列的任务数
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._running = 0
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"analysis-job-{i}", daemon=True)
+            thread.start()
+
+    def submit(self, station: Optional[str] = None, hold: bool = False, auto: bool = False) -> Job:
+        """
+        提交新任务，队列已满时抛出 QueueFullError。
+
+        :param station: 工位ID，同一工位的任务按提交顺序执行，不同工位之间轮流执行
+        :param hold: 为True时任务先登记但不执行，由 release() 放入队列（如等待工位采集完成）
+        :param auto: 是否为服务器自动提交的任务
+        """
+        job = Job(station, auto)
+        with self._lock:
+            if self._queued() >= self.max_pending:
+                raise QueueFullError(f"待处理任务已达上限 {self.max_pending}")
+            if hold:
+                job.message = "等待采集"
+                self._held += 1
+            else:
+                self._enqueue(job)
+            self._jobs[job.id] = job
+            self._trim_history()
+        self._notify(job)
+        return job
+
+    def release(self, job: Job, payload=None):
+        """把 submit(hold=True) 登记的任务连同准备好的数据放入队列"""
+        with self._lock:
+            self._held -= 1
+            job.payload = payload
+            job.message = "排队中"
+            self._enqueue(job)
+        self._notify(job)
+
+    def fail(self, job: Job, message: str):
+        """登记的任务在进入队列前失败（如采集失败）"""
+        with self._lock:
+            self._held -= 1
+            job.status = "error"
+            job.message = message
+            job.finished = time.time()
+        self._notify(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, limit: int = 20) -> List[Job]:
+        """最近提交的任务，新任务在前"""
+        with self._lock:
+            return list(self._jobs.values())[-limit:][::-1]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": self._queued(),
+                "capacity": self.max_pending
+            }
+
+    def queued_by_station(self) -> Dict[Optional[str], int]:
+        """各工位排队中（含等待采集）的任务数"""
+        with self._lock:
+            counts: Dict[Optional[str], int] = {}
+            for job in self._jobs.values():
+                if job.status == "queued":
+                    counts[job.station] = counts.get(job.station, 0) + 1
+            return counts
+
+    def _queued(self) -> int:
+        return self._held + sum(len(jobs) for jobs in self._pending.values())
+
+    def _enqueue(self, job: Job):
+        self._pending.setdefault(job.station, deque()).append(job)
+        self._cond.notify()
+
+    def _next_job(self) -> Job:
+        """轮流取各工位队首的任务：取出后该工位移到末尾（调用时持有锁）"""
+        self._cond.wait_for(lambda: self._pending)
+        station, jobs = next(iter(self._pending.items()))
+        job = jobs.popleft()
+        del self._pending[station]
+        if jobs:
+            self._pending[station] = jobs
+        return job
+
+    def _trim_history(self):
+        # 只淘汰已结束的任务，排队和运行中的任务始终可查
+        excess = len(self._jobs) - self.max_history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].status in ("completed", "error"):
+                del self._jobs[job_id]
+                excess -= 1
+
+    def _notify(self, job: Job):
+        if self.on_update is not None:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                print(f"任务状态回调异常: {e}")
+
+    def _worker_loop(self):
+        while True:
+            with self._lock:
+                job = self._next_job()
+                self._running += 1
+                job.status = "running"
+                job.message = "分析进行中"
+                job.started = time.time()
+            self._notify(job)
+            try:
+                result = self.runner(job)
+                with self._lock:
+                    job.result = result
+                    job.status = "completed"
+                    job.message = "分析完成"
+            except Exception as e:
+                with self._lock:
+                    job.status = "error"
+                    job.message = f"执行异常: {str(e)}"
+            finally:
+                with self._lock:
+                    job.finished = time.time()
+                    self._running -= 1
+                    # 已释放执行数据（图像），历史中只保留结果
+                    job.payload = None
+            self._notify(job)
@@ -0,0 +1,89 @@
+import struct
+from typing import Optional, Tuple
+
+# JPEG 标准（ITU-T T.81 附录K）中的默认霍夫曼表。
+# 很多 UVC 摄像头输出的 MJPEG 帧省略了 DHT 段，单独保存或上传前需要补上。
+_DC_LUMA_BITS = [0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]
+_DC_CHROMA_BITS = [0, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0]
+_DC_VALUES = list(range(12))
+
+_AC_LUMA_BITS = [0, 2, 1, 3, 3, 2, 4, 3, 5, 5, 4, 4, 0, 0, 1, 0x7d]
+_AC_LUMA_VALUES = [
+    0x01, 0x02, 0x03, 0x00, 0x04, 0x11, 0x05, 0x12, 0x21, 0x31, 0x41, 0x06, 0x13, 0x51, 0x61, 0x07,
+    0x22, 0x71, 0x14, 0x32, 0x81, 0x91, 0xa1, 0x08, 0x23, 0x42, 0xb1, 0xc1, 0x15, 0x52, 0xd1, 0xf0,
+    0x24, 0x33, 0x62, 0x72, 0x82, 0x09, 0x0a, 0x16, 0x17, 0x18, 0x19, 0x1a, 0x25, 0x26, 0x27, 0x28,
+    0x29, 0x2a, 0x34, 0x35, 0x36, 0x37, 0x38, 0x39, 0x3a,
+] + [hi | lo for hi in range(0x40, 0x90, 0x10) for lo in range(0x3, 0xb)] \
+  + [hi | lo for hi in range(0x90, 0xe0, 0x10) for lo in range(0x2, 0xb)] \
+  + [hi | lo for hi in range(0xe0, 0x100, 0x10) for lo in range(0x1, 0xb)]
+
+_AC_CHROMA_BITS = [0, 2, 1, 2, 4, 4, 3, 4, 7, 5, 4, 4, 0, 1, 2, 0x77]
+_AC_CHROMA_VALUES = [
+    0x00, 0x01, 0x02, 0x03, 0x11, 0x04, 0x05, 0x21, 0x31, 0x06, 0x12, 0x41, 0x51, 0x07, 0x61, 0x71,
+    0x13, 0x22, 0x32, 0x81, 0x08, 0x14, 0x42, 0x91, 0xa1, 0xb1, 0xc1, 0x09, 0x23, 0x33, 0x52, 0xf0,
+    0x15, 0x62, 0x72, 0xd1, 0x0a, 0x16, 0x24, 0x34, 0xe1, 0x25, 0xf1, 0x17, 0x18, 0x19, 0x1a, 0x26,
+    0x27, 0x28, 0x29, 0x2a, 0x35, 0x36, 0x37, 0x38, 0x39, 0x3a,
+] + [hi | lo for hi in range(0x40, 0x80, 0x10) for lo in range(0x3, 0xb)] \
+  + [hi | lo for hi in range(0x80, 0xe0, 0x10) for lo in range(0x2, 0xb)] \
+  + [0xe2, 0xe3, 0xe4, 0xe5, 0xe6, 0xe7, 0xe8, 0xe9, 0xea, 0xf2, 0xf3, 0xf4, 0xf5, 0xf6, 0xf7, 0xf8, 0xf9, 0xfa]
+
+
+def _build_dht_segment() -> bytes:
+    body = b""
+    for table_class_id, bits, values in (
+        (0x00, _DC_LUMA_BITS, _DC_VALUES),
+        (0x10, _AC_LUMA_BITS, _AC_LUMA_VALUES),
+        (0x01, _DC_CHROMA_BITS, _DC_VALUES),
+        (0x11, _AC_CHROMA_BITS, _AC_CHROMA_VALUES),
+    ):
+        assert sum(bits) == len(values)
+        body += bytes([table_class_id]) + bytes(bits) + bytes(values)
+    return b"\xff\xc4" + struct.pack(">H", len(body) + 2) + body
+
+
+DEFAULT_DHT_SEGMENT = _build_dht_segment()
+
+# SOF 标记（不含 DHT=C4、JPG=C8、DAC=CC）
+_SOF_MARKERS = {0xc0, 0xc1, 0xc2, 0xc3, 0xc5, 0xc6, 0xc7, 0xc9, 0xca, 0xcb, 0xcd, 0xce, 0xcf}
+
+
+def _iter_segments(data: bytes):
+    """依次返回 (标记, 段起始偏移, 段长度)，遇到 SOS 后停止"""
+    if data[:2] != b"\xff\xd8":
+        return
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xff:
+            return
+        marker = data[offset + 1]
+        if marker == 0xff:  # 填充字节
+            offset += 1
+            continue
+        length = struct.unpack_from(">H", data, offset + 2)[0]
+        yield marker, offset, length
+        if marker == 0xda:
+            return
+        offset += 2 + length
+
+
+def is_jpeg(data: bytes) -> bool:
+    return data[:3] == b"\xff\xd8\xff"
+
+
+def jpeg_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """从 SOF 段读取 (宽, 高)，无需解码图像"""
+    for marker, offset, _ in _iter_segments(data):
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack_from(">HH", data, offset + 5)
+            return width, height
+    return None
+
+
+def ensure_huffman_tables(data: bytes) -> bytes:
+    """MJPEG 帧缺少 DHT 段时，在 SOS 前插入标准霍夫曼表，使其成为独立可解码的 JPEG"""
+    for marker, offset, _ in _iter_segments(data):
+        if marker == 0xc4:
+            return data
+        if marker == 0xda:
+            return data[:offset] + DEFAULT_DHT_SEGMENT + data[offset:]
+    return data
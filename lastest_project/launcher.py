@@ -0,0 +1,220 @@
+"""
+食物营养分析流程启动器（analyze_food.sh 调用）。
+
+按源码哈希决定是否重新编译称重程序，随后同时启动摄像头、称重和分析三个进程并各自绑定CPU核心，
+等待子进程退出（不再每秒轮询 ps），最后打印启动各阶段的耗时。
+
+用法: python3 launcher.py [--food 食物类别] [--offline] [--rebuild]
+"""
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+# 称重程序源码、可执行文件与编译参数
+WEIGHT_SENSOR_SOURCE = "hx711_weight.c"
+WEIGHT_SENSOR_BINARY = "./weight_sensor"
+BUILD_FLAGS = ["-O2", "-lgpiod"]
+
+# 每次分析前清理的临时文件
+TEMP_FILES = ("capture_status.json", "weight_data.txt", "weight_data.txt.tmp", "nutrition_result.json")
+
+# 分析程序退出后等待采集进程结束的时间，超时则终止
+STAGE_GRACE_PERIOD = 5.0
+
+
+class BuildError(RuntimeError):
+    """称重程序编译失败"""
+
+
+def source_digest(source: str = WEIGHT_SENSOR_SOURCE, flags: Optional[List[str]] = None) -> str:
+    """源码内容与编译参数的 SHA-256，二者任一变化都需要重新编译"""
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        digest.update(f.read())
+    digest.update(" ".join(flags if flags is not None else BUILD_FLAGS).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def build_weight_sensor(source: str = WEIGHT_SENSOR_SOURCE, binary: str = WEIGHT_SENSOR_BINARY,
+                        force: bool = False) -> bool:
+    """
+    仅在源码哈希变化或可执行文件缺失时编译称重程序。
+
+    哈希保存在 <可执行文件>.sha256 中，比修改时间可靠（git checkout、复制文件都会改动修改时间）。
+    先编译到临时文件再替换，编译失败或并发编译时不会留下不完整的可执行文件。
+    :return: 是否实际执行了编译
+    """
+    digest = source_digest(source)
+    hash_path = binary + ".sha256"
+    if not force and os.path.exists(binary):
+        try:
+            with open(hash_path, "r", encoding="utf-8") as f:
+                if f.read().strip() == digest:
+                    return False
+        except FileNotFoundError:
+            pass
+
+    print("编译HX711重量传感器程序...")
+    tmp_binary = f"{binary}.{os.getpid()}.tmp"
+    result = subprocess.run(["gcc", "-o", tmp_binary, source] + BUILD_FLAGS,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        if os.path.exists(tmp_binary):
+            os.remove(tmp_binary)
+        raise BuildError(f"称重程序编译失败: {result.stderr}")
+    os.replace(tmp_binary, binary)
+    with open(hash_path, "w", encoding="utf-8") as f:
+        f.write(digest + "\n")
+    return True
+
+
+def usable_cpus() -> set:
+    """当前进程允许使用的核心（容器或 cgroup 限制时可能少于物理核心数）"""
+    return os.sched_getaffinity(0)
+
+
+class Stage:
+    """一个采集或分析子进程，输出逐行转发并加上阶段名前缀"""
+
+    def __init__(self, name: str, command: List[str], cpu: Optional[int] = None):
+        self.name = name
+        self.command = command
+        self.cpu = cpu
+        self.process: Optional[subprocess.Popen] = None
+        self.started = 0.0
+        self.finished: Optional[float] = None
+        self._relay: Optional[threading.Thread] = None
+
+    def start(self) -> "Stage":
+        cpu = self.cpu if self.cpu is not None and self.cpu in usable_cpus() else None
+        self.cpu = cpu
+        # 在子进程 exec 之前绑定核心，程序从第一条指令起就运行在指定核心上
+        preexec = (lambda: os.sched_setaffinity(0, {cpu})) if cpu is not None else None
+        # 子进程输出经管道转发，Python 子进程需关闭输出缓冲才能逐行看到
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        self.started = time.monotonic()
+        self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        text=True, bufsize=1, env=env, preexec_fn=preexec)
+        self._relay = threading.Thread(target=self._relay_output, name=f"relay-{self.name}", daemon=True)
+        self._relay.start()
+        return self
+
+    def _relay_output(self):
+        # 读到 EOF 即子进程已关闭输出，随后 wait 立即返回
+        for line in self.process.stdout:
+            print(f"[{self.name}] {line.rstrip()}", flush=True)
+        self.process.wait()
+        self.finished = time.monotonic()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        """等待子进程退出并转发完全部输出，超时返回None"""
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return None
+        self._relay.join()
+        return self.process.returncode
+
+    def stop(self):
+        """终止仍在运行的子进程（先 SIGTERM，不退出再 SIGKILL）"""
+        if self.process.poll() is not None:
+            return
+        self.process.terminate()
+        if self.wait(timeout=1.0) is None:
+            self.process.kill()
+            self.wait()
+
+    def summary(self) -> Dict:
+        return {
+            "name": self.name,
+            "cpu": self.cpu,
+            "returncode": self.process.returncode if self.process else None,
+            "duration": round((self.finished or time.monotonic()) - self.started, 3)
+        }
+
+
+def print_timings(timings: Dict[str, float], stages: List[Stage], total: float):
+    print("==========================================")
+    print("启动耗时:")
+    for name, duration in timings.items():
+        print(f"  {name:<12}{duration * 1000:>10.1f} ms")
+    for stage in stages:
+        info = stage.summary()
+        cpu = f"CPU {info['cpu']}" if info["cpu"] is not None else "未绑定"
+        print(f"  {stage.name:<12}{info['duration'] * 1000:>10.1f} ms  ({cpu}, 返回码 {info['returncode']})")
+    print(f"  {'总计':<12}{total * 1000:>10.1f} ms")
+    print("==========================================")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="食物营养分析流程启动器")
+    parser.add_argument("--food", help="已知的食物类别，传给分析程序")
+    parser.add_argument("--offline", action="store_true", help="只使用本地营养表，传给分析程序")
+    parser.add_argument("--rebuild", action="store_true", help="忽略编译缓存，强制重新编译称重程序")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    begin = time.monotonic()
+    timings: Dict[str, float] = {}
+
+    print("==========================================")
+    print("食物营养分析系统启动中...")
+    print("==========================================")
+    cpus = usable_cpus()
+    print(f"可用CPU核心: {sorted(cpus)}")
+    if len(cpus) < 3:
+        print("警告: 可用核心不足3个，无法绑定的进程将不指定核心。")
+
+    start = time.monotonic()
+    for path in TEMP_FILES:
+        if os.path.exists(path):
+            os.remove(path)
+    timings["清理"] = time.monotonic() - start
+
+    start = time.monotonic()
+    try:
+        rebuilt = build_weight_sensor(force=args.rebuild)
+    except BuildError as e:
+        print(e)
+        return 1
+    timings["编译" if rebuilt else "编译(缓存)"] = time.monotonic() - start
+
+    analyzer_command = [sys.executable, "food_nutrition_analyzer.py"]
+    if args.food:
+        analyzer_command += ["--food", args.food]
+    if args.offline:
+        analyzer_command.append("--offline")
+
+    # 三个进程同时启动：分析程序通过 inotify 在数据写入完成的瞬间被唤醒，并在等待期间预热API连接
+    start = time.monotonic()
+    stages = [
+        Stage("analyzer", analyzer_command, cpu=0).start(),
+        Stage("camera", [sys.executable, "camera_capture.py"], cpu=1).start(),
+        Stage("weight", [WEIGHT_SENSOR_BINARY], cpu=2).start()
+    ]
+    timings["启动进程"] = time.monotonic() - start
+    analyzer, collectors = stages[0], stages[1:]
+
+    returncode = analyzer.wait()
+    # 分析程序已经退出，仍未结束的采集进程已无用处，限时等待后终止
+    deadline = time.monotonic() + STAGE_GRACE_PERIOD
+    for stage in collectors:
+        if stage.wait(timeout=max(0.0, deadline - time.monotonic())) is None:
+            print(f"{stage.name} 未按时退出，终止进程")
+            stage.stop()
+
+    print("食物营养分析完成！" if returncode == 0 else f"分析程序异常退出，返回码 {returncode}")
+    print_timings(timings, stages, time.monotonic() - begin)
+    # 分析程序的退出码即整个流程的结果；被信号终止（负值）时按 shell 惯例返回 128+信号值
+    return returncode if returncode >= 0 else 128 - returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+# 每个阶段保留的最近样本数，分位数在这个窗口上计算
+DEFAULT_WINDOW = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class StageHistogram:
+    """单个阶段的耗时统计：累计次数/总和，以及最近样本窗口上的分位数"""
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def quantiles(self) -> Dict[float, float]:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: float("nan") for q in QUANTILES}
+        # 最近秩法，样本较少时也不做插值
+        return {q: ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+                for q in QUANTILES}
+
+
+class MetricsRegistry:
+    """进程内的阶段耗时与计数器汇总，可输出 Prometheus 文本格式"""
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.window = window
+        self._stages: Dict[str, StageHistogram] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, name: str) -> StageHistogram:
+        histogram = self._stages.get(name)
+        if histogram is None:
+            histogram = self._stages[name] = StageHistogram(self.window)
+        return histogram
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self._stage(stage).observe(seconds)
+
+    def observe_error(self, stage: str):
+        with self._lock:
+            self._stage(stage).errors += 1
+
+    def increment(self, name: str, label: str):
+        """计数器加一，如 increment('runs', 'completed')"""
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[label] = counter.get(label, 0) + 1
+
+    def reset(self):
+        """清空所有统计（基准测试在各场景之间调用）"""
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> Dict:
+        """各阶段的次数、均值和分位数（秒）"""
+        with self._lock:
+            stages = {name: (h.count, h.total, h.errors, h.quantiles()) for name, h in self._stages.items()}
+        return {
+            name: {
+                "count": count,
+                "errors": errors,
+                "mean": total / count if count else None,
+                **{f"p{int(q * 100)}": value for q, value in quantiles.items()}
+            }
+            for name, (count, total, errors, quantiles) in stages.items()
+        }
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            stages = sorted((name, h.count, h.total, h.errors, h.quantiles()) for name, h in self._stages.items())
+            counters = {name: dict(values) for name, values in self._counters.items()}
+
+        lines = [
+            "# HELP food_stage_duration_seconds 分析流水线各阶段耗时",
+            "# TYPE food_stage_duration_seconds summary"
+        ]
+        for name, count, total, _, quantiles in stages:
+            for q, value in quantiles.items():
+                value = "NaN" if math.isnan(value) else f"{value:.6f}"
+                lines.append(f'food_stage_duration_seconds{{stage="{name}",quantile="{q}"}} {value}')
+            lines.append(f'food_stage_duration_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'food_stage_duration_seconds_count{{stage="{name}"}} {count}')
+
+        lines.append("# HELP food_stage_errors_total 各阶段失败次数")
+        lines.append("# TYPE food_stage_errors_total counter")
+        for name, _, _, errors, _ in stages:
+            lines.append(f'food_stage_errors_total{{stage="{name}"}} {errors}')
+
+        for name in sorted(counters):
+            lines.append(f"# TYPE food_{name}_total counter")
+            for label, value in sorted(counters[name].items()):
+                lines.append(f'food_{name}_total{{status="{label}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+# 进程内共享的指标汇总
+registry = MetricsRegistry()
+
+
+class Trace:
+    """
+    一次分析的阶段耗时记录。
+
+    各阶段用单调时钟计时，同时汇总到 registry 的直方图中；
+    拍照和称重在不同线程中并行执行，记录时加锁。
+    """
+
+    def __init__(self, job_id: Optional[str] = None, metrics: Optional[MetricsRegistry] = None):
+        self.job_id = job_id
+        self.metrics = metrics if metrics is not None else registry
+        self.wall_start = time.time()
+        self.start = time.monotonic()
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        """记录一个阶段，阶段内抛出的异常照常向上传递"""
+        start = time.monotonic()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.record(name, start, time.monotonic(), error)
+
+    def record(self, name: str, start: float, end: float, error: Optional[BaseException] = None):
+        """记录一个已知起止时刻（time.monotonic）的阶段，如流式回复的首个字段耗时"""
+        duration = end - start
+        record = {"name": name, "start": round(start - self.start, 6), "duration": round(duration, 6)}
+        if error is not None:
+            record["error"] = str(error) or type(error).__name__
+            self.metrics.observe_error(name)
+        else:
+            self.metrics.observe(name, duration)
+        with self._lock:
+            self.spans.append(record)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start"])
+        return {
+            "job_id": self.job_id,
+            "started": self.wall_start,
+            "elapsed": round(time.monotonic() - self.start, 6),
+            "spans": spans
+        }
+
+
+def stage(trace: Optional[Trace], name: str):
+    """trace 为None时不计时，便于在可选参数中传递"""
+    return trace.span(name) if trace is not None else nullcontext()
@@ -0,0 +1,195 @@
+import json
+import re
+from typing import Dict, NamedTuple, Optional
+
+# 模型回复中需要提取的字段，按提示词中的顺序
+NUTRITION_FIELDS = ("food", "calories", "carbohydrates", "protein", "fat", "advice")
+MACRO_FIELDS = ("calories", "carbohydrates", "protein", "fat")
+
+# "键": "字符串" 或 "键": 数字，数字后必须已经出现分隔符，保证数字已生成完整；
+# 逗号后紧跟数字时可能是千位分隔符（1,200），要等到后面的内容出现才能确定
+_FIELD_PATTERN = re.compile(
+    r'"(' + "|".join(NUTRITION_FIELDS) + r')"\s*:\s*'
+    r'(?:("(?:[^"\\]|\\.)*")|(-?\d{1,3}(?:,\d{3})+(?:\.\d+)?|-?\d+(?:\.\d+)?)(?=\s*(?:[}\n]|,\s*[^\d\s])))'
+)
+
+
+class IncrementalNutritionParser:
+    """
+    流式回复的增量解析器。
+
+    每收到一段文本就从上次的位置继续匹配，某个字段的值一旦完整（字符串的右引号或数字后的分隔符
+    已经出现）就立即返回，不必等整段 JSON 生成完毕。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields: Dict[str, object] = {}
+        self._pos = 0
+
+    def feed(self, chunk: str) -> Dict[str, object]:
+        """追加一段文本，返回本次新解析出的字段"""
+        self.text += chunk
+        found = {}
+        for match in _FIELD_PATTERN.finditer(self.text, self._pos):
+            key, string_value, number_value = match.groups()
+            self._pos = match.end()
+            if key in self.fields:
+                continue
+            try:
+                value = json.loads(string_value) if string_value else float(number_value.replace(",", ""))
+            except ValueError:
+                continue
+            if key in MACRO_FIELDS:
+                # "105 千卡" 这类带单位的值提前换成数字，与最终结果一致
+                value = parse_quantity(value)
+                if value is None:
+                    continue
+            self.fields[key] = value
+            found[key] = value
+        return found
+
+
+class NutritionRecord(NamedTuple):
+    """解析后的营养数据：热量为千卡，其余为克"""
+    food: str
+    calories: float
+    carbohydrates: float
+    protein: float
+    fat: float
+    advice: str
+
+    def to_dict(self) -> Dict:
+        data = self._asdict()
+        for key in MACRO_FIELDS:
+            data[key] = round(data[key], 1)
+        return data
+
+
+# 结构化输出使用的 JSON Schema（response_format 为 json_schema 时）
+NUTRITION_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "food": {"type": "string"},
+        "calories": {"type": "number", "description": "千卡"},
+        "carbohydrates": {"type": "number", "description": "克"},
+        "protein": {"type": "number", "description": "克"},
+        "fat": {"type": "number", "description": "克"},
+        "advice": {"type": "string"}
+    },
+    "required": list(NUTRITION_FIELDS),
+    "additionalProperties": False
+}
+
+# 模型偶尔使用的其他键名
+FIELD_ALIASES = {
+    "food": ("food", "name", "food_name", "食物", "食物名称", "名称"),
+    "calories": ("calories", "calorie", "energy", "kcal", "热量", "能量"),
+    "carbohydrates": ("carbohydrates", "carbohydrate", "carbs", "碳水化合物", "碳水"),
+    "protein": ("protein", "proteins", "蛋白质"),
+    "fat": ("fat", "fats", "脂肪"),
+    "advice": ("advice", "suggestion", "饮食建议", "建议")
+}
+_ALIAS_TO_FIELD = {alias: field for field, aliases in FIELD_ALIASES.items() for alias in aliases}
+
+# 散文或残缺JSON中的 “键: 值” / “键：值”，值为带引号的字符串或到分隔符为止的文本（数字间的千位分隔符不算分隔符）
+_LOOSE_FIELD_PATTERN = re.compile(
+    r'["\']?(' + "|".join(sorted(map(re.escape, _ALIAS_TO_FIELD), key=len, reverse=True)) + r')["\']?'
+    r'\s*[:：]\s*(?:"((?:[^"\\]|\\.)*)"|((?:[^,，;；}\n]|(?<=\d),(?=\d{3}(?!\d)))+))',
+    re.IGNORECASE
+)
+_RANGE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:-|~|～|至|到)\s*(\d+(?:\.\d+)?)")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+# 数字间的千位分隔符，如 1,200
+_THOUSANDS_SEPARATOR_RE = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+_KILOJOULE_RE = re.compile(r"千焦|kj", re.IGNORECASE)
+
+
+def parse_quantity(value) -> Optional[float]:
+    """
+    从 105、"105"、"105 千卡"、"1,200 千卡"、"约100-120千卡"（取中值）、"440千焦"（换算为千卡）中取出数值。
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    value = _THOUSANDS_SEPARATOR_RE.sub("", value)
+    match = _RANGE_RE.search(value)
+    if match:
+        number = (float(match.group(1)) + float(match.group(2))) / 2
+    else:
+        match = _NUMBER_RE.search(value)
+        if not match:
+            return None
+        number = float(match.group())
+    if _KILOJOULE_RE.search(value):
+        number /= 4.184
+    return number
+
+
+def _json_fields(content: str) -> Optional[Dict]:
+    """取第一个 '{' 到最后一个 '}' 之间的内容按JSON解析，可跳过代码块标记和前后的说明文字"""
+    start = content.find("{")
+    end = content.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(content[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    fields = {}
+    # 兼容 {"nutrition": {...}} 这类多套一层的回复
+    for key, value in list(data.items()) + [item for v in data.values() if isinstance(v, dict)
+                                            for item in v.items()]:
+        field = _ALIAS_TO_FIELD.get(str(key).strip().lower())
+        if field and field not in fields:
+            fields[field] = value
+    return fields
+
+
+def _loose_fields(content: str) -> Dict:
+    fields = {}
+    for match in _LOOSE_FIELD_PATTERN.finditer(content):
+        field = _ALIAS_TO_FIELD[match.group(1).lower()]
+        if field in fields:
+            continue
+        if match.group(2) is not None:
+            try:
+                fields[field] = json.loads(f'"{match.group(2)}"')
+            except ValueError:
+                fields[field] = match.group(2)
+        else:
+            fields[field] = match.group(3).strip().strip("\"'")
+    return fields
+
+
+def extract_nutrition(content: str) -> Optional[NutritionRecord]:
+    """
+    从模型回复中提取营养数据。
+
+    先按JSON解析（容忍代码块和说明文字），失败时逐个匹配 “键: 值”；
+    四项营养数值都能取到数字才算解析成功，否则返回None。
+    """
+    if not content:
+        return None
+    fields = _json_fields(content) or {}
+    if any(parse_quantity(fields.get(key)) is None for key in MACRO_FIELDS):
+        # JSON 不完整或数值无法识别时用逐项匹配补齐，JSON 中可用的值优先
+        usable = {key: value for key, value in fields.items()
+                  if key not in MACRO_FIELDS or parse_quantity(value) is not None}
+        fields = {**_loose_fields(content), **usable}
+
+    macros = {key: parse_quantity(fields.get(key)) for key in MACRO_FIELDS}
+    if any(value is None for value in macros.values()):
+        return None
+    food = fields.get("food")
+    advice = fields.get("advice")
+    return NutritionRecord(
+        food=str(food).strip() if food else "未知食物",
+        advice=str(advice).strip() if advice else "",
+        **macros
+    )
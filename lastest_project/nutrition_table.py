@@ -0,0 +1,99 @@
+import csv
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+NUTRITION_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "food101_nutrition.csv")
+
+# 数组列顺序，与CSV中的营养字段一致（单位：千卡 / 克，每100克）
+NUTRIENT_COLUMNS = ("calories", "carbohydrates", "protein", "fat")
+
+
+class NutritionTable:
+    """
+    本地营养成分表（Food-101 的 101 个类别，每100克）。
+
+    启动时一次性载入为 (N, 4) 的 float32 数组，按类别和重量换算只是一次数组乘法，
+    无需网络即可给出完整的营养数据。
+    """
+
+    def __init__(self, path: str = NUTRITION_TABLE_PATH):
+        self.labels: List[str] = []
+        self.names_zh: List[str] = []
+        rows = []
+        with open(path, "r", encoding="utf-8") as f:
+            for record in csv.DictReader(f):
+                self.labels.append(record["label"])
+                self.names_zh.append(record["name_zh"])
+                rows.append([float(record[column]) for column in NUTRIENT_COLUMNS])
+        # 存为每克的数值，换算时直接乘以克数
+        self.per_gram = np.asarray(rows, dtype=np.float32) / 100.0
+        self._index = {label: i for i, label in enumerate(self.labels)}
+        self._index.update({name: i for i, name in enumerate(self.names_zh)})
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def find(self, label: str) -> Optional[int]:
+        """按类别名（如 'fried_rice'、'Fried Rice'）或中文名（如 '炒饭'）查找行号"""
+        if not label:
+            return None
+        key = label.strip()
+        if key in self._index:
+            return self._index[key]
+        return self._index.get(key.lower().replace(" ", "_").replace("-", "_"))
+
+    def scale(self, indices, weights) -> np.ndarray:
+        """批量换算：返回 (M, 4) 数组，依次为热量、碳水、蛋白质、脂肪"""
+        indices = np.asarray(indices, dtype=np.intp)
+        weights = np.asarray(weights, dtype=np.float32)
+        return self.per_gram[indices] * weights[:, None]
+
+    def lookup(self, label: str, weight_grams: float) -> Optional[Dict]:
+        """按类别和重量返回营养数据字典，未知类别返回None"""
+        index = self.find(label)
+        if index is None:
+            return None
+        values = self.per_gram[index] * np.float32(weight_grams)
+        result = {column: round(float(value), 1) for column, value in zip(NUTRIENT_COLUMNS, values)}
+        result["food"] = self.names_zh[index]
+        result["label"] = self.labels[index]
+        return result
+
+
+def build_local_advice(nutrients: Dict) -> str:
+    """根据本地换算出的营养数据生成简要饮食建议"""
+    calories = nutrients["calories"]
+    energy = nutrients["carbohydrates"] * 4 + nutrients["protein"] * 4 + nutrients["fat"] * 9
+    if energy <= 0:
+        return "该份食物热量很低，可放心食用。"
+
+    tips = []
+    if nutrients["fat"] * 9 / energy > 0.5:
+        tips.append("脂肪供能比例较高，建议控制分量并搭配蔬菜")
+    if nutrients["protein"] * 4 / energy > 0.3:
+        tips.append("蛋白质含量丰富，适合作为正餐的蛋白质来源")
+    if nutrients["carbohydrates"] * 4 / energy > 0.6:
+        tips.append("以碳水化合物为主，建议搭配优质蛋白质和蔬菜")
+    if calories > 600:
+        tips.append("本份热量较高，注意当天其余餐次的总量")
+    elif calories < 150:
+        tips.append("本份热量较低，可作为加餐")
+    if not tips:
+        tips.append("营养比例较均衡，注意适量食用")
+    return "；".join(tips) + "。"
+
+
+_table: Optional[NutritionTable] = None
+_table_lock = threading.Lock()
+
+
+def get_nutrition_table() -> NutritionTable:
+    """获取进程内共享的营养成分表（首次调用时载入）"""
+    global _table
+    with _table_lock:
+        if _table is None:
+            _table = NutritionTable()
+        return _table
@@ -0,0 +1,156 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+from nutrition_parser import parse_quantity
+
+DEFAULT_CACHE_PATH = os.path.join("data", "result_cache.sqlite3")
+
+# 参与按重量缩放的营养字段
+NUTRIENT_FIELDS = ("calories", "carbohydrates", "protein", "fat")
+
+
+def image_hash(jpeg: bytes) -> Optional[int]:
+    """
+    计算图像的64位差值哈希（dHash）。
+
+    同一盘菜在光照、位置轻微变化下哈希只相差少数几位，用汉明距离比较。
+    """
+    gray = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def _to_signed(value: int) -> int:
+    # SQLite 的 INTEGER 为有符号64位
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class ResultCache:
+    """
+    API 结果缓存。
+
+    键为图像感知哈希 + 重量分段，值按每100克保存，命中后按新重量换算。
+    存储在 SQLite 中，重启后仍然有效；超过 ttl 的条目过期，
+    超过 max_entries 时按最近使用时间淘汰。
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 512,
+                 ttl: float = 7 * 24 * 3600, max_distance: int = 6, bucket_grams: float = 100):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.bucket_grams = bucket_grams
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS result_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                phash INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                per_100g TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_bucket ON result_cache (bucket)")
+        self._conn.commit()
+
+    def _bucket(self, weight_grams: float) -> int:
+        return int(weight_grams // self.bucket_grams)
+
+    def lookup(self, phash: int, weight_grams: float) -> Optional[Dict]:
+        """查找相似图像的缓存结果，命中时返回按 weight_grams 换算后的营养数据"""
+        bucket = self._bucket(weight_grams)
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, phash, per_100g FROM result_cache "
+                "WHERE bucket BETWEEN ? AND ? AND created >= ?",
+                (bucket - 1, bucket + 1, now - self.ttl)
+            ).fetchall()
+            best = None
+            for row_id, stored_hash, per_100g in rows:
+                distance = bin((stored_hash & 0xFFFFFFFFFFFFFFFF) ^ phash).count("1")
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, row_id, per_100g)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE result_cache SET last_used = ? WHERE id = ?", (now, best[1]))
+            self._conn.commit()
+
+        entry = json.loads(best[2])
+        result = dict(entry)
+        for field in NUTRIENT_FIELDS:
+            result[field] = round(entry[field] * weight_grams / 100, 1)
+        return result
+
+    def store(self, phash: int, weight_grams: float, output: Dict) -> bool:
+        """将API结果换算为每100克后写入缓存；营养字段不是数值时不缓存"""
+        if not weight_grams or weight_grams <= 0:
+            return False
+        entry = {"food": output.get("food"), "advice": output.get("advice")}
+        for field in NUTRIENT_FIELDS:
+            value = parse_quantity(output.get(field))
+            if value is None:
+                return False
+            entry[field] = value * 100 / weight_grams
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO result_cache (phash, bucket, per_100g, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (_to_signed(phash), self._bucket(weight_grams), json.dumps(entry, ensure_ascii=False), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+        return True
+
+    def _evict(self, now: float):
+        cursor = self._conn.execute("DELETE FROM result_cache WHERE created < ?", (now - self.ttl,))
+        self.evictions += cursor.rowcount
+        cursor = self._conn.execute(
+            "DELETE FROM result_cache WHERE id IN ("
+            "SELECT id FROM result_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        self.evictions += cursor.rowcount
+
+    def stats(self) -> Dict:
+        """命中/未命中计数和当前条目数"""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions,
+            "entries": size
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,193 @@
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+# 常驻称重程序（weight_sensor --daemon）监听的 Unix socket
+SCALE_SOCKET = os.environ.get("FOOD_SCALE_SOCKET", "/tmp/food_scale.sock")
+# 小于该重量视为秤上无物（与 hx711_weight.c 中的 MIN_LOAD 一致）
+MIN_LOAD_GRAMS = 5.0
+
+
+class ScaleReading(NamedTuple):
+    """称重程序推送的一次读数"""
+    ts: float
+    weight: float
+    raw: int
+    stable: bool
+    event: str  # reading / settled（新放上的物体已稳定）/ removed（物体已拿走）
+
+
+class ScaleClient:
+    """
+    常驻称重程序的客户端。
+
+    后台线程逐行接收滤波后的读数，保存最新一条；
+    分析时直接取已稳定的重量，不再每次启动称重程序、固定采样约一秒。
+    """
+
+    def __init__(self, path: str = SCALE_SOCKET, reconnect_delay: float = 1.0):
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self._sock: Optional[socket.socket] = None
+        self._latest: Optional[ScaleReading] = None
+        self._cond = threading.Condition()
+        self._listeners: List[Callable[[ScaleReading], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def _connect(self) -> bool:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            return False
+        self._sock = sock
+        return True
+
+    def start(self) -> bool:
+        """连接称重程序并启动接收线程；socket 不存在时返回False"""
+        if self._thread is not None:
+            return self.connected
+        if not self._connect():
+            return False
+        self._running = True
+        self._thread = threading.Thread(target=self._receive_loop, name="scale-client", daemon=True)
+        self._thread.start()
+        return True
+
+    def close(self):
+        self._running = False
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        with self._cond:
+            self._cond.notify_all()
+
+    def add_listener(self, callback: Callable[[ScaleReading], None]):
+        """每收到一条读数调用 callback(读数)，在接收线程中执行，应尽快返回"""
+        self._listeners.append(callback)
+
+    def _receive_loop(self):
+        buffer = b""
+        while self._running:
+            sock = self._sock
+            if sock is None:
+                # 称重程序重启时等待 socket 重新出现
+                time.sleep(self.reconnect_delay)
+                if self._running and self._connect():
+                    print("已重新连接称重程序")
+                continue
+            try:
+                data = sock.recv(4096)
+            except OSError:
+                data = b""
+            if not data:
+                if self._running:
+                    print("称重程序连接断开")
+                self._sock = None
+                sock.close()
+                buffer = b""
+                with self._cond:
+                    self._latest = None
+                    self._cond.notify_all()
+                continue
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                self._handle_line(line)
+
+    def _handle_line(self, line: bytes):
+        try:
+            data = json.loads(line)
+            reading = ScaleReading(float(data["ts"]), float(data["weight"]), int(data["raw"]),
+                                   bool(data["stable"]), data.get("event", "reading"))
+        except (ValueError, KeyError, TypeError):
+            return
+        with self._cond:
+            self._latest = reading
+            self._cond.notify_all()
+        for callback in self._listeners:
+            try:
+                callback(reading)
+            except Exception as e:
+                print(f"称重回调异常: {e}")
+
+    def latest(self) -> Optional[ScaleReading]:
+        with self._cond:
+            return self._latest
+
+    def wait_for_settled(self, timeout: float, min_weight: float = MIN_LOAD_GRAMS) -> Optional[ScaleReading]:
+        """
+        等待秤上有物体且读数稳定。
+
+        物体已经放好时立即返回当前读数；否则在稳定的那一刻返回。
+        超时或连接断开时返回None。
+        """
+        def settled():
+            reading = self._latest
+            return reading is not None and reading.stable and reading.weight >= min_weight
+
+        with self._cond:
+            if not self._cond.wait_for(lambda: settled() or not self.connected, timeout=timeout):
+                return None
+            return self._latest if settled() else None
+
+    def tare(self) -> bool:
+        """以当前读数重新去皮（称重程序会保存新的零点）"""
+        sock = self._sock
+        if sock is None:
+            return False
+        try:
+            sock.sendall(b"tare\n")
+            return True
+        except OSError:
+            return False
+
+
+def start_daemon(command: List[str], path: str = SCALE_SOCKET, timeout: float = 5.0,
+                 cwd: Optional[str] = None) -> Optional[subprocess.Popen]:
+    """
+    启动常驻称重程序并等待 socket 就绪。
+
+    程序提前退出（如没有 GPIO 权限）或超时未就绪时返回None。
+    :param cwd: 工作目录，零点文件和 weight_data.txt 写在这里（多工位时每个工位一个目录）
+    """
+    try:
+        # 称重程序常驻运行，输出直接交给服务器的终端，避免管道写满后阻塞
+        process = subprocess.Popen(command + ["--daemon", "--socket", path], stdout=subprocess.DEVNULL,
+                                   cwd=cwd)
+    except OSError as e:
+        print(f"启动称重程序失败: {e}")
+        return None
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            print(f"称重程序已退出，返回码 {process.returncode}")
+            return None
+        # 上次异常退出可能留下旧的 socket 文件，能连上才算就绪
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            return process
+        except OSError:
+            pass
+        finally:
+            probe.close()
+        time.sleep(0.05)
+    process.terminate()
+    process.wait()
+    print("称重程序启动超时")
+    return None
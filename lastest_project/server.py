@@ -1,13 +1,39 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, abort
 import os
 import subprocess
 import json
 import time
 import threading
 
+from analysis_worker import AnalysisWorker
+from event_bus import event_bus
+from history_store import HistoryStore
+from job_queue import JobQueue, QueueFullError
+from metrics import Trace, registry
+from static_assets import StaticAssets
+from stations import STATIONS_FILE, StationSupervisor, load_stations
+from telemetry import sampler
+
 app = Flask(__name__, static_folder='.')
 DATA_DIR = 'data'
 SCRIPT_PATH = './analyze_food.sh'
+# 分析模式：worker 为进程内常驻工作器，script 为调用 analyze_food.sh 的后备模式
+ANALYSIS_MODE = os.environ.get('ANALYSIS_MODE', 'worker')
+# 并发分析任务数与排队上限；脚本模式共用同一组临时文件，只能串行
+JOB_WORKERS = 1 if ANALYSIS_MODE == 'script' else int(os.environ.get('JOB_WORKERS', '2'))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', '8'))
+# 常驻称重程序检测到新放上的食物稳定后自动开始分析（FOOD_AUTO_ANALYZE=1 开启）
+AUTO_ANALYZE = os.environ.get('FOOD_AUTO_ANALYZE', '0') != '0'
+# 多工位模式：存在工位配置文件时，每个工位由独立进程采集，分析任务按工位轮流执行
+STATIONS = load_stations(STATIONS_FILE) if ANALYSIS_MODE != 'script' and os.path.exists(STATIONS_FILE) else None
+# 服务器模式：dev 为 Flask 调试服务器，production 关闭调试并使用多线程 WSGI 服务器
+SERVER_MODE = os.environ.get('SERVER_MODE', 'dev')
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', '8080'))
+# 生产模式的工作线程数；每个 SSE 连接长期占用一个线程
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '8'))
+# 生产模式下留给普通请求（提交任务、/metrics 等）的线程数，其余线程才可用于 SSE 连接
+SERVER_RESERVED_THREADS = 2
 current_analysis = {
     'status': 'idle',  # idle, running, completed, error
     'message': '',
@@ -16,88 +42,297 @@ current_analysis = {
         {'id': 1, 'usage': 0},
         {'id': 2, 'usage': 0}
     ],
-    'start_time': None
+    'start_time': None,
+    'job_id': None,
+    'created': 0
 }
 analysis_lock = threading.Lock()
+analysis_worker = None
+worker_lock = threading.Lock()
+history_store = None
+history_lock = threading.Lock()
+station_supervisor = None
+station_lock = threading.Lock()
+# 页面和样式表在启动时预压缩，带 ETag 缓存校验
+static_assets = StaticAssets('.')
+
+def get_analysis_worker():
+    """获取（必要时创建并预热）常驻分析工作器"""
+    global analysis_worker
+    with worker_lock:
+        if analysis_worker is None:
+            # 多工位模式下摄像头和秤由工位进程持有，工作器只负责分析
+            worker = AnalysisWorker(DATA_DIR, local_devices=STATIONS is None)
+            worker.start()
+            if worker.scale is not None:
+                worker.scale.add_listener(on_scale_reading)
+            analysis_worker = worker
+        return analysis_worker
+
+def get_station_supervisor():
+    """获取（必要时启动）工位进程监管者，单工位模式下返回None"""
+    global station_supervisor
+    if STATIONS is None:
+        return None
+    with station_lock:
+        if station_supervisor is None:
+            supervisor = StationSupervisor(STATIONS, DATA_DIR, on_reading=on_station_reading)
+            supervisor.start()
+            station_supervisor = supervisor
+        return station_supervisor
+
+def get_history_store():
+    """服务器用于查询的历史记录连接（写入由分析程序完成）"""
+    global history_store
+    with history_lock:
+        if history_store is None:
+            history_store = HistoryStore(os.path.join(DATA_DIR, 'history.sqlite3'))
+        return history_store
 
 @app.route('/')
 def index():
-    return send_from_directory('.', 'index.html')
+    response = static_assets.response('index.html', request)
+    if response is None:
+        abort(404)
+    return response
 
 @app.route('/<path:path>')
 def static_files(path):
+    response = static_assets.response(path, request)
+    if response is not None:
+        return response
+    # 生产模式只提供静态文件，不暴露源码、配置和数据文件
+    if SERVER_MODE == 'production':
+        abort(404)
     return send_from_directory('.', path)
 
+def run_analysis_job(job):
+    """任务队列的执行函数：按分析模式执行一次分析并返回结果"""
+    sampler.register_thread(threading.current_thread().name)
+    if ANALYSIS_MODE == 'script':
+        trace = Trace(job.id)
+        try:
+            with trace.span('script'):
+                result = run_analysis_script()
+        except Exception:
+            registry.increment('runs', 'error')
+            raise
+        registry.increment('runs', 'completed')
+        return result
+
+    def progress(stage, detail):
+        if stage == 'partial':
+            # 流式回复中已解析出的字段，前端先行显示
+            event_bus.publish('partial', {'job_id': job.id, **detail}, key=f'partial:{job.id}')
+            return
+        event_bus.publish('progress', {'job_id': job.id, 'stage': stage, **detail},
+                          key=f'progress:{job.id}')
+        if 'weight' in detail:
+            event_bus.publish('weight', {'job_id': job.id, 'weight': detail['weight']})
+
+    return get_analysis_worker().run(job.id, progress=progress, acquisition=job.payload)
+
+def on_job_update(job):
+    """把最近提交的任务状态同步到 current_analysis，兼容原有的 /api/status，并推送给 SSE 连接"""
+    event_bus.publish('job', job.to_dict(include_result=False), key=f'job:{job.id}')
+    if job.status == 'completed':
+        event_bus.publish('result', {'job_id': job.id, 'result': job.result}, key=f'result:{job.id}')
+    if job.station is not None and job.status in ('completed', 'error'):
+        get_station_supervisor().record_result(job.station, job.status == 'completed')
+
+    with analysis_lock:
+        if job.created < current_analysis.get('created', 0):
+            return  # 较早提交的任务不覆盖最新任务的状态
+        current_analysis['job_id'] = job.id
+        current_analysis['created'] = job.created
+        current_analysis['status'] = 'running' if job.status in ('queued', 'running') else job.status
+        current_analysis['message'] = job.message
+        current_analysis['start_time'] = job.started or job.created
+        status = {key: current_analysis[key] for key in ('status', 'message', 'job_id', 'start_time')}
+    event_bus.publish('status', status)
+
+def on_scale_reading(reading):
+    """实时重量推送给前端；开启自动分析时，新放上的食物一稳定就提交分析任务"""
+    event_bus.publish('scale', reading._asdict())
+    if AUTO_ANALYZE and reading.event == 'settled':
+        try:
+            job = job_queue.submit(auto=True)
+            print(f"秤上读数已稳定（{reading.weight:.1f} 克），自动开始分析: {job.id}")
+        except QueueFullError as e:
+            print(f"自动分析未提交: {e}")
+
+def on_station_reading(station_id, reading):
+    """多工位模式下各工位的实时重量；新放上的食物稳定后按设置自动提交该工位的分析"""
+    event_bus.publish('scale', {'station': station_id, **reading}, key=f'scale:{station_id}')
+    if AUTO_ANALYZE and reading.get('event') == 'settled':
+        try:
+            job = submit_station_job(station_id, auto=True)
+            print(f"工位 {station_id} 读数已稳定（{reading['weight']:.1f} 克），自动开始分析: {job.id}")
+        except QueueFullError as e:
+            print(f"工位 {station_id} 自动分析未提交: {e}")
+
+def submit_station_job(station_id, auto=False):
+    """
+    提交工位任务：先由工位进程采集（不占用分析线程），采集完成后进入共享的分析队列。
+    队列已满时抛出 QueueFullError。
+    """
+    job = job_queue.submit(station=station_id, hold=True, auto=auto)
+    event_bus.publish('progress', {'job_id': job.id, 'stage': 'settle', 'station': station_id},
+                      key=f'progress:{job.id}')
+
+    def on_acquired(acquisition, error):
+        if acquisition is None:
+            job_queue.fail(job, f'采集失败: {error}')
+            return
+        event_bus.publish('weight', {'job_id': job.id, 'weight': acquisition.weight})
+        job_queue.release(job, acquisition)
+
+    get_station_supervisor().acquire(station_id, on_acquired)
+    return job
+
+job_queue = JobQueue(run_analysis_job, workers=JOB_WORKERS, max_pending=JOB_QUEUE_SIZE,
+                     on_update=on_job_update)
+sampler.add_listener(lambda sample: event_bus.publish('cpu', sample))
+event_bus.publish('status', {'status': 'idle', 'message': '', 'job_id': None, 'start_time': None})
+
 @app.route('/api/analyze', methods=['POST'])
 def start_analysis():
-    global current_analysis
-    with analysis_lock:
-        if current_analysis['status'] == 'running':
-            return jsonify({'error': '分析已在进行中'}), 400
-        
-        # 更新状态
-        current_analysis = {
-            'status': 'running',
-            'message': '分析开始',
-            'cpu_usage': [
-                {'id': 0, 'usage': 10},
-                {'id': 1, 'usage': 5},
-                {'id': 2, 'usage': 5}
-            ],
-            'start_time': time.time()
-        }
-    
-    # 在新线程中执行分析脚本
-    thread = threading.Thread(target=run_analysis_script)
-    thread.daemon = True
-    thread.start()
+    station_id = (request.get_json(silent=True) or {}).get('station') or request.args.get('station')
+    try:
+        if STATIONS is not None:
+            # 未指定工位时使用第一个工位
+            station_id = station_id or STATIONS[0].id
+            if get_station_supervisor().get(station_id) is None:
+                return jsonify({'error': f'未知工位: {station_id}'}), 404
+            job = submit_station_job(station_id)
+        else:
+            job = job_queue.submit()
+    except QueueFullError as e:
+        # 背压：队列已满时让调用方稍后重试，而不是无限排队
+        response = jsonify({'error': str(e), **job_queue.stats()})
+        response.headers['Retry-After'] = '5'
+        return response, 429
     
-    return jsonify({'status': 'started'})
+    return jsonify({'status': 'started', 'job_id': job.id, 'queue': job_queue.stats()}), 202
+
+@app.route('/api/stations')
+def list_stations():
+    """各工位的进程状态、实时重量、排队任务数和吞吐量（每分钟完成数）"""
+    supervisor = get_station_supervisor()
+    if supervisor is None:
+        return jsonify({'mode': 'single', 'stations': []})
+    queued = job_queue.queued_by_station()
+    stations = [{**status, 'queued': queued.get(status['id'], 0)} for status in supervisor.status()]
+    return jsonify({'mode': 'multi', 'stations': stations, 'queue': job_queue.stats()})
+
+@app.route('/api/jobs')
+def list_jobs():
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({
+        'jobs': [job.to_dict(include_result=False) for job in job_queue.list(limit)],
+        'queue': job_queue.stats()
+    })
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/result')
+def get_job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is not None and job.result is not None:
+        return jsonify(job.result)
+    if job is not None and job.status == 'error':
+        return jsonify({'error': job.message, 'status': job.status}), 500
+    # 任务已从内存淘汰时读取结果文件
+    result_file = os.path.join(DATA_DIR, 'results', f'{os.path.basename(job_id)}.json')
+    if not os.path.exists(result_file):
+        if job is not None:
+            return jsonify({'error': '任务尚未完成', 'status': job.status}), 409
+        return jsonify({'error': '结果文件不存在'}), 404
+    with open(result_file, 'r', encoding='utf-8') as f:
+        return jsonify(json.load(f))
 
 def run_analysis_script():
-    global current_analysis
-    try:
-        # 执行分析脚本
-        result = subprocess.run([SCRIPT_PATH], 
+    """后备模式：执行分析脚本，返回结果，失败时抛出异常"""
+    # 执行分析脚本
+    process = subprocess.Popen([SCRIPT_PATH], 
                                stdout=subprocess.PIPE, 
                                stderr=subprocess.PIPE,
                                text=True)
-        
-        if result.returncode != 0:
-            with analysis_lock:
-                current_analysis['status'] = 'error'
-                current_analysis['message'] = f'脚本执行失败: {result.stderr}'
-            return
-        
-        # 检查结果文件是否生成
-        result_file = os.path.join(DATA_DIR, 'nutrition_result.json')
-        if not os.path.exists(result_file):
-            with analysis_lock:
-                current_analysis['status'] = 'error'
-                current_analysis['message'] = '分析结果文件未生成'
-            return
-            
-        with analysis_lock:
-            current_analysis['status'] = 'completed'
-            current_analysis['message'] = '分析完成'
-            
-    except Exception as e:
-        with analysis_lock:
-            current_analysis['status'] = 'error'
-            current_analysis['message'] = f'执行异常: {str(e)}'
+    sampler.register_process('analysis_script', process.pid)
+    try:
+        _, stderr = process.communicate()
+    finally:
+        sampler.unregister('analysis_script')
+    
+    if process.returncode != 0:
+        raise RuntimeError(f'脚本执行失败: {stderr}')
+    
+    # 检查结果文件是否生成（脚本在当前目录输出，连同阶段耗时记录移动到数据目录）
+    result_file = os.path.join(DATA_DIR, 'nutrition_result.json')
+    for name in ('nutrition_result.json', 'nutrition_result.trace.json'):
+        if os.path.exists(name):
+            os.makedirs(DATA_DIR, exist_ok=True)
+            os.replace(name, os.path.join(DATA_DIR, name))
+    if not os.path.exists(result_file):
+        raise RuntimeError('分析结果文件未生成')
+    
+    with open(result_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
 
 @app.route('/api/status')
 def get_status():
+    sampler.start()
+    # CPU数据由后台采样器定期采集，这里只读内存中的最新样本
+    sample = sampler.latest()
     with analysis_lock:
-        # 随机更新CPU使用率，模拟变化
-        if current_analysis['status'] == 'running':
-            import random
-            current_analysis['cpu_usage'] = [
-                {'id': 0, 'usage': random.randint(60, 95)},  # 主核负载高
-                {'id': 1, 'usage': random.randint(30, 70)},  # 摄像头程序
-                {'id': 2, 'usage': random.randint(20, 50)}   # 称重程序
-            ]
-        return jsonify(current_analysis)
+        if sample is not None:
+            current_analysis['cpu_usage'] = sample['cores']
+            current_analysis['processes'] = sample['processes']
+        return jsonify({**current_analysis, 'queue': job_queue.stats()})
+
+@app.route('/api/events')
+def stream_events():
+    """SSE 推送：任务状态、阶段进度、重量、CPU采样和分析结果，按间隔合并发送"""
+    sampler.start()
+    subscription = event_bus.subscribe()
+    if subscription is None:
+        response = jsonify({'error': '事件连接数已达上限，请改用轮询接口'})
+        response.headers['Retry-After'] = '10'
+        return response, 503
+
+    def generate():
+        try:
+            yield from subscription.stream()
+        finally:
+            # 客户端断开时生成器被关闭，释放订阅
+            event_bus.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/telemetry')
+def get_telemetry():
+    """CPU采样历史窗口（每个核心与各流水线进程）"""
+    sampler.start()
+    return jsonify({'interval': sampler.interval, 'samples': sampler.history()})
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus 文本格式的阶段耗时分位数、失败次数与任务队列状态"""
+    stats = job_queue.stats()
+    lines = [registry.render_prometheus().rstrip('\n')]
+    lines.append('# TYPE food_jobs_running gauge')
+    lines.append(f"food_jobs_running {stats['running']}")
+    lines.append('# TYPE food_jobs_queued gauge')
+    lines.append(f"food_jobs_queued {stats['queued']}")
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/results')
 def get_results():
@@ -113,6 +348,107 @@ def get_results():
     except Exception as e:
         return jsonify({'error': f'读取结果失败: {str(e)}'}), 500
 
+@app.route('/api/history', methods=['GET'])
+def get_history():
+    """分页查询历史记录，按时间倒序；用返回的 next 作为 cursor 取下一页"""
+    page = get_history_store().page(
+        limit=request.args.get('limit', 50, type=int),
+        cursor=request.args.get('cursor'),
+        food=request.args.get('food'),
+        query=request.args.get('q'),
+        since=request.args.get('since', type=float),
+        until=request.args.get('until', type=float)
+    )
+    return jsonify(page)
+
+@app.route('/api/history', methods=['DELETE'])
+def clear_history():
+    return jsonify({'deleted': get_history_store().clear()})
+
+@app.route('/api/history/aggregate')
+def get_history_aggregate():
+    """按日期（group=day）或食物（group=food）汇总摄入量"""
+    group = request.args.get('group', 'day')
+    if group not in ('day', 'food'):
+        return jsonify({'error': 'group 只能为 day 或 food'}), 400
+    groups = get_history_store().aggregate(
+        group=group,
+        since=request.args.get('since', type=float),
+        until=request.args.get('until', type=float),
+        limit=request.args.get('limit', 100, type=int)
+    )
+    return jsonify({'group': group, 'groups': groups})
+
+@app.route('/api/history/export')
+def export_history():
+    """以 NDJSON 流式导出全部历史记录，每行一条"""
+    rows = get_history_store().export_ndjson(
+        since=request.args.get('since', type=float),
+        until=request.args.get('until', type=float)
+    )
+    filename = f"nutrition_history_{time.strftime('%Y-%m-%d')}.ndjson"
+    return Response(rows, mimetype='application/x-ndjson', headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
+
+@app.route('/api/cache')
+def get_cache_stats():
+    """结果缓存的命中/未命中统计"""
+    if ANALYSIS_MODE == 'script' or analysis_worker is None or analysis_worker.cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **analysis_worker.cache.stats()})
+
+@app.route('/api/camera/latest')
+def get_latest_frame():
+    """
+    直接从常驻摄像头的环形缓冲区返回最新一帧（JPEG）。
+
+    脚本模式和多工位模式下本进程没有打开摄像头（多工位时摄像头由各工位进程持有），返回404；
+    503 只表示本地摄像头暂时没有画面。
+    """
+    if ANALYSIS_MODE == 'script':
+        return jsonify({'error': '脚本模式下没有常驻摄像头'}), 404
+    if STATIONS is not None:
+        return jsonify({'error': '多工位模式下服务器没有本地摄像头，画面由各工位进程采集'}), 404
+    frame = get_analysis_worker().camera.latest_frame(timeout=0.5)
+    if frame is None:
+        return jsonify({'error': '摄像头暂无可用画面'}), 503
+    # 缓冲区中保存的就是摄像头输出的 JPEG，直接返回
+    return Response(frame.jpeg, mimetype='image/jpeg')
+
+def serve_production():
+    """
+    关闭调试，使用多线程 WSGI 服务器（优先 waitress，未安装时使用 Werkzeug 的多线程服务器）。
+
+    摄像头、秤和 SSE 事件总线都在本进程内，不能使用多进程（prefork）模型，
+    否则每个进程都会去打开同一个摄像头，事件也只能推送给同一进程的订阅者。
+    """
+    try:
+        from waitress import serve
+    except ImportError:
+        serve = None
+    # SSE 连接数必须少于线程数，否则打开的页面会占满线程，其余请求全部阻塞；超出的页面改用轮询
+    event_bus.max_subscribers = max(1, SERVER_THREADS - SERVER_RESERVED_THREADS)
+    print(f"生产模式: http://{SERVER_HOST}:{SERVER_PORT}，{SERVER_THREADS} 个工作线程"
+          f"（最多 {event_bus.max_subscribers} 个事件连接）")
+    if serve is not None:
+        serve(app, host=SERVER_HOST, port=SERVER_PORT, threads=SERVER_THREADS, ident='food-analyzer')
+    else:
+        print("警告：未安装 waitress，使用 Werkzeug 多线程服务器")
+        app.run(host=SERVER_HOST, port=SERVER_PORT, debug=False, threaded=True, use_reloader=False)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    sampler.register_process('server', os.getpid())
+    sampler.start()
+    static_assets.build()
+    if ANALYSIS_MODE != 'script':
+        # 启动时预热，首次分析无需等待摄像头和模板加载
+        threading.Thread(target=get_analysis_worker, daemon=True).start()
+        if STATIONS is not None:
+            get_station_supervisor()
+    if SERVER_MODE == 'production':
+        serve_production()
+    else:
+        # 常驻工作器持有摄像头，不能启用会重复启动进程的自动重载
+        app.run(host=SERVER_HOST, port=SERVER_PORT, debug=True, use_reloader=ANALYSIS_MODE == 'script')
 
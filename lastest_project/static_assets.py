@@ -0,0 +1,122 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from typing import Dict, NamedTuple, Optional
+
+from flask import Request, Response
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只提供 gzip 压缩版本
+    brotli = None
+
+# 作为静态文件对外提供的扩展名，其余文件（源码、配置、数据）不经静态路由访问
+STATIC_EXTENSIONS = {".html", ".css", ".js", ".svg", ".ico", ".png", ".jpg", ".jpeg", ".webp"}
+# 文本类文件才预压缩，图片本身已压缩
+COMPRESSIBLE_EXTENSIONS = {".html", ".css", ".js", ".svg"}
+# 小于该大小的文件压缩收益不抵响应头开销
+MIN_COMPRESS_SIZE = 512
+
+
+class StaticAsset(NamedTuple):
+    """一个静态文件及其预压缩版本"""
+    path: str
+    mimetype: str
+    etag: str
+    mtime: float
+    size: int
+    body: bytes
+    encoded: Dict[str, bytes]  # 编码名（gzip / br）-> 压缩后的内容，只保留比原文件小的版本
+
+
+def build_asset(path: str) -> StaticAsset:
+    """读取文件，计算内容哈希并生成压缩版本"""
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        body = f.read()
+    extension = os.path.splitext(path)[1].lower()
+    encoded: Dict[str, bytes] = {}
+    if extension in COMPRESSIBLE_EXTENSIONS and len(body) >= MIN_COMPRESS_SIZE:
+        # 启动时一次性用最高压缩级别，之后每次请求都不再消耗CPU
+        candidates = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            candidates["br"] = brotli.compress(body, quality=11)
+        encoded = {name: data for name, data in candidates.items() if len(data) < len(body)}
+    return StaticAsset(
+        path=path,
+        mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream",
+        etag=hashlib.sha256(body).hexdigest()[:20],
+        mtime=stat.st_mtime,
+        size=stat.st_size,
+        body=body,
+        encoded=encoded
+    )
+
+
+class StaticAssets:
+    """
+    内存中的静态文件表。
+
+    启动时扫描目录并预压缩；每次请求只 stat 一次文件，内容变化时才重新生成。
+    缓存策略只依靠 ETag / Last-Modified 验证：响应均为 no-cache，浏览器重复访问时得到 304 而不是整个文件。
+    """
+
+    def __init__(self, root: str = "."):
+        self.root = os.path.abspath(root)
+        self._assets: Dict[str, StaticAsset] = {}
+        self._lock = threading.Lock()
+
+    def build(self) -> "StaticAssets":
+        """预先生成目录下所有静态文件（不含子目录）"""
+        for name in sorted(os.listdir(self.root)):
+            if os.path.splitext(name)[1].lower() in STATIC_EXTENSIONS and os.path.isfile(self._path(name)):
+                self.get(name)
+        saved = sum(asset.size - min(map(len, asset.encoded.values()), default=asset.size)
+                    for asset in self._assets.values())
+        encodings = "gzip/br" if brotli is not None else "gzip"
+        print(f"已加载 {len(self._assets)} 个静态文件（{encodings} 预压缩，最多节省 {saved / 1024:.1f} KB/次）")
+        return self
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def get(self, name: str) -> Optional[StaticAsset]:
+        """文件不存在或不是静态文件时返回None"""
+        if "/" in name or "\\" in name or os.path.splitext(name)[1].lower() not in STATIC_EXTENSIONS:
+            return None
+        path = self._path(name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._assets.pop(name, None)
+            return None
+        asset = self._assets.get(name)
+        if asset is None or asset.mtime != stat.st_mtime or asset.size != stat.st_size:
+            asset = build_asset(path)
+            with self._lock:
+                self._assets[name] = asset
+        return asset
+
+    def response(self, name: str, request: Request) -> Optional[Response]:
+        """按请求的 Accept-Encoding 和条件请求头生成响应，文件不存在时返回None"""
+        asset = self.get(name)
+        if asset is None:
+            return None
+        encoding = request.accept_encodings.best_match([option for option in ("br", "gzip") if option in asset.encoded])
+        body = asset.encoded[encoding] if encoding else asset.body
+
+        response = Response(body, mimetype=asset.mimetype)
+        if encoding:
+            response.content_encoding = encoding
+        if asset.encoded:
+            response.vary.add("Accept-Encoding")
+        # 不同编码是不同的字节内容，ETag 需要区分
+        response.set_etag(f"{asset.etag}-{encoding}" if encoding else asset.etag)
+        response.last_modified = int(asset.mtime)
+        # 地址中没有内容哈希，不能长期缓存：每次都验证，未变化时只是一次不带内容的 304，部署后立即生效
+        response.cache_control.no_cache = True
+        # If-None-Match / If-Modified-Since 命中时改为 304 并去掉响应体
+        return response.make_conditional(request)
@@ -0,0 +1,465 @@
+"""
+多工位模式：一台主机驱动多组 摄像头 + 秤。
+
+每个工位（摄像头设备、HX711 引脚、标定系数、CPU 核心）运行在独立的进程中，
+负责本工位的取帧、称重和稳定检测；采集到的图像和重量交回主进程，
+由所有工位共用的分析任务队列（按工位轮流调度）调用API。
+
+工位配置文件为 stations.json（路径可由 FOOD_STATIONS 指定），格式见 stations.example.json；
+文件不存在时为单工位模式，行为与之前相同。
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from multiprocessing.connection import Connection
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import launcher
+
+STATIONS_FILE = os.environ.get("FOOD_STATIONS", "stations.json")
+# 吞吐量统计的时间窗口（秒）
+THROUGHPUT_WINDOW = 600
+# 工位进程异常退出后重启的最长等待（秒），连续失败时按指数退避
+MAX_RESTART_DELAY = 30.0
+# 工位进程持续运行超过该时间后，退避计数清零
+STABLE_RUN_SECONDS = 60.0
+
+_STATION_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class Station(NamedTuple):
+    """一个称重工位的硬件配置"""
+    id: str
+    name: str
+    camera: Union[int, str] = 0
+    sck_pin: int = 17
+    dout_pin: int = 18
+    scale_factor: float = 106.5
+    cores: Tuple[int, ...] = ()
+
+    @property
+    def socket_path(self) -> str:
+        return f"/tmp/food_scale_{self.id}.sock"
+
+    def work_dir(self, data_dir: str) -> str:
+        """工位的工作目录：零点文件和单次称重的 weight_data.txt 写在这里，互不覆盖"""
+        return os.path.join(os.path.abspath(data_dir), "stations", self.id)
+
+    def weight_command(self) -> List[str]:
+        # 称重程序绑定到工位核心中的最后一个，-1 表示不绑定
+        cpu = self.cores[-1] if self.cores else -1
+        return [os.path.abspath(launcher.WEIGHT_SENSOR_BINARY), "--sck", str(self.sck_pin),
+                "--dout", str(self.dout_pin), "--scale", str(self.scale_factor), "--cpu", str(cpu)]
+
+    def to_dict(self) -> Dict:
+        data = self._asdict()
+        data["cores"] = list(self.cores)
+        return data
+
+
+class Acquisition(NamedTuple):
+    """工位进程采集的一次数据，经管道传回主进程"""
+    station: str
+    jpeg: bytes
+    timestamp: float
+    weight: float
+    spans: Tuple[Tuple[str, float, float], ...]  # (阶段名, 开始, 结束)，time.monotonic()
+
+
+def load_stations(path: str = STATIONS_FILE) -> List[Station]:
+    """读取工位配置，格式错误时抛出 ValueError"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    entries = data.get("stations") if isinstance(data, dict) else data
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path} 中没有工位配置")
+
+    stations = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"第 {index + 1} 个工位配置不是对象")
+        station_id = str(entry.get("id", f"station{index + 1}"))
+        if not _STATION_ID.match(station_id):
+            raise ValueError(f"工位ID只能包含字母、数字、下划线和减号: {station_id}")
+        try:
+            station = Station(
+                id=station_id,
+                name=str(entry.get("name", station_id)),
+                camera=entry.get("camera", 0),
+                sck_pin=int(entry.get("sck_pin", 17)),
+                dout_pin=int(entry.get("dout_pin", 18)),
+                scale_factor=float(entry.get("scale_factor", 106.5)),
+                cores=tuple(int(core) for core in entry.get("cores", ()))
+            )
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"工位 {station_id} 配置错误: {e}")
+        if station.scale_factor == 0:
+            raise ValueError(f"工位 {station_id} 的标定系数不能为0")
+        stations.append(station)
+
+    ids = [station.id for station in stations]
+    if len(set(ids)) != len(ids):
+        raise ValueError("工位ID重复")
+    pins = [pin for station in stations for pin in (station.sck_pin, station.dout_pin)]
+    if len(set(pins)) != len(pins):
+        raise ValueError("不同工位使用了相同的GPIO引脚")
+    return stations
+
+
+def _weigh_once(station: Station, work_dir: str, timeout: float) -> float:
+    """常驻称重程序不可用时，运行一次称重程序并读取工位目录中的重量"""
+    weight_file = os.path.join(work_dir, "weight_data.txt")
+    if os.path.exists(weight_file):
+        os.remove(weight_file)
+    result = subprocess.run(station.weight_command(), cwd=work_dir, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"称重程序执行失败: {result.stderr.strip()}")
+    with open(weight_file, "r") as f:
+        return float(f.read().strip())
+
+
+def _acquire(station: Station, camera, scale, work_dir: str, timeout: float) -> Acquisition:
+    """等待读数稳定后拍照，与单工位常驻称重时的顺序相同"""
+    spans = []
+    start = time.monotonic()
+    if scale is not None and scale.connected:
+        reading = scale.wait_for_settled(timeout)
+        if reading is None:
+            raise RuntimeError("秤上没有物体或读数一直不稳定")
+        weight = reading.weight
+    else:
+        weight = _weigh_once(station, work_dir, timeout)
+    spans.append(("weigh", start, time.monotonic()))
+
+    start = time.monotonic()
+    if not camera.start():
+        raise RuntimeError(f"摄像头 {station.camera} 不可用")
+    frame = camera.best_frame()
+    if frame is None:
+        raise RuntimeError("未能获取图像数据")
+    spans.append(("capture", start, time.monotonic()))
+    return Acquisition(station.id, frame.jpeg, frame.timestamp, round(weight, 2), tuple(spans))
+
+
+def station_main(station: Station, data_dir: str, requests: Connection, results: Connection):
+    """
+    工位进程入口：打开本工位的摄像头和秤，按主进程的请求采集数据。
+
+    requests 中的消息为 ("acquire", 请求ID, 超时) 或 None（退出）；
+    results 中依次发回 ("ready", 信息)、("scale", 读数)、("acquired", 请求ID, Acquisition)、
+    ("error", 请求ID, 错误信息)。
+    """
+    # 摄像头相关模块只在工位进程中导入
+    import camera_capture
+    from scale_client import ScaleClient, start_daemon
+
+    send_lock = threading.Lock()
+
+    def send(message):
+        # 秤读数在接收线程中发送，采集结果在主线程中发送
+        with send_lock:
+            results.send(message)
+
+    work_dir = station.work_dir(data_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    camera = camera_capture.CameraService(
+        opener=lambda: camera_capture.open_camera(device=station.camera))
+    camera_ok = camera.start()
+
+    scale = ScaleClient(station.socket_path)
+    daemon = None
+    if not scale.start():
+        daemon = start_daemon(station.weight_command(), station.socket_path, cwd=work_dir)
+        if daemon is None or not scale.start():
+            print(f"工位 {station.id}：常驻称重程序不可用，将在每次采集时单独称重")
+            scale = None
+    if scale is not None:
+        scale.add_listener(lambda reading: send(("scale", reading._asdict())))
+
+    send(("ready", {"pid": os.getpid(), "camera": camera_ok, "scale_daemon": scale is not None}))
+    try:
+        while True:
+            try:
+                message = requests.recv()
+            except EOFError:
+                break  # 主进程已退出
+            if message is None:
+                break
+            _, request_id, timeout = message
+            try:
+                send(("acquired", request_id, _acquire(station, camera, scale, work_dir, timeout)))
+            except Exception as e:
+                send(("error", request_id, str(e)))
+    finally:
+        camera.stop()
+        if scale is not None:
+            scale.close()
+        if daemon is not None:
+            daemon.terminate()
+            daemon.wait()
+
+
+AcquireCallback = Callable[[Optional[Acquisition], Optional[str]], None]
+
+
+class StationHandle:
+    """主进程中一个工位进程的状态"""
+
+    def __init__(self, station: Station):
+        self.station = station
+        self.state = "stopped"  # starting, running, restarting, stopped
+        self.process: Optional[subprocess.Popen] = None
+        self.requests: Optional[Connection] = None
+        self.send_lock = threading.Lock()
+        self.pid: Optional[int] = None
+        self.started: Optional[float] = None
+        self.restarts = 0
+        self.failures = 0  # 连续的异常退出次数，用于退避
+        self.last_error: Optional[str] = None
+        self.info: Dict = {}
+        self.latest_reading: Optional[Dict] = None
+        self.completed = 0
+        self.errors = 0
+        self.finished = deque()  # 最近完成分析的时刻，用于计算吞吐量
+        self.pending: Dict[str, Tuple[AcquireCallback, float]] = {}
+
+    def throughput(self, now: float) -> float:
+        """最近 THROUGHPUT_WINDOW 秒内每分钟完成的分析数"""
+        while self.finished and now - self.finished[0] > THROUGHPUT_WINDOW:
+            self.finished.popleft()
+        return round(len(self.finished) * 60.0 / THROUGHPUT_WINDOW, 2)
+
+    def to_dict(self, now: float) -> Dict:
+        return {
+            **self.station.to_dict(),
+            "state": self.state,
+            "pid": self.pid,
+            "uptime": round(time.time() - self.started, 1) if self.started and self.state == "running" else None,
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+            "camera_ok": self.info.get("camera"),
+            "scale_daemon": self.info.get("scale_daemon"),
+            "reading": self.latest_reading,
+            "acquiring": len(self.pending),
+            "completed": self.completed,
+            "errors": self.errors,
+            "throughput_per_min": self.throughput(now)
+        }
+
+
+class StationSupervisor:
+    """
+    工位进程的监管者。
+
+    每个工位一个独立的 Python 进程（不继承服务器的线程和设备句柄，启动前绑定工位核心），
+    经标准输入输出管道收发消息；进程退出时管道关闭，等待中的采集请求立即失败，并按指数退避重启。
+    """
+
+    def __init__(self, stations: List[Station], data_dir: str = "data",
+                 on_reading: Optional[Callable[[str, Dict], None]] = None):
+        """
+        :param on_reading: 收到工位秤读数时调用 on_reading(工位ID, 读数)，在接收线程中执行
+        """
+        self.data_dir = data_dir
+        self.on_reading = on_reading
+        self.handles: Dict[str, StationHandle] = {station.id: StationHandle(station) for station in stations}
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def start(self):
+        """编译称重程序并启动全部工位进程"""
+        try:
+            launcher.build_weight_sensor()
+        except (launcher.BuildError, OSError) as e:
+            # 工位进程照常启动（摄像头可用），称重失败会在每次采集时报告
+            print(f"警告：{e}")
+        for handle in self.handles.values():
+            self._spawn(handle)
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            handles = list(self.handles.values())
+        for handle in handles:
+            if handle.process is not None and handle.process.poll() is None:
+                self._send(handle, None)
+                try:
+                    handle.process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    handle.process.terminate()
+
+    def get(self, station_id: str) -> Optional[StationHandle]:
+        return self.handles.get(station_id)
+
+    def _spawn(self, handle: StationHandle):
+        station = handle.station
+        cores = set(station.cores) & os.sched_getaffinity(0)
+        # 与启动器相同：在 exec 之前绑定核心
+        preexec = (lambda: os.sched_setaffinity(0, cores)) if cores else None
+        with self._lock:
+            if self._stopping:
+                return
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--station", json.dumps(station.to_dict()),
+                 "--data-dir", self.data_dir],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, preexec_fn=preexec)
+            handle.process = process
+            handle.requests = Connection(os.dup(process.stdin.fileno()), readable=False)
+            process.stdin.close()
+            handle.pid = process.pid
+            handle.started = time.time()
+            handle.state = "starting"
+        results = Connection(os.dup(process.stdout.fileno()), writable=False)
+        process.stdout.close()
+        print(f"工位 {station.id} 进程已启动 (pid {process.pid})")
+        threading.Thread(target=self._receive_loop, args=(handle, process, results),
+                         name=f"station-{station.id}-results", daemon=True).start()
+
+    @staticmethod
+    def _send(handle: StationHandle, message) -> bool:
+        with handle.send_lock:
+            try:
+                handle.requests.send(message)
+                return True
+            except OSError:
+                return False  # 进程已退出，由接收线程处理
+
+    def _receive_loop(self, handle: StationHandle, process: subprocess.Popen, results: Connection):
+        try:
+            while True:
+                if not results.poll(1.0):
+                    self._expire_requests(handle)
+                    continue
+                self._handle_message(handle, results.recv())
+        except (EOFError, OSError):
+            pass  # 管道关闭：工位进程已退出
+        finally:
+            results.close()
+        process.wait()
+        handle.requests.close()
+        self._on_exit(handle, process)
+
+    def _handle_message(self, handle: StationHandle, message):
+        kind = message[0]
+        if kind == "scale":
+            handle.latest_reading = message[1]
+            if self.on_reading is not None:
+                try:
+                    self.on_reading(handle.station.id, message[1])
+                except Exception as e:
+                    print(f"工位读数回调异常: {e}")
+            return
+        if kind == "ready":
+            with self._lock:
+                handle.state = "running"
+                handle.info = message[1]
+            return
+        _, request_id, value = message
+        with self._lock:
+            callback, _ = handle.pending.pop(request_id, (None, 0))
+        if callback is not None:
+            if kind == "acquired":
+                callback(value, None)
+            else:
+                callback(None, value)
+
+    def _expire_requests(self, handle: StationHandle):
+        """工位进程卡住时，超过期限的采集请求直接失败，任务不会一直停在“等待采集”"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [request_id for request_id, (_, deadline) in handle.pending.items() if now > deadline]
+            callbacks = [handle.pending.pop(request_id)[0] for request_id in expired]
+        for callback in callbacks:
+            callback(None, "工位采集超时")
+
+    def _on_exit(self, handle: StationHandle, process):
+        with self._lock:
+            callbacks = [callback for callback, _ in handle.pending.values()]
+            handle.pending = {}
+            if self._stopping:
+                handle.state = "stopped"
+                delay = None
+            else:
+                if handle.started and time.time() - handle.started > STABLE_RUN_SECONDS:
+                    handle.failures = 0
+                handle.failures += 1
+                handle.restarts += 1
+                handle.state = "restarting"
+                handle.last_error = f"工位进程退出，返回码 {process.returncode}"
+                delay = min(MAX_RESTART_DELAY, 2.0 ** (handle.failures - 1))
+        for callback in callbacks:
+            callback(None, "工位进程异常退出")
+        if delay is not None:
+            print(f"{handle.last_error}，{delay:.0f} 秒后重启")
+            timer = threading.Timer(delay, self._spawn, args=(handle,))
+            timer.daemon = True
+            timer.start()
+
+    def acquire(self, station_id: str, callback: AcquireCallback, timeout: float = 30.0):
+        """
+        请求工位采集一次数据（异步），完成后调用 callback(Acquisition, None)，失败时 callback(None, 错误信息)。
+
+        同一工位的请求在工位进程中依次执行，不同工位并行。
+        """
+        handle = self.handles[station_id]
+        request_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            alive = handle.state in ("starting", "running")
+            if alive:
+                # 同一工位的请求排队执行，期限按排在前面的请求数延长
+                deadline = time.monotonic() + timeout * (len(handle.pending) + 1) + 5
+                handle.pending[request_id] = (callback, deadline)
+        if not alive:
+            callback(None, f"工位 {station_id} 未运行（{handle.state}）")
+        elif not self._send(handle, ("acquire", request_id, timeout)):
+            with self._lock:
+                handle.pending.pop(request_id, None)
+            callback(None, f"工位 {station_id} 进程已退出")
+
+    def record_result(self, station_id: str, ok: bool):
+        """记录工位一次分析的结果，用于统计吞吐量"""
+        handle = self.handles.get(station_id)
+        if handle is None:
+            return
+        with self._lock:
+            if ok:
+                handle.completed += 1
+                handle.finished.append(time.time())
+            else:
+                handle.errors += 1
+
+    def status(self) -> List[Dict]:
+        now = time.time()
+        with self._lock:
+            return [handle.to_dict(now) for handle in self.handles.values()]
+
+
+def main():
+    """工位进程：由 StationSupervisor 启动，标准输入接收请求，标准输出发回结果"""
+    parser = argparse.ArgumentParser(description="称重工位进程")
+    parser.add_argument("--station", required=True, help="工位配置（JSON）")
+    parser.add_argument("--data-dir", default="data")
+    args = parser.parse_args()
+    config = json.loads(args.station)
+    config["cores"] = tuple(config.get("cores", ()))
+    station = Station(**config)
+
+    requests = Connection(os.dup(0), writable=False)
+    results = Connection(os.dup(1), readable=False)
+    # 标准输出已用作消息管道，打印的日志改写到标准错误
+    os.dup2(2, 1)
+    station_main(station, args.data_dir, requests, results)
+
+
+if __name__ == "__main__":
+    # 以模块名导入，发回的 Acquisition 在主进程中才能按 stations.Acquisition 还原
+    import stations
+    stations.main()
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 每秒时钟滴答数，/proc/<pid>/stat 中的 utime/stime 以此为单位
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def read_cpu_times() -> Dict[int, Tuple[int, int]]:
+    """读取 /proc/stat，返回 {核心号: (总时间, 空闲时间)}"""
+    times = {}
+    with open("/proc/stat", "r") as f:
+        for line in f:
+            if not line.startswith("cpu") or line.startswith("cpu "):
+                continue
+            parts = line.split()
+            values = [int(v) for v in parts[1:]]
+            idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+            # guest 时间已计入 user，不重复累加
+            times[int(parts[0][3:])] = (sum(values[:8]), idle)
+    return times
+
+
+def read_task_stat(path: str) -> Optional[Tuple[int, int]]:
+    """读取 /proc/<pid>/stat 或 /proc/<pid>/task/<tid>/stat，返回 (utime+stime, 最近运行的核心)"""
+    try:
+        with open(path, "r") as f:
+            data = f.read()
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return None
+    # 进程名可能含空格和括号，从最后一个 ')' 之后开始切分
+    fields = data[data.rindex(")") + 2:].split()
+    # fields[0] 对应第3个字段 state；utime/stime 为第14/15个，processor 为第39个
+    return int(fields[11]) + int(fields[12]), int(fields[36])
+
+
+class CpuSampler:
+    """
+    后台CPU采样器。
+
+    固定间隔读取 /proc/stat 和已登记进程/线程的 stat，计算每个核心和每个流水线进程的占用率，
+    结果保存在定长历史窗口中，接口直接从内存返回，不在请求路径上读 /proc。
+    """
+
+    def __init__(self, interval: float = 1.0, history: int = 60):
+        self.interval = interval
+        self._history = deque(maxlen=history)
+        self._tasks: Dict[str, str] = {}  # 名称 -> stat 文件路径
+        self._lock = threading.Lock()
+        self._thread = None
+        self._listeners: List[Callable[[Dict], None]] = []
+
+    def register_process(self, name: str, pid: int):
+        """登记一个需要统计的进程（如称重程序）"""
+        with self._lock:
+            self._tasks[name] = f"/proc/{pid}/stat"
+
+    def register_thread(self, name: str, tid: Optional[int] = None):
+        """登记本进程内的一个线程（如摄像头取帧线程），默认为调用线程"""
+        tid = tid or threading.get_native_id()
+        with self._lock:
+            self._tasks[name] = f"/proc/{os.getpid()}/task/{tid}/stat"
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._tasks.pop(name, None)
+
+    def add_listener(self, callback: Callable[[Dict], None]):
+        """登记采样回调，每产生一个新样本调用一次（在采样线程中执行）"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._sample_loop, name="cpu-sampler", daemon=True)
+            self._thread.start()
+
+    def _sample_loop(self):
+        last_cpu = read_cpu_times()
+        last_tasks: Dict[str, Tuple[str, int]] = {}
+        last_time = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            elapsed = now - last_time
+            cpu = read_cpu_times()
+
+            cores = []
+            for core_id in sorted(cpu):
+                total, idle = cpu[core_id]
+                prev_total, prev_idle = last_cpu.get(core_id, (total, idle))
+                delta = total - prev_total
+                usage = 100.0 * (1 - (idle - prev_idle) / delta) if delta > 0 else 0.0
+                cores.append({"id": core_id, "usage": round(max(0.0, min(100.0, usage)), 1)})
+
+            with self._lock:
+                tasks = dict(self._tasks)
+            processes = {}
+            current = {}
+            for name, path in tasks.items():
+                stat = read_task_stat(path)
+                if stat is None:
+                    continue
+                ticks, core = stat
+                current[name] = (path, ticks)
+                prev = last_tasks.get(name)
+                if prev is not None and prev[0] == path:
+                    usage = 100.0 * (ticks - prev[1]) / CLK_TCK / elapsed
+                    processes[name] = {"usage": round(usage, 1), "core": core}
+
+            sample = {"time": time.time(), "cores": cores, "processes": processes}
+            with self._lock:
+                self._history.append(sample)
+                listeners = list(self._listeners)
+            for callback in listeners:
+                try:
+                    callback(sample)
+                except Exception as e:
+                    print(f"CPU采样回调异常: {e}")
+
+            last_cpu, last_tasks, last_time = cpu, current, now
+
+    def latest(self) -> Optional[Dict]:
+        with self._lock:
+            return self._history[-1] if self._history else None
+
+    def history(self) -> List[Dict]:
+        with self._lock:
+            return list(self._history)
+
+
+# 进程内共享的采样器
+sampler = CpuSampler()
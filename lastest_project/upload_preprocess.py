@@ -0,0 +1,108 @@
+import os
+from typing import NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from jpeg_utils import is_jpeg, jpeg_dimensions
+
+
+class UploadConfig(NamedTuple):
+    """上传前图像预处理参数"""
+    max_dimension: int = int(os.environ.get("UPLOAD_MAX_DIMENSION", "768"))   # 长边上限（像素）
+    jpeg_quality: int = int(os.environ.get("UPLOAD_JPEG_QUALITY", "80"))      # 初始 JPEG 质量
+    min_quality: int = int(os.environ.get("UPLOAD_MIN_QUALITY", "40"))        # 为满足字节预算可降到的最低质量
+    max_bytes: int = int(os.environ.get("UPLOAD_MAX_BYTES", str(150 * 1024)))  # 上传数据字节预算
+
+
+class PreparedImage(NamedTuple):
+    """预处理后的上传图像"""
+    data: bytes
+    mime: str
+    original_bytes: int
+    width: Optional[int]
+    height: Optional[int]
+    quality: Optional[int]  # None 表示原样上传
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_bytes - len(self.data)
+
+    def report(self) -> dict:
+        """本次上传的体积统计，写入分析结果便于调优"""
+        return {
+            "original_bytes": self.original_bytes,
+            "upload_bytes": len(self.data),
+            "saved_bytes": self.saved_bytes,
+            "width": self.width,
+            "height": self.height,
+            "quality": self.quality,
+            "mime": self.mime
+        }
+
+
+def detect_mime(data: bytes) -> str:
+    """根据文件头判断图像的 MIME 类型"""
+    if is_jpeg(data):
+        return "image/jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "application/octet-stream"
+
+
+def _decode_for_size(data: bytes, longest: int, max_dimension: int):
+    """解码图像；JPEG 需要大幅缩小时利用 DCT 缩放直接按 1/2、1/4 解码"""
+    buf = np.frombuffer(data, np.uint8)
+    if longest and is_jpeg(data):
+        for factor, flag in ((4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if longest // factor >= max_dimension:
+                return cv2.imdecode(buf, flag)
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+
+def prepare_upload_image(data: bytes, config: Optional[UploadConfig] = None) -> PreparedImage:
+    """
+    按配置缩放、压缩图像，使其满足长边上限和字节预算。
+
+    已满足条件的 JPEG 原样上传，不做任何解码。
+    """
+    config = config or UploadConfig()
+    mime = detect_mime(data)
+    dims = jpeg_dimensions(data) if mime == "image/jpeg" else None
+
+    if dims and max(dims) <= config.max_dimension and len(data) <= config.max_bytes:
+        return PreparedImage(data, mime, len(data), dims[0], dims[1], None)
+
+    image = _decode_for_size(data, max(dims) if dims else 0, config.max_dimension)
+    if image is None:
+        # 无法解码时原样上传，至少保证 MIME 类型正确
+        return PreparedImage(data, mime, len(data), None, None, None)
+
+    height, width = image.shape[:2]
+    scale = min(1.0, config.max_dimension / max(width, height))
+    quality = config.jpeg_quality
+    while True:
+        if scale < 1.0:
+            resized = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                                 interpolation=cv2.INTER_AREA)
+        else:
+            resized = image
+        ok, buf = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            return PreparedImage(data, mime, len(data), None, None, None)
+        encoded = buf.tobytes()
+        if len(encoded) <= config.max_bytes:
+            break
+        # 先降质量，降到下限后再缩小尺寸
+        if quality - 10 >= config.min_quality:
+            quality -= 10
+        elif max(resized.shape[:2]) > 160:
+            scale *= 0.75
+        else:
+            break
+
+    return PreparedImage(encoded, "image/jpeg", len(data), resized.shape[1], resized.shape[0], quality)